@@ -0,0 +1,84 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseBase
+from django.utils.deprecation import MiddlewareMixin
+
+from common import logger
+from common.local import get_request_id
+from elasticsearch_drf.instrumentation import start_request_stats, stop_request_stats, wrap_streaming_response
+from elasticsearch_drf.settings import api_settings
+
+
+class ESInstrumentationMiddleware(MiddlewareMixin):
+    """
+    汇总每个请求的ES请求统计, 写入 Server-Timing 响应头并记录日志, 同时支持同步和异步视图
+    流式响应的统计包含生成内容时的ES请求, 日志在内容结束时记录, 响应头只包含视图返回之前的ES请求
+    需配合 elasticsearch_drf.instrumentation 中的统计连接类使用, 中间件放在 CommonMiddleware 之后
+    """
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        stats, token = start_request_stats()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_request_stats(token)
+        return self.process_stats(request, response, stats)
+
+    async def __acall__(self, request):
+        stats, token = start_request_stats()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_request_stats(token)
+        # 与其他中间件相同, 在同步线程中读取请求链id
+        return await sync_to_async(self.process_stats)(request, response, stats)
+
+    def process_stats(self, request, response, stats):
+        if isinstance(response, HttpResponseBase) and response.streaming:
+            # 流式内容在返回响应之后才生成, 其中的ES请求同样计入, 内容结束或连接关闭时再记录日志;
+            # Server-Timing 只包含开始发送响应之前的ES请求
+            self.set_server_timing(response, stats)
+            wrap_streaming_response(response, stats, partial(self.log_stats, request, stats, get_request_id()))
+            return response
+
+        if isinstance(response, HttpResponseBase):
+            self.set_server_timing(response, stats)
+        self.log_stats(request, stats, get_request_id())
+        return response
+
+    @staticmethod
+    def set_server_timing(response, stats):
+        if stats.calls == 0:
+            return
+        response.headers["Server-Timing"] = 'es;dur=%.3f;desc="%d calls, %d bytes", es-took;dur=%d' % (
+            stats.duration,
+            stats.calls,
+            stats.size,
+            stats.took,
+        )
+
+    @staticmethod
+    def log_stats(request, stats, request_id):
+        """
+        :param request_id: 请求链id, 流式响应结束时可能已不在请求线程中, 由调用方事先取出
+        """
+        if stats.calls == 0:
+            return
+        message = "ES请求统计, 请求链id->%s, 请求URL->[%s]%s, 请求次数->%d, ES耗时->%dms, 客户端耗时->%.3fms, 响应大小->%d" % (
+            request_id,
+            request.method,
+            request.path,
+            stats.calls,
+            stats.took,
+            stats.duration,
+            stats.size,
+        )
+        extra = {"request_id": request_id, "path": request.path, "es": stats.to_dict()}
+        max_round_trips = api_settings.INSTRUMENTATION_MAX_ROUND_TRIPS
+        if max_round_trips is not None and stats.calls > max_round_trips:
+            logger.warning("%s, ES请求次数超过%d次" % (message, max_round_trips), extra=extra)
+        else:
+            logger.info(message, extra=extra)
@@ -1,16 +1,11 @@
+from django.utils.deprecation import MiddlewareMixin
+
 from common.handlers.exception import exception_handler
 from common.utils.django import resolve_request
 
 
-class ExceptionHandleMiddleware:
-    """统一异常处理"""
-
-    def __init__(self, get_response):
-        self.get_response = get_response
-
-    def __call__(self, request):
-        response = self.get_response(request)
-        return response
+class ExceptionHandleMiddleware(MiddlewareMixin):
+    """统一异常处理, 同时支持同步和异步视图"""
 
     def process_exception(self, request, exception):
         view_func, view_args, view_kwargs = resolve_request(request)
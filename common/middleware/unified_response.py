@@ -2,12 +2,14 @@ import json
 from collections import OrderedDict
 
 from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
 from rest_framework import status
 from rest_framework.response import Response
 
 from common import logger
 from common.local import get_request_id
 from common.response import UnifiedJsonResponse
+from elasticsearch_drf.cache import CachedJSONResponse
 
 
 def _format_response_data(data):
@@ -23,18 +25,25 @@ def _format_response_data(data):
     )
 
 
-class UnifiedResponseMiddleware:
-    """统一规范Json响应"""
+def _format_response_content(content):
+    """已序列化的JSON数据直接拼接到统一格式中, 不再解码和重新编码"""
+    envelope = json.dumps(_format_response_data(None))
+    # data为最后一个键, 去掉末尾的 null} 后拼接
+    return envelope[: -len("null}")].encode() + content + b"}"
 
-    def __init__(self, get_response):
-        self.get_response = get_response
 
-    def __call__(self, request):
-        response = self.get_response(request)
+class UnifiedResponseMiddleware(MiddlewareMixin):
+    """统一规范Json响应, 同时支持同步和异步视图"""
 
+    def process_response(self, request, response):
         if isinstance(response, UnifiedJsonResponse):
             return response
 
+        if isinstance(response, CachedJSONResponse):
+            response.content = _format_response_content(response.content)
+            response.status_code = status.HTTP_200_OK
+            return response
+
         if isinstance(response, JsonResponse):
             try:
                 data = json.loads(response.content)
@@ -0,0 +1,49 @@
+"""
+异步ES连接管理, 用法与 elasticsearch_dsl.connections 一致, 连接为 AsyncElasticsearch(依赖aiohttp)
+
+未单独配置的别名沿用 elasticsearch_dsl 中同名别名的连接参数, 例如：
+
+from elasticsearch_dsl.connections import connections
+connections.configure(default={"hosts": "localhost"})
+
+from elasticsearch_drf.aio.connections import get_connection
+es = get_connection()  # AsyncElasticsearch(hosts="localhost")
+"""
+from elasticsearch import AIOHttpConnection, AsyncElasticsearch
+from elasticsearch_dsl.connections import Connections
+from elasticsearch_dsl.connections import connections as sync_connections
+from elasticsearch_dsl.serializer import serializer
+
+from elasticsearch_drf.instrumentation import AsyncInstrumentationMixin, InstrumentedConnection
+
+
+class AsyncInstrumentedConnection(AsyncInstrumentationMixin, AIOHttpConnection):
+    pass
+
+
+class AsyncConnections(Connections):
+    def create_connection(self, alias="default", **kwargs):
+        """
+        Construct an instance of ``elasticsearch.AsyncElasticsearch`` and register
+        it under given alias.
+        """
+        kwargs.setdefault("serializer", serializer)
+        # 同步连接的统计连接类换成对应的异步版本
+        if kwargs.get("connection_class") is InstrumentedConnection:
+            kwargs["connection_class"] = AsyncInstrumentedConnection
+        conn = self._conns[alias] = AsyncElasticsearch(**kwargs)
+        return conn
+
+    def get_connection(self, alias="default"):
+        if isinstance(alias, str) and alias not in self._conns and alias not in self._kwargs:
+            if alias in sync_connections._kwargs:
+                return self.create_connection(alias, **sync_connections._kwargs[alias])
+        return super(AsyncConnections, self).get_connection(alias)
+
+
+connections = AsyncConnections()
+configure = connections.configure
+add_connection = connections.add_connection
+remove_connection = connections.remove_connection
+create_connection = connections.create_connection
+get_connection = connections.get_connection
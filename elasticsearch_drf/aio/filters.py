@@ -0,0 +1,30 @@
+"""
+Async variants of the filter backends that read the index mapping.
+
+The mapping is loaded through the async client, after which the regular
+(CPU only) filtering logic runs unchanged. `ESearchFilter` and
+`ESFacetFilter` do no I/O and are used as is.
+"""
+from elasticsearch_drf.aio.connections import get_connection
+from elasticsearch_drf.filters import ESFilter, ESOrderingFilter, ESSourceFilter
+from elasticsearch_drf.mappings import mapping_cache
+
+
+class AsyncMappingMixin:
+    async def filter_search(self, request, search, view):
+        model_class = getattr(view, "model_class", None)
+        if model_class is not None:
+            await mapping_cache.aload(model_class, get_connection(model_class._get_using()))
+        return super(AsyncMappingMixin, self).filter_search(request, search, view)
+
+
+class AsyncESFilter(AsyncMappingMixin, ESFilter):
+    pass
+
+
+class AsyncESOrderingFilter(AsyncMappingMixin, ESOrderingFilter):
+    pass
+
+
+class AsyncESSourceFilter(AsyncMappingMixin, ESSourceFilter):
+    pass
@@ -0,0 +1,124 @@
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from elasticsearch.exceptions import NotFoundError
+
+from elasticsearch_drf.aio.connections import get_connection
+from elasticsearch_drf.aio.utils import execute, execute_searches
+from elasticsearch_drf.generics import ESGenericAPIView
+from elasticsearch_drf.settings import api_settings
+
+
+async def _maybe_await(value):
+    return await value if inspect.isawaitable(value) else value
+
+
+class AsyncESGenericAPIView(ESGenericAPIView):
+    """
+    基于 AsyncElasticsearch 的通用API视图, 用于ASGI(daphne)部署, 等待ES响应时不占用线程
+    请求处理函数需定义为 async def; 认证、权限、限流等DRF同步流程放到线程中执行
+    """
+
+    filter_backends = api_settings.DEFAULT_ASYNC_FILTER_BACKENDS
+
+    pagination_class = api_settings.DEFAULT_ASYNC_PAGINATION_CLASS
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # 认证等可能访问数据库, 不能直接在事件循环中执行
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = await _maybe_await(handler(request, *args, **kwargs))
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    def get_connection(self):
+        return get_connection(self.model_class._get_using())
+
+    async def get_object(self):
+        search = await self.filter_search(self.get_search())
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        assert lookup_url_kwarg in self.kwargs, (
+            "Expected view %s to be called with a URL keyword argument "
+            'named "%s". Fix your URL conf, or set the `.lookup_field` '
+            "attribute on the view correctly." % (self.__class__.__name__, lookup_url_kwarg)
+        )
+
+        lookup_value = self.kwargs[lookup_url_kwarg]
+        index = self.get_direct_index(search) if self.lookup_field == "_id" else None
+        if index is not None:
+            try:
+                doc = await self.get_connection().get(index=index, id=lookup_value, **self.get_source_params(search))
+            except NotFoundError:
+                raise Http404
+            return self.model_class.from_es(doc)
+
+        filter_kwargs = {self.lookup_field: lookup_value}
+        try:
+            obj = (await execute(search.query("term", **filter_kwargs)))[0]
+        except IndexError:
+            raise Http404
+
+        return obj
+
+    async def get_objects(self, lookup_values):
+        search = await self.filter_search(self.get_search())
+        index = self.get_direct_index(search) if self.lookup_field == "_id" else None
+        if index is not None:
+            response = await self.get_connection().mget(
+                index=index,
+                body={"docs": [{"_id": value} for value in lookup_values]},
+                **self.get_source_params(search),
+            )
+            return [self.model_class.from_es(doc) if doc.get("found") else None for doc in response["docs"]]
+
+        search = search.filter("terms", **{self.lookup_field: lookup_values})[: len(lookup_values)]
+        objs = {}
+        for obj in await execute(search):
+            value = obj.meta.id if self.lookup_field == "_id" else getattr(obj, self.lookup_field, None)
+            objs.setdefault(value, obj)
+        return [objs.get(value) for value in lookup_values]
+
+    async def filter_search(self, search, request=None):
+        request = self.request if request is None else request
+        # 同步的过滤后端同样可用
+        for backend in list(self.filter_backends):
+            search = await _maybe_await(backend().filter_search(request, search, self))
+        return search
+
+    async def execute_searches(self, searches):
+        await execute_searches(searches)
+
+    async def get_result_cache_key(self, search):
+        if self.result_cache_timeout is None or self.request.accepted_renderer.format != "json":
+            return None
+        return await sync_to_async(super(AsyncESGenericAPIView, self).get_result_cache_key)(search)
+
+    async def invalidate_cached_results(self, refreshed=False):
+        await sync_to_async(super(AsyncESGenericAPIView, self).invalidate_cached_results)(refreshed)
+
+    async def paginate_search(self, search):
+        if self.paginator is None:
+            return None
+        return await _maybe_await(self.paginator.paginate_search(search, self.request, view=self))
+
+    async def get_paginated_response(self, data):
+        assert self.paginator is not None
+        return await _maybe_await(self.paginator.get_paginated_response(data))
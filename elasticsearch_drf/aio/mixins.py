@@ -0,0 +1,326 @@
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from elasticsearch import helpers
+from elasticsearch.exceptions import ConflictError, NotFoundError
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from elasticsearch_drf import mixins
+from elasticsearch_drf.aio.utils import execute, get_search_data, iter_search_data
+from elasticsearch_drf.asgi import AsyncStreamingHttpResponse
+from elasticsearch_drf.autocomplete import (
+    filter_suggestions,
+    get_autocomplete_key,
+    get_scope_search,
+    parse_suggestions,
+    prefix_cache,
+)
+from elasticsearch_drf.cache import CachedJSONResponse, get_cached_result
+from elasticsearch_drf.exceptions import Conflict, PreconditionFailed
+from elasticsearch_drf.mappings import mapping_cache
+from elasticsearch_drf.mixins import (
+    get_bulk_id_chunks,
+    get_bulk_ids,
+    get_create_data,
+    get_create_status,
+    get_etag_headers,
+    get_index_action,
+    get_update_action,
+    is_write_behind_update,
+)
+from elasticsearch_drf.reindex import record_bulk_deletes, record_deletes
+from elasticsearch_drf.renderers import NDJSONRenderer, StreamingJSONRenderer
+from elasticsearch_drf.settings import api_settings
+from elasticsearch_drf.utils import get_partial_status
+
+
+class AsyncESCreateModelMixin(mixins.ESCreateModelMixin):
+    async def create(self, request, *args, **kwargs):
+        form = self.get_form(data=request.data)
+        if form.is_valid() is False:
+            raise ValidationError(form.errors)
+        doc = await self.perform_create(form)
+        return Response(get_create_data(doc, form, self.write_behind), status=get_create_status(self.write_behind))
+
+    async def perform_create(self, form):
+        assert self.model_class is not None
+        doc = self.model_class(**form.cleaned_data)
+        doc.full_clean()
+        if self.write_behind:
+            await sync_to_async(self.enqueue_write)(get_index_action(doc))
+            return doc
+        result = await self.get_connection().index(index=doc._get_index(), body=doc.to_dict(skip_empty=True))
+        doc.meta.id = result["_id"]
+        await self.invalidate_cached_results()
+        return doc
+
+
+class AsyncESListModelMixin(mixins.ESListModelMixin):
+    """
+    与同步版本相同: 相同的并发查询合并执行(进程内, 见 singleflight.acoalesce),
+    ES请求由 AsyncInstrumentedConnection 计入请求统计
+    """
+
+    async def list(self, request, *args, **kwargs):
+        search = await self.filter_search(self.get_search())
+
+        if self.stream or isinstance(request.accepted_renderer, NDJSONRenderer):
+            return await self.get_streaming_response(self.get_stream_search(self.limit_search(search, terminate=False)))
+
+        limited = self.limit_search(search)
+        cache_key = await self.get_result_cache_key(limited)
+        if cache_key is not None:
+            content = await sync_to_async(get_cached_result)(cache_key)
+            if content is not None:
+                return CachedJSONResponse(content)
+
+        page_search = await self.paginate_search(limited)
+
+        searches = []
+        if page_search is not None:
+            searches = [page_search, *self.paginator.get_searches()]
+            await self.execute_searches(searches)
+            self.check_partial_results(searches)
+            data = await get_search_data(page_search, self.raw_hits, self.raw_meta_fields)
+            response = await self.get_paginated_response(data)
+        else:
+            # 不分页的结果没有命中总数和partial标记, 不加提前结束条数, 以免结果被悄悄截断
+            search = self.limit_search(search, terminate=False)
+            response = Response(await get_search_data(search, self.raw_hits, self.raw_meta_fields))
+
+        if cache_key is not None and get_partial_status(*searches) is None:
+            return await sync_to_async(self.cache_response)(cache_key, response)
+        return response
+
+    @action(detail=False, methods=["post"])
+    async def msearch(self, request, *args, **kwargs):
+        """多个命名查询合并为一次_msearch, 按名称返回各自的列表结果"""
+        queries = []
+        for name, params in self.get_msearch_queries(request).items():
+            subrequest = self.get_subrequest(params)
+            search = await self.filter_search(self.get_search(), subrequest)
+            paginator = None if self.pagination_class is None else self.pagination_class()
+            page_search = (
+                None
+                if paginator is None
+                else await paginator.paginate_search(self.limit_search(search), subrequest, view=self)
+            )
+            # 与list相同, 不分页时不加提前结束条数
+            search = self.limit_search(search, terminate=page_search is not None)
+            queries.append((name, search, paginator, page_search))
+
+        searches = []
+        for name, search, paginator, page_search in queries:
+            if page_search is not None:
+                searches.extend([page_search, *paginator.get_searches()])
+        await self.execute_searches(searches)
+        self.check_partial_results(searches)
+
+        results = OrderedDict()
+        for name, search, paginator, page_search in queries:
+            if page_search is None:
+                results[name] = await get_search_data(search, self.raw_hits, self.raw_meta_fields)
+            else:
+                data = await get_search_data(page_search, self.raw_hits, self.raw_meta_fields)
+                results[name] = (await paginator.get_paginated_response(data)).data
+        return Response(results)
+
+    async def get_streaming_response(self, search):
+        """
+        边通过 AsyncElasticsearch 分批拉取(search_after + PIT或scroll)边输出, 内存占用恒定
+        响应为 AsyncStreamingHttpResponse, 需使用 elasticsearch_drf.asgi.get_asgi_application 在事件循环中发送
+        """
+        renderer = self.request.accepted_renderer
+        if not isinstance(renderer, StreamingJSONRenderer):
+            renderer = StreamingJSONRenderer()
+        data = iter_search_data(search, self.raw_hits, self.raw_meta_fields)
+        return AsyncStreamingHttpResponse(renderer.arender_stream(data), content_type=renderer.media_type)
+
+
+class AsyncESRetrieveModelMixin(mixins.ESRetrieveModelMixin):
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await self.get_object()
+        headers = get_etag_headers(getattr(instance.meta, "seq_no", None), getattr(instance.meta, "primary_term", None))
+        return Response(instance.to_dict(), headers=headers)
+
+    @action(detail=False, methods=["get"])
+    async def batch_retrieve(self, request, *args, **kwargs):
+        """?ids=a,b,c 批量查询, 按ids顺序返回, 未找到的位置为null"""
+        instances = await self.get_objects(self.get_batch_ids(request))
+        return Response([None if instance is None else instance.to_dict() for instance in instances])
+
+
+class AsyncESAutocompleteModelMixin(mixins.ESAutocompleteModelMixin):
+    @action(detail=False, methods=["get"])
+    async def autocomplete(self, request, *args, **kwargs):
+        prefix = self.get_autocomplete_prefix(request)
+        if not prefix:
+            return Response([])
+
+        await mapping_cache.aload(self.model_class, self.get_connection())
+        search = await self.filter_search(self.get_search())
+        suggest_search = self.get_autocomplete_search(search, prefix)
+        cache_key = get_autocomplete_key(suggest_search, prefix)
+        suggestions = None if cache_key is None else prefix_cache.get(cache_key)
+        if suggestions is None:
+            suggestions = parse_suggestions(await execute(suggest_search), self.autocomplete_field)
+            if self.needs_suggestion_scope(search, suggestions):
+                suggestions = filter_suggestions(suggestions, await execute(get_scope_search(search, suggestions)))
+            if cache_key is not None:
+                prefix_cache.set(cache_key, suggestions)
+        return Response(suggestions)
+
+
+class AsyncESUpdateModelMixin(mixins.ESUpdateModelMixin):
+    async def update(self, request, *args, **kwargs):
+        partial = kwargs.pop("partial", False)
+        form = self.get_form(data=request.data, partial=partial)
+        if form.is_valid() is False:
+            raise ValidationError(form.errors)
+        data = form.cleaned_data
+        if partial:
+            data = {k: v for k, v in data.items() if k in request.data}
+        result = await self.perform_update(await self.get_update_instance(), data)
+        return self.get_update_response(result)
+
+    async def partial_update(self, request, *args, **kwargs):
+        kwargs["partial"] = True
+        return await self.update(request, *args, **kwargs)
+
+    @action(detail=True, methods=["post"])
+    async def increment(self, request, *args, **kwargs):
+        """{"字段": 增量, ...} 原子增减 increment_fields 中的数值字段, 返回更新后的_source"""
+        script = {
+            "source": self.increment_script,
+            "lang": "painless",
+            "params": {"increments": self.get_increments(request)},
+        }
+        instance = await self.get_update_instance()
+        result = await self.perform_partial_update(instance.meta.id, instance.meta.index, {"script": script})
+        return self.get_update_response(result)
+
+    async def get_update_instance(self):
+        search = await self.filter_search(self.get_search())
+        index = self.get_direct_index(search) if self.lookup_field == "_id" else None
+        if index is not None:
+            return self.model_class(
+                meta={"id": self.kwargs[self.lookup_url_kwarg or self.lookup_field], "index": index}
+            )
+        return await self.get_object()
+
+    async def perform_update(self, instance, data):
+        doc = self.model_class(**data).to_dict(skip_empty=False)
+        return await self.perform_partial_update(instance.meta.id, instance.meta.index, {"doc": doc})
+
+    async def perform_partial_update(self, _id, index, body):
+        assert self.model_class is not None
+        concurrency = self.get_concurrency_params()
+        if is_write_behind_update(self.write_behind, body, concurrency):
+            await sync_to_async(self.enqueue_write)(get_update_action(index, _id, body, concurrency))
+            return None
+        try:
+            result = await self.get_connection().update(index=index, id=_id, body=body, _source=True, **concurrency)
+        except NotFoundError:
+            raise Http404
+        except ConflictError:
+            raise PreconditionFailed if "if_seq_no" in concurrency else Conflict
+        await self.invalidate_cached_results()
+        return result
+
+
+class AsyncESDestroyModelMixin(mixins.ESDestroyModelMixin):
+    async def destroy(self, request, *args, **kwargs):
+        instance = await self.get_object()
+        await self.perform_destroy(instance)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    async def perform_destroy(self, instance):
+        await sync_to_async(record_deletes)(instance._get_index(), [instance.meta.id])
+        await self.get_connection().delete(index=instance._get_index(), id=instance.meta.id)
+        await self.invalidate_cached_results()
+
+
+class AsyncESBulkModelMixin(mixins.ESBulkModelMixin):
+    """
+    批量写入, 数据校验和组装actions与同步版本一致, 通过 helpers.async_streaming_bulk 发送到ES
+    """
+
+    # 同步实现只负责组装actions, 返回的 get_bulk_response(actions) 在这里是协程
+
+    @action(detail=False, methods=["post"])
+    async def bulk_create(self, request, *args, **kwargs):
+        return await super(AsyncESBulkModelMixin, self).bulk_create(request, *args, **kwargs)
+
+    @action(detail=False, methods=["post"])
+    async def bulk_update(self, request, *args, **kwargs):
+        return await super(AsyncESBulkModelMixin, self).bulk_update(request, *args, **kwargs)
+
+    @action(detail=False, methods=["post"])
+    async def bulk_destroy(self, request, *args, **kwargs):
+        return await super(AsyncESBulkModelMixin, self).bulk_destroy(request, *args, **kwargs)
+
+    # 单条写入钩子的默认实现, 与bulk请求等效
+    default_write_hooks = (
+        AsyncESUpdateModelMixin.perform_update,
+        AsyncESUpdateModelMixin.perform_partial_update,
+        AsyncESDestroyModelMixin.perform_destroy,
+    )
+
+    async def get_bulk_response(self, actions):
+        refresh = self.get_bulk_refresh()
+        ids = get_bulk_ids(actions)
+        if ids:
+            actions = self.scope_bulk_actions(actions, await self.get_bulk_indices(ids))
+        es_results = await self.perform_bulk([i for i in actions if "_op_type" in i], refresh)
+        return self.build_bulk_response(actions, es_results)
+
+    async def get_bulk_indices(self, ids):
+        search = await self.filter_search(self.get_search())
+        index = self.get_direct_index(search)
+        if index is not None:
+            return {_id: index for _id in ids}
+        indices = {}
+        for chunk in get_bulk_id_chunks(ids):
+            for hit in await execute(search.filter("ids", values=chunk).source(False)[: len(chunk)]):
+                indices[hit.meta.id] = hit.meta.index
+        return indices
+
+    async def perform_write_hook(self, action):
+        op_type, _id = action["_op_type"], action["_id"]
+        name, hook = self.get_write_hook(op_type)
+        instance = self.model_class(meta={"id": _id, "index": action["_index"]})
+        result = {"_id": _id, "status": status.HTTP_200_OK, "result": "%sd" % op_type}
+        try:
+            if name == "perform_update":
+                await hook(instance, action["data"])
+            elif name == "perform_partial_update":
+                await hook(_id, action["_index"], {"doc": action["doc"]})
+            else:
+                await hook(instance)
+        except (Http404, NotFoundError):
+            result = {"_id": _id, "status": status.HTTP_404_NOT_FOUND, "error": "Not found."}
+        except APIException as e:
+            result = {"_id": _id, "status": e.status_code, "error": e.detail}
+        return {op_type: result}
+
+    async def perform_bulk(self, actions, refresh):
+        assert self.model_class is not None
+        hooked = [self.get_write_hook(i["_op_type"]) is not None for i in actions]
+        bulk_actions = [i for i, h in zip(actions, hooked) if not h]
+        items = iter(())
+        if bulk_actions:
+            await sync_to_async(record_bulk_deletes)(bulk_actions)
+            results = helpers.async_streaming_bulk(
+                self.get_connection(),
+                bulk_actions,
+                chunk_size=api_settings.BULK_CHUNK_SIZE,
+                raise_on_error=False,
+                refresh=refresh,
+            )
+            items = iter([item async for ok, item in results])
+            await self.invalidate_cached_results(refreshed=refresh == "wait_for")
+        return [await self.perform_write_hook(i) if h else next(items) for i, h in zip(actions, hooked)]
@@ -0,0 +1,73 @@
+"""
+Async variants of the paginators, executing on `AsyncElasticsearch`.
+"""
+from asgiref.sync import sync_to_async
+from elasticsearch.exceptions import NotFoundError
+from rest_framework.exceptions import NotFound
+
+from elasticsearch_drf.aio.connections import get_connection
+from elasticsearch_drf.aio.utils import close_point_in_time, execute, get_search_count, open_point_in_time
+from elasticsearch_drf.counts import index_stats_cache
+from elasticsearch_drf.facets import parse_facets, set_cached_facets
+from elasticsearch_drf.pagination import ESCursorPagination, ESFacetsMixin, ESPagination, get_count_relation
+from elasticsearch_drf.utils import get_partial_status, get_search_hash, without_aggs
+
+
+class AsyncESFacetsMixin(ESFacetsMixin):
+    async def get_facets(self):
+        if self.facets is None and self.facets_key is not None:
+            search = self.get_facets_search()
+            if not hasattr(search, "_response"):
+                search = search[:0].extra(track_total_hits=False)
+            self.facets = parse_facets(await execute(search))
+            if get_partial_status(search) is None:
+                await sync_to_async(set_cached_facets)(self.facets_key, self.facets)
+        return self.facets
+
+
+class AsyncESPagination(AsyncESFacetsMixin, ESPagination):
+    async def paginate_search(self, search, request, view=None):
+        # Only the facets cache lookup does I/O here.
+        return await sync_to_async(super(AsyncESPagination, self).paginate_search)(search, request, view)
+
+    async def get_total(self):
+        if self.total is None and self.estimated:
+            es = get_connection(self.search._using)
+            self.total, self.count_relation = await index_stats_cache.aget_doc_count(self.search, es), "estimated"
+        elif self.total is None and self.total_search is not None:
+            self.total, self.count_relation = await get_search_count(self.total_search)
+            self.count_relation = get_count_relation(self.total_search, self.count_relation)
+        return self.total
+
+    async def get_paginated_response(self, data):
+        items = [("count", await self.get_total()), ("count_relation", self.count_relation)]
+        return self.build_response(items, await self.get_facets(), data)
+
+
+class AsyncESCursorPagination(AsyncESFacetsMixin, ESCursorPagination):
+    async def paginate_search(self, search, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.request = request
+        self.search_hash = get_search_hash(search, exclude=self.search_hash_exclude)
+        self.cursor = self.decode_cursor(request)
+        search = without_aggs(search) if self.cursor else search
+        search = await sync_to_async(self.prepare_facets)(search)
+        self.pit_id = self.cursor["pit"] if self.cursor else await open_point_in_time(search, self.keep_alive)
+        page_search = self.get_page_search(search)
+
+        try:
+            self.response = await execute(page_search)
+        except NotFoundError:
+            raise NotFound(self.expired_cursor_message)
+        self.pit_id = self.response.to_dict().get("pit_id", self.pit_id)
+        self.search = page_search
+        if self.is_single_page():
+            await close_point_in_time(search, self.pit_id)
+        return page_search
+
+    async def get_paginated_response(self, data):
+        items, data = self.get_page_links(data)
+        return self.build_response(items, await self.get_facets(), data)
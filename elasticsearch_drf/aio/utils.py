@@ -0,0 +1,231 @@
+"""
+elasticsearch_drf.utils 中查询执行函数的异步版本
+
+search仍由elasticsearch_dsl构建, 通过 AsyncElasticsearch 执行, 响应同样缓存在 search._response 中;
+相同的并发查询与同步版本一样合并执行(见 elasticsearch_drf.singleflight.acoalesce)
+"""
+from typing import AsyncIterator, List, Tuple
+
+from asgiref.sync import sync_to_async
+from elasticsearch import helpers
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch_dsl import Search
+
+from elasticsearch_drf.aio.connections import get_connection
+from elasticsearch_drf.msearch import (
+    get_msearch_body,
+    get_msearch_key,
+    get_msearch_params,
+    group_searches,
+    set_responses,
+)
+from elasticsearch_drf.settings import api_settings
+from elasticsearch_drf.singleflight import acoalesce, get_search_key
+from elasticsearch_drf.utils import (
+    _get_checkpoint_cache,
+    _get_hit_data,
+    _get_scan_params,
+    _get_search_after_key,
+    _get_search_after_search,
+    _new_checkpoints,
+    _save_checkpoints,
+    without_aggs,
+)
+
+
+async def execute(search: Search, ignore_cache=False):
+    """search.execute()的异步版本"""
+    if ignore_cache or not hasattr(search, "_response"):
+        es = get_connection(search._using)
+        response = await acoalesce(
+            get_search_key(search), lambda: es.search(index=search._index, body=search.to_dict(), **search._params)
+        )
+        search._response = search._response_class(search, response)
+    return search._response
+
+
+async def execute_searches(searches: List[Search]):
+    """execute_searches的异步版本"""
+    for using, group in group_searches(searches).items():
+        if len(group) == 1:
+            await execute(group[0])
+            continue
+        es = get_connection(using)
+        body = get_msearch_body(group)
+        params = get_msearch_params(group)
+        set_responses(group, await acoalesce(get_msearch_key(using, body), lambda: es.msearch(body=body, **params)))
+
+
+async def count(search: Search) -> int:
+    """search.count()的异步版本"""
+    if hasattr(search, "_response") and search._response.hits.total.relation == "eq":
+        return search._response.hits.total.value
+
+    es = get_connection(search._using)
+    response = await es.count(index=search._index, body=search.to_dict(count=True), **search._params)
+    return response["count"]
+
+
+async def get_search_count(search: Search) -> Tuple[int, str]:
+    """get_search_count的异步版本"""
+    response = getattr(search, "_response", None)
+    if response is not None:
+        total = response.to_dict()["hits"].get("total")
+        if isinstance(total, dict):
+            return total["value"], total["relation"]
+        if isinstance(total, int):
+            return total, "eq"
+    return await count(search), "eq"
+
+
+async def get_search_total(search: Search) -> int:
+    """get_search_total的异步版本"""
+    return (await get_search_count(search))[0]
+
+
+async def open_point_in_time(search: Search, keep_alive: int) -> str:
+    es = get_connection(search._using)
+    response = await es.open_point_in_time(index=search._index, keep_alive="%ds" % keep_alive)
+    return response["id"]
+
+
+async def close_point_in_time(search: Search, pit_id: str):
+    try:
+        await get_connection(search._using).close_point_in_time(body={"id": pit_id})
+    except NotFoundError:
+        pass
+
+
+async def _execute_search_after(search: Search, state: dict, search_after, size: int, source=True):
+    response = await execute(_get_search_after_search(search, state, search_after, size, source))
+    state["pit_id"] = response.to_dict().get("pit_id", state["pit_id"])
+    return response
+
+
+async def _seek(search: Search, key: str, from_: int):
+    state = await sync_to_async(_get_checkpoint_cache().get)(key)
+    if state is None:
+        state = _new_checkpoints(await open_point_in_time(search, api_settings.SEARCH_AFTER_KEEP_ALIVE))
+    checkpoints = state["checkpoints"]
+    offset = max((o for o in checkpoints if o <= from_), default=0)
+    search_after = checkpoints.get(offset)
+    while offset < from_:
+        size = min(from_ - offset, api_settings.ES_MAX_OFFSET)
+        response = await _execute_search_after(search, state, search_after, size, source=False)
+        hits = response.to_dict()["hits"]["hits"]
+        if not hits:
+            break
+        offset += len(hits)
+        search_after = checkpoints[offset] = hits[-1]["sort"]
+    return state, offset, search_after
+
+
+async def iter_search_after(search: Search, from_: int = 0, size: int = None, raw: bool = False) -> AsyncIterator:
+    """
+    iter_search_after的异步版本, 检查点与同步版本共用同一份缓存
+    """
+    key = _get_search_after_key(search)
+    try:
+        state, offset, search_after = await _seek(search, key, from_)
+    except NotFoundError:
+        await sync_to_async(_get_checkpoint_cache().delete)(key)
+        state, offset, search_after = await _seek(search, key, from_)
+
+    if offset < from_:
+        await sync_to_async(_save_checkpoints)(key, state)
+        return
+
+    try:
+        remaining = size
+        while remaining != 0:
+            batch = api_settings.ES_MAX_OFFSET if remaining is None else min(remaining, api_settings.ES_MAX_OFFSET)
+            response = await _execute_search_after(search, state, search_after, batch)
+            hits = response.to_dict()["hits"]["hits"]
+            if not hits:
+                break
+            offset += len(hits)
+            search_after = state["checkpoints"][offset] = hits[-1]["sort"]
+            for hit in hits if raw else response:
+                yield hit
+            if remaining is not None:
+                remaining -= len(hits)
+            if len(hits) < batch:
+                break
+    finally:
+        await sync_to_async(_save_checkpoints)(key, state)
+
+
+async def _scan(search: Search, raw: bool, limit: int = None, **scan_params) -> AsyncIterator:
+    search = without_aggs(search)
+    es = get_connection(search._using)
+    hits = helpers.async_scan(es, query=search.to_dict(), index=search._index, **{**search._params, **scan_params})
+    n = 0
+    async for hit in hits:
+        if limit is not None and n >= limit:
+            break
+        n += 1
+        yield hit if raw else search._get_result(hit)
+
+
+async def _execute(search: Search, raw: bool):
+    response = await execute(search)
+    return response.to_dict()["hits"]["hits"] if raw else response
+
+
+async def iter_hits(search: Search, raw: bool = False) -> AsyncIterator:
+    """
+    iter_hits的异步版本, 分页策略与同步版本一致
+    """
+    d = search.to_dict()
+    from_, size = d.get("from"), d.get("size")
+    scan_params = _get_scan_params(d)
+    # 未指定任何分页参数
+    if from_ is None and size is None:
+        total = await count(search)
+        if total <= api_settings.ES_MAX_OFFSET:
+            resp = await _execute(search[:total], raw)
+        elif d.get("sort"):
+            resp = iter_search_after(search, raw=raw)
+        else:
+            resp = _scan(search, raw, **scan_params)
+    # 只指定分页size
+    elif from_ is None:
+        if size > api_settings.ES_MAX_OFFSET:
+            resp = _scan(search, raw, limit=size, **scan_params)
+        else:
+            resp = await _execute(search, raw)
+    # 只指定分页from
+    elif size is None:
+        total = await count(search)
+        if total > api_settings.ES_MAX_OFFSET:
+            resp = iter_search_after(search, from_, raw=raw)
+        else:
+            resp = await _execute(search[from_:total], raw)
+    # 指定分页from和size
+    else:
+        if from_ + size > api_settings.ES_MAX_OFFSET:
+            resp = iter_search_after(search, from_, size, raw=raw)
+        else:
+            resp = await _execute(search, raw)
+
+    if hasattr(resp, "__aiter__"):
+        async for hit in resp:
+            yield hit
+    else:
+        for hit in resp:
+            yield hit
+
+
+async def iter_search_data(search: Search, raw: bool = False, meta_fields=()) -> AsyncIterator[dict]:
+    """
+    iter_search_data的异步版本
+    """
+    async for hit in iter_hits(search, raw=raw):
+        yield _get_hit_data(hit, meta_fields) if raw else hit.to_dict()
+
+
+async def get_search_data(search: Search, raw: bool = False, meta_fields=()) -> List[dict]:
+    """
+    get_search_data的异步版本
+    """
+    return [data async for data in iter_search_data(search, raw, meta_fields)]
@@ -0,0 +1,38 @@
+import asyncio
+
+from rest_framework.viewsets import ViewSetMixin
+
+from elasticsearch_drf.aio import mixins
+from elasticsearch_drf.aio.generics import AsyncESGenericAPIView
+
+
+class AsyncESGenericViewSet(ViewSetMixin, AsyncESGenericAPIView):
+    """
+    异步ES通用视图集, 不实现任何请求处理视图函数,
+    但提供 get_object、get_objects、get_search、filter_search、paginate_search 等方法(均为协程)
+    """
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super(AsyncESGenericViewSet, cls).as_view(actions, **initkwargs)
+        # 与django View.as_view相同的做法, 标记为协程函数后django按异步视图调用
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        return view
+
+
+class AsyncESModelViewSet(
+    mixins.AsyncESCreateModelMixin,
+    mixins.AsyncESRetrieveModelMixin,
+    mixins.AsyncESUpdateModelMixin,
+    mixins.AsyncESDestroyModelMixin,
+    mixins.AsyncESListModelMixin,
+    mixins.AsyncESAutocompleteModelMixin,
+    mixins.AsyncESBulkModelMixin,
+    AsyncESGenericViewSet,
+):
+    """
+    异步ES模型视图集, 与 ESModelViewSet 提供相同的请求处理视图函数,
+    基于 AsyncElasticsearch 执行, 在ASGI(daphne)下一个进程可同时处理大量ES查询
+    """
+
+    pass
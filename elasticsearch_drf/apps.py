@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+from elasticsearch_dsl.connections import connections
+
+from elasticsearch_drf.instrumentation import InstrumentedConnection
+from elasticsearch_drf.settings import api_settings
 
 
 class ElasticsearchDrfConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "elasticsearch_drf"
+
+    def ready(self):
+        # 按 ES_CONNECTIONS 配置ES连接, 默认使用带请求统计的连接类
+        if api_settings.ES_CONNECTIONS:
+            connections.configure(
+                **{
+                    alias: {"connection_class": InstrumentedConnection, **kwargs}
+                    for alias, kwargs in api_settings.ES_CONNECTIONS.items()
+                }
+            )
+        # 加载各app的 documents.py, 注册模型同步(elasticsearch_drf.sync)
+        autodiscover_modules("documents")
@@ -0,0 +1,117 @@
+"""
+流式响应不阻塞事件循环的ASGI入口
+
+Django 4.1 的 ASGIHandler 在事件循环中同步迭代 StreamingHttpResponse, 生成每一块内容(如从ES拉取下一批结果)
+时整个worker的其他请求都被阻塞。ESASGIHandler 把流式内容的每一块放到线程池中生成,
+AsyncStreamingHttpResponse 的异步迭代器直接在事件循环中迭代, 非流式响应的处理与Django相同。
+
+在项目的 asgi.py 中以 elasticsearch_drf.asgi.get_asgi_application 代替 django.core.asgi.get_asgi_application
+"""
+import django
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.http import StreamingHttpResponse
+
+_DONE = object()
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    """
+    内容为异步迭代器的流式响应, 由 ESASGIHandler 在事件循环中逐块发送
+    同步迭代时(WSGI、测试客户端)在新的事件循环中取回全部内容后返回, 只用于兼容, 不是流式的
+    """
+
+    is_async = True
+
+    def _set_streaming_content(self, value):
+        self._async_iterator = value
+
+    @property
+    def streaming_content(self):
+        return iter(async_to_sync(_collect)(self.async_streaming_content))
+
+    @streaming_content.setter
+    def streaming_content(self, value):
+        self._set_streaming_content(value)
+
+    @property
+    def async_streaming_content(self):
+        return _make_bytes(self, self._async_iterator)
+
+    async def aclose(self):
+        """关闭异步迭代器, 中途结束时其中的finally(如关闭PIT)随之执行"""
+        if hasattr(self._async_iterator, "aclose"):
+            await self._async_iterator.aclose()
+
+
+async def _make_bytes(response, iterator):
+    try:
+        async for part in iterator:
+            yield response.make_bytes(part)
+    finally:
+        # 被包装(如统计ES请求)后关闭外层时, 原来的迭代器随之关闭
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+async def _collect(iterator) -> list:
+    return [part async for part in iterator]
+
+
+def get_response_headers(response) -> list:
+    """响应头和cookie转换为ASGI的headers, 与Django的ASGIHandler相同"""
+    headers = []
+    for header, value in response.items():
+        if isinstance(header, str):
+            header = header.encode("ascii")
+        if isinstance(value, str):
+            value = value.encode("latin1")
+        headers.append((bytes(header), bytes(value)))
+    for c in response.cookies.values():
+        headers.append((b"Set-Cookie", c.output(header="").encode("ascii").strip()))
+    return headers
+
+
+async def aiter_streaming_content(response):
+    """逐块返回流式响应的内容, 同步迭代器的每一块在线程池中生成"""
+    if isinstance(response, AsyncStreamingHttpResponse):
+        async for part in response.async_streaming_content:
+            yield part
+        return
+    # 访问__iter__而不是streaming_content, 与Django一致, 兼容重写了__iter__的子类
+    iterator = iter(response)
+    while True:
+        part = await sync_to_async(next, thread_sensitive=False)(iterator, _DONE)
+        if part is _DONE:
+            return
+        yield part
+
+
+class ESASGIHandler(ASGIHandler):
+    """
+    流式响应不在事件循环中同步迭代的ASGIHandler
+    发送出错或请求被取消(客户端断开)时同样关闭响应, 流式内容的生成器随之关闭, 释放PIT等资源
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super(ESASGIHandler, self).send_response(response, send)
+
+        await send(
+            {"type": "http.response.start", "status": response.status_code, "headers": get_response_headers(response)}
+        )
+        try:
+            async for part in aiter_streaming_content(response):
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body"})
+        finally:
+            if isinstance(response, AsyncStreamingHttpResponse):
+                await response.aclose()
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    """同 django.core.asgi.get_asgi_application, 返回 ESASGIHandler"""
+    django.setup(set_prefix=False)
+    return ESASGIHandler()
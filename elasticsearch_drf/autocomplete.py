@@ -0,0 +1,112 @@
+"""
+自动补全
+
+视图声明的 completion 字段使用completion suggester, search_as_you_type 字段使用 bool_prefix 的 multi_match,
+只返回 _id 和补全文本; 视图的过滤条件同样生效, completion建议不受查询条件限制, 视图有过滤条件时再查询一次, 去掉过滤范围外的建议;
+1~3个字符的短前缀占了绝大部分请求且结果几乎不变, 缓存在进程内有界LRU中
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from elasticsearch_dsl import Search
+
+from elasticsearch_drf.settings import api_settings
+from elasticsearch_drf.utils import get_search_hash, without_aggs
+
+AUTOCOMPLETE_FIELD_TYPES = ("completion", "search_as_you_type")
+
+SUGGEST_NAME = "autocomplete"
+
+
+class PrefixCache:
+    """
+    进程内有界LRU缓存, 最多保留 AUTOCOMPLETE_CACHE_SIZE 条, 超过 AUTOCOMPLETE_CACHE_TIMEOUT 秒后失效
+    """
+
+    def __init__(self):
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry["expires"] <= time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry["value"]
+
+    def set(self, key, value):
+        with self._lock:
+            self._cache[key] = {"expires": time.monotonic() + api_settings.AUTOCOMPLETE_CACHE_TIMEOUT, "value": value}
+            self._cache.move_to_end(key)
+            while len(self._cache) > api_settings.AUTOCOMPLETE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+prefix_cache = PrefixCache()
+
+
+def get_autocomplete_search(search: Search, field: str, field_type: str, prefix: str, size: int) -> Search:
+    """
+    :param search: 视图的基础search
+    :param field: completion 或 search_as_you_type 字段
+    :param field_type: 字段的mapping类型
+    :param prefix: 用户输入的前缀
+    :param size: 返回条数
+    :return:
+    """
+    if field_type == "completion":
+        suggest = {
+            SUGGEST_NAME: {"prefix": prefix, "completion": {"field": field, "size": size, "skip_duplicates": True}}
+        }
+        return search.source(False).extra(size=0, track_total_hits=False, suggest=suggest)
+
+    fields = [field, "%s._2gram" % field, "%s._3gram" % field]
+    search = search.query("multi_match", query=prefix, type="bool_prefix", fields=fields)
+    return search.source([field]).extra(size=size, track_total_hits=False)
+
+
+def get_scope_search(search: Search, suggestions: list) -> Search:
+    """completion建议不受查询条件限制, 查询建议中的文档有哪些在search的过滤范围内"""
+    ids = list({suggestion["_id"] for suggestion in suggestions})
+    return without_aggs(search).filter("ids", values=ids).source(False).extra(track_total_hits=False)[: len(ids)]
+
+
+def filter_suggestions(suggestions: list, response) -> list:
+    """只保留get_scope_search命中的文档的建议"""
+    ids = {hit["_id"] for hit in response.to_dict()["hits"]["hits"]}
+    return [suggestion for suggestion in suggestions if suggestion["_id"] in ids]
+
+
+def get_autocomplete_key(search: Search, prefix: str):
+    """只缓存短前缀, 其他前缀返回None"""
+    if len(prefix) > api_settings.AUTOCOMPLETE_CACHE_MAX_PREFIX_LENGTH:
+        return None
+    return search._using, get_search_hash(search)
+
+
+def parse_suggestions(response, field: str) -> list:
+    """
+    :return: [{"_id": 文档id, "text": 补全文本}, ...]
+    """
+    d = response.to_dict()
+    if "suggest" in d:
+        return [
+            {"_id": option.get("_id"), "text": option["text"]} for option in d["suggest"][SUGGEST_NAME][0]["options"]
+        ]
+
+    suggestions = []
+    for hit in d["hits"]["hits"]:
+        text = hit.get("_source", {})
+        for name in field.split("."):
+            text = text.get(name) if isinstance(text, dict) else None
+        suggestions.append({"_id": hit["_id"], "text": text})
+    return suggestions
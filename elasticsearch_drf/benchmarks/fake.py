@@ -0,0 +1,226 @@
+"""
+本地ES替身, 用于离线基准测试
+
+FakeConnection 代替 Urllib3HttpConnection 挂到真实的 Elasticsearch 客户端上, 请求照常经过客户端的
+序列化、Transport和连接层请求统计, 只是不访问网络, 按请求内容生成ES响应：
+
+from elasticsearch import Elasticsearch
+es = Elasticsearch(connection_class=FakeConnection, documents=[...], total=20000, latency=0.002)
+
+相同的请求第二次起直接回放第一次生成的响应, 基准结果中基本不包含替身自身的开销
+"""
+import json
+import time
+from collections import OrderedDict
+from urllib.parse import unquote
+
+from elasticsearch.connection import Connection
+
+from elasticsearch_drf.instrumentation import InstrumentationMixin
+from elasticsearch_drf.settings import api_settings
+
+INFO = {
+    "name": "benchmark",
+    "cluster_name": "benchmark",
+    "version": {"number": "7.17.0", "build_flavor": "default"},
+    "tagline": "You Know, for Search",
+}
+
+HEADERS = {"content-type": "application/json; charset=UTF-8", "x-elastic-product": "Elasticsearch"}
+
+PIT_ID = "benchmark-pit"
+
+# 回放的响应条数上限
+REPLAY_SIZE = 256
+
+
+class BaseFakeConnection(Connection):
+    """
+    按请求内容生成响应的连接, 不含请求统计
+    :param documents: 命中结果的_source列表, 按命中位置循环使用
+    :param total: 索引中的文档总数
+    :param latency: 每次请求的模拟网络往返耗时, 单位秒
+    """
+
+    def __init__(self, documents=(), total=10000, latency=0.0, **kwargs):
+        super(BaseFakeConnection, self).__init__(**kwargs)
+        self.documents = list(documents) or [{}]
+        self.total = total
+        self.latency = latency
+        self._replies = OrderedDict()
+
+    def set_total(self, total: int):
+        """修改文档总数, 已记录的响应随之失效"""
+        self.total = total
+        self._replies.clear()
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        start = time.time()
+        if self.latency:
+            time.sleep(self.latency)
+
+        key = (method, url, tuple(sorted((params or {}).items())), body)
+        reply = self._replies.get(key)
+        if reply is None:
+            status, data = self.route(method, url, params or {}, body)
+            reply = self._replies[key] = (status, json.dumps(data))
+            while len(self._replies) > REPLAY_SIZE:
+                self._replies.popitem(last=False)
+        status, raw_data = reply
+
+        duration = time.time() - start
+        if not (200 <= status < 300) and status not in ignore:
+            self.log_request_fail(method, url, url, body, duration, status_code=status, response=raw_data)
+            self._raise_error(status, raw_data)
+        self.log_request_success(method, url, url, body, status, raw_data, duration)
+        return status, HEADERS, raw_data
+
+    def route(self, method, url, params, body):
+        parts = [unquote(part) for part in url.strip("/").split("/") if part]
+        if not parts:
+            return 200, INFO
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+
+        if parts[-1] == "_msearch":
+            lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+            responses = [
+                self.search(self.get_header_index(header), {}, query)[1] for header, query in zip(*[iter(lines)] * 2)
+            ]
+            return 200, {"took": sum(r.get("took", 0) for r in responses), "responses": responses}
+        if parts[-1] == "_bulk":
+            return self.bulk(parts[0] if len(parts) > 1 else "", body)
+
+        body = json.loads(body) if body else {}
+        if parts[-2:] == ["_search", "scroll"]:
+            if method == "DELETE":
+                return 200, {"succeeded": True, "num_freed": 1}
+            return self.scroll(body["scroll_id"])
+        if parts[-1] == "_search":
+            return self.search(parts[0] if len(parts) > 1 else "", params, body)
+        if parts[-1] == "_count":
+            return 200, {"count": self.total, "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0}}
+        if parts[-1] == "_pit":
+            return 200, {"succeeded": True, "num_freed": 1} if method == "DELETE" else {"id": PIT_ID}
+        if "_stats" in parts:
+            return 200, {"_all": {"primaries": {"docs": {"count": self.total, "deleted": 0}}}}
+        if parts[-1] == "_mapping":
+            return 200, {parts[0]: {"mappings": {}}}
+        if len(parts) >= 2 and parts[1] in ("_doc", "_create", "_update"):
+            return self.document(method, parts, body)
+        return 404, {"error": {"type": "resource_not_found_exception", "reason": url}, "status": 404}
+
+    @staticmethod
+    def get_header_index(header: dict) -> str:
+        index = header.get("index", "")
+        return ",".join(index) if isinstance(index, list) else index
+
+    def get_source(self, position: int) -> dict:
+        return self.documents[position % len(self.documents)]
+
+    def get_hit(self, index: str, position: int, sort_size: int, source=True) -> dict:
+        hit = {"_index": index, "_id": str(position), "_score": 1.0}
+        if source:
+            hit["_source"] = self.get_source(position)
+        if sort_size:
+            hit["sort"] = [position] * sort_size
+        return hit
+
+    def get_hits(self, index: str, start: int, size: int, body: dict) -> list:
+        sort_size = len(body.get("sort", ()))
+        source = body.get("_source", True) is not False
+        if "slice" in body:
+            # 切片按位置取模划分
+            slice_id, slices = body["slice"]["id"], body["slice"]["max"]
+            start += (slice_id - start) % slices
+            positions = range(start, self.total, slices)[:size]
+        else:
+            positions = range(start, min(start + size, self.total))
+        return [self.get_hit(index, i, sort_size, source) for i in positions]
+
+    def get_total(self, track_total_hits):
+        if track_total_hits is False:
+            return None
+        if track_total_hits is True or self.total <= track_total_hits:
+            return {"value": self.total, "relation": "eq"}
+        return {"value": track_total_hits, "relation": "gte"}
+
+    def search(self, index, params, body):
+        size = int(body.get("size", params.get("size", 10)))
+        from_ = int(body.get("from", params.get("from", 0)))
+
+        if "scroll" in params:
+            return 200, dict(
+                self.get_search_response(index, 0, size, body), _scroll_id="%s:%s:%s" % (index, size, size)
+            )
+        if "search_after" in body:
+            from_ = body["search_after"][0] + 1
+        elif "pit" not in body and from_ + size > api_settings.ES_MAX_OFFSET:
+            reason = "Result window is too large, from + size must be less than or equal to: [%s]" % (
+                api_settings.ES_MAX_OFFSET
+            )
+            return 400, {"error": {"type": "illegal_argument_exception", "reason": reason}, "status": 400}
+
+        response = self.get_search_response(index, from_, size, body)
+        if "pit" in body:
+            response["pit_id"] = body["pit"]["id"]
+        return 200, response
+
+    def get_search_response(self, index, from_, size, body):
+        hits = {"max_score": 1.0, "hits": self.get_hits(index, from_, size, body)}
+        total = self.get_total(body.get("track_total_hits", 10000))
+        if total is not None:
+            hits["total"] = total
+        response = {
+            "took": 1,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": hits,
+        }
+        if body.get("aggs"):
+            response["aggregations"] = {name: {"buckets": []} for name in body["aggs"]}
+        return response
+
+    def scroll(self, scroll_id):
+        index, size, offset = scroll_id.rsplit(":", 2)
+        size, offset = int(size), int(offset)
+        response = self.get_search_response(index, offset, size, {})
+        response["_scroll_id"] = "%s:%s:%s" % (index, size, offset + size)
+        return 200, response
+
+    def document(self, method, parts, body):
+        index, _id = parts[0], parts[2] if len(parts) > 2 else "new"
+        meta = {"_index": index, "_id": _id, "_version": 1, "_seq_no": 0, "_primary_term": 1}
+        if method == "GET":
+            position = int(_id) if _id.isdigit() else self.total
+            if position >= self.total:
+                return 404, dict(meta, found=False)
+            return 200, dict(meta, found=True, _source=self.get_source(position))
+        if method == "DELETE":
+            return 200, dict(meta, result="deleted")
+        if parts[1] == "_update":
+            return 200, dict(meta, result="updated", get={"found": True, "_source": body.get("doc", {})})
+        return 201, dict(meta, result="created")
+
+    def bulk(self, index, body):
+        lines = iter(json.loads(line) for line in body.splitlines() if line.strip())
+        items = []
+        for action in lines:
+            ((op_type, meta),) = action.items()
+            if op_type != "delete":
+                next(lines)
+            _id = meta.get("_id", str(len(items)))
+            status = 201 if op_type in ("index", "create") else 200
+            item = {
+                "_index": meta.get("_index", index),
+                "_id": _id,
+                "_version": 1,
+                "result": "created" if status == 201 else "updated",
+                "status": status,
+            }
+            items.append({op_type: item})
+        return 200, {"took": 1, "errors": False, "items": items}
+
+
+class FakeConnection(InstrumentationMixin, BaseFakeConnection):
+    """带请求统计的 BaseFakeConnection, 统计包装在 perform_request 之外, 与 InstrumentedConnection 一致"""
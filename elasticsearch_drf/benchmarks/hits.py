@@ -0,0 +1,99 @@
+"""
+命中结果转换的微基准: 文档对象包装 + to_dict() 与 raw_hits 直接返回_source 的单条耗时对比
+不依赖ES服务, 在本地伪造一页search响应后运行：
+
+python -m elasticsearch_drf.benchmarks.hits [--hits 500] [--number 20]
+"""
+import argparse
+import os
+import timeit
+
+from django.conf import settings
+
+if "DJANGO_SETTINGS_MODULE" not in os.environ and not settings.configured:
+    settings.configure()
+
+from elasticsearch_dsl import Date, Document, Keyword, Long, Text, connections  # noqa: E402
+
+from elasticsearch_drf.utils import get_search_data  # noqa: E402
+
+CONNECTION_ALIAS = "benchmark-hits"
+
+
+class BenchmarkDocument(Document):
+    title = Text()
+    tag = Keyword()
+    views = Long()
+    created_at = Date()
+
+    class Index:
+        name = "benchmark-hits"
+        using = CONNECTION_ALIAS
+
+
+def make_response(hits):
+    return {
+        "took": 1,
+        "timed_out": False,
+        "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+        "hits": {
+            "total": {"value": hits, "relation": "eq"},
+            "max_score": 1.0,
+            "hits": [
+                {
+                    "_index": "benchmark-hits",
+                    "_id": str(i),
+                    "_score": 1.0,
+                    "_source": {
+                        "title": "document %s" % i,
+                        "tag": "tag-%s" % (i % 10),
+                        "views": i,
+                        "created_at": "2023-01-01T00:00:00",
+                    },
+                }
+                for i in range(hits)
+            ],
+        },
+    }
+
+
+class CannedConnection:
+    """每次search都返回同一份伪造响应的ES连接"""
+
+    def __init__(self, response):
+        self.response = response
+
+    def search(self, **kwargs):
+        return self.response
+
+
+def run(hits=500, number=20):
+    connections.add_connection(CONNECTION_ALIAS, CannedConnection(make_response(hits)))
+    search = BenchmarkDocument.search()[:hits]
+
+    results = {}
+    for name, kwargs in (
+        ("document", {}),
+        ("raw", {"raw": True}),
+        ("raw+meta", {"raw": True, "meta_fields": ("_id",)}),
+    ):
+        # 每轮都重新clone, 避免复用search上缓存的响应
+        seconds = min(timeit.repeat(lambda: get_search_data(search._clone(), **kwargs), number=number, repeat=3))
+        results[name] = seconds / number / hits * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hits", type=int, default=500, help="每页命中条数")
+    parser.add_argument("--number", type=int, default=20, help="每轮执行次数")
+    args = parser.parse_args()
+
+    results = run(args.hits, args.number)
+    baseline = results["document"]
+    for name, per_hit in results.items():
+        print("%-10s %8.2f us/hit  x%.1f" % (name, per_hit, baseline / per_hit))
+
+
+if __name__ == "__main__":
+    main()
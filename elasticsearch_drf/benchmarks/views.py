@@ -0,0 +1,224 @@
+"""
+ESModelViewSet 请求处理的基准测试
+
+通过 benchmarks.fake.FakeConnection 回放ES响应, 不依赖ES服务, 可在本地和CI中运行：
+
+python -m elasticsearch_drf.benchmarks.views [--requests 200] [--total 10000] [--latency 0.001] [--fixture docs.json]
+
+每个场景输出 每秒请求数、每个请求的ES往返次数、每个请求的内存分配峰值 以及 p50/p99 耗时：
+    shallow   第1页列表
+    deep      超出max_result_window的深分页(search_after + PIT, 检查点缓存命中后的稳定状态)
+    unpaged   不分页的列表, 返回 --unpaged-hits 条命中结果(count + 一次search)
+    scan      不分页的ndjson流式导出全部 --total 条命中结果(scroll)
+    retrieve  按_id查询单个文档
+    create    新增文档
+unpaged和scan每个请求处理大量命中结果, 只执行 --bulk-requests 次
+--fixture 为_source列表的JSON文件(如从线上索引导出的样本), 命中结果循环使用其中的文档
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+
+if "DJANGO_SETTINGS_MODULE" not in os.environ and not settings.configured:
+    settings.configure(
+        INSTALLED_APPS=["django.contrib.contenttypes", "django.contrib.auth", "rest_framework"],
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+        ALLOWED_HOSTS=["*"],
+    )
+
+import django  # noqa: E402
+
+django.setup()
+
+from django import forms  # noqa: E402
+from elasticsearch import Elasticsearch  # noqa: E402
+from elasticsearch_dsl import Date, Document, Keyword, Long, Text, connections  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from elasticsearch_drf.benchmarks.fake import FakeConnection  # noqa: E402
+from elasticsearch_drf.instrumentation import start_request_stats, stop_request_stats  # noqa: E402
+from elasticsearch_drf.settings import api_settings  # noqa: E402
+from elasticsearch_drf.viewsets import ESModelViewSet  # noqa: E402
+
+CONNECTION_ALIAS = "benchmark-views"
+
+# 内存分配只统计前N个请求, tracemalloc会显著拖慢执行
+ALLOCATION_REQUESTS = 20
+
+
+class BenchmarkDocument(Document):
+    title = Text()
+    tag = Keyword()
+    views = Long()
+    created_at = Date()
+
+    class Index:
+        name = "benchmark-views"
+        using = CONNECTION_ALIAS
+
+
+class BenchmarkForm(forms.Form):
+    title = forms.CharField()
+    tag = forms.CharField()
+    views = forms.IntegerField()
+
+
+class BenchmarkViewSet(ESModelViewSet):
+    model_class = BenchmarkDocument
+    form_class = BenchmarkForm
+    authentication_classes = []
+    throttle_classes = []
+    ordering_fields = ["views"]
+
+
+class UnpagedBenchmarkViewSet(BenchmarkViewSet):
+    pagination_class = None
+
+
+def make_documents(n=100):
+    return [
+        {"title": "document %s" % i, "tag": "tag-%s" % (i % 10), "views": i, "created_at": "2023-01-01T00:00:00"}
+        for i in range(n)
+    ]
+
+
+def get_cases(total, unpaged_hits):
+    factory = APIRequestFactory()
+    list_view = BenchmarkViewSet.as_view({"get": "list", "post": "create"})
+    unpaged_view = UnpagedBenchmarkViewSet.as_view({"get": "list"})
+    detail_view = BenchmarkViewSet.as_view({"get": "retrieve"})
+    page_size = api_settings.PAGE_SIZE
+    deep_page = api_settings.ES_MAX_OFFSET // page_size + 2
+    document = {"title": "benchmark", "tag": "tag-0", "views": 1}
+
+    # 场景名 -> (发起一次请求的函数, 本场景的索引文档总数, 是否为大结果集场景)
+    return {
+        "shallow": (lambda: list_view(factory.get("/", {"page": 1}, HTTP_ACCEPT="application/json")), total, False),
+        "deep": (
+            lambda: list_view(factory.get("/", {"page": deep_page}, HTTP_ACCEPT="application/json")),
+            total,
+            False,
+        ),
+        "unpaged": (
+            lambda: unpaged_view(factory.get("/", HTTP_ACCEPT="application/json")),
+            min(unpaged_hits, api_settings.ES_MAX_OFFSET),
+            True,
+        ),
+        "scan": (lambda: unpaged_view(factory.get("/", {"format": "ndjson"})), total, True),
+        "retrieve": (lambda: detail_view(factory.get("/", HTTP_ACCEPT="application/json"), _id="1"), total, False),
+        "create": (
+            lambda: list_view(factory.post("/", document, format="json", HTTP_ACCEPT="application/json")),
+            total,
+            False,
+        ),
+    }
+
+
+def _consume(response):
+    """渲染响应并读完流式内容, 与真实请求的耗时保持一致"""
+    if hasattr(response, "render"):
+        response.render()
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    elif not 200 <= response.status_code < 300:
+        raise RuntimeError("benchmark request failed: %s %s" % (response.status_code, response.content[:200]))
+
+
+def _percentile(durations, p):
+    durations = sorted(durations)
+    return durations[min(len(durations) - 1, int(len(durations) * p / 100))]
+
+
+def run_case(connection, request, total, requests=200, warmup=1):
+    """
+    :param connection: 注册到 CONNECTION_ALIAS 的FakeConnection
+    :param request: 发起一次请求并返回响应的函数
+    :param total: 本场景的索引文档总数
+    :return: 统计结果
+    """
+    connection.set_total(total)
+    for _ in range(warmup):
+        _consume(request())
+
+    durations = []
+    calls = 0
+    for _ in range(requests):
+        stats, token = start_request_stats()
+        start = time.perf_counter()
+        try:
+            _consume(request())
+        finally:
+            stop_request_stats(token)
+        durations.append(time.perf_counter() - start)
+        calls += stats.calls
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(min(requests, ALLOCATION_REQUESTS)):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            _consume(request())
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "rps": requests / sum(durations),
+        "round_trips": calls / requests,
+        "peak_kib": statistics.median(peaks) / 1024,
+        "p50_ms": _percentile(durations, 50) * 1000,
+        "p99_ms": _percentile(durations, 99) * 1000,
+    }
+
+
+def run(requests=200, total=10000, latency=0.0, documents=None, cases=None, unpaged_hits=1000, bulk_requests=5):
+    es = Elasticsearch(connection_class=FakeConnection, documents=documents or make_documents(), latency=latency)
+    connections.add_connection(CONNECTION_ALIAS, es)
+    connection = es.transport.get_connection()
+
+    results = {}
+    for name, (request, case_total, bulk) in get_cases(total, unpaged_hits).items():
+        if cases and name not in cases:
+            continue
+        results[name] = run_case(connection, request, case_total, bulk_requests if bulk else requests)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="每个场景的请求数")
+    parser.add_argument("--total", type=int, default=10000, help="索引文档总数, 需大于ES_MAX_OFFSET才会走深分页")
+    parser.add_argument("--unpaged-hits", type=int, default=1000, help="unpaged场景的命中条数")
+    parser.add_argument("--bulk-requests", type=int, default=5, help="unpaged和scan场景的请求数")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次ES请求的模拟往返耗时, 单位秒")
+    parser.add_argument("--fixture", help="_source列表的JSON文件")
+    parser.add_argument("--cases", nargs="*", help="只运行指定场景")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果, 便于CI比较")
+    args = parser.parse_args()
+
+    documents = None
+    if args.fixture:
+        with open(args.fixture) as f:
+            documents = json.load(f)
+
+    results = run(args.requests, args.total, args.latency, documents, args.cases, args.unpaged_hits, args.bulk_requests)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print("%-10s %10s %12s %10s %10s %10s" % ("case", "req/s", "round trips", "peak KiB", "p50 ms", "p99 ms"))
+    for name, r in results.items():
+        print(
+            "%-10s %10.1f %12.1f %10.1f %10.2f %10.2f"
+            % (name, r["rps"], r["round_trips"], r["peak_kib"], r["p50_ms"], r["p99_ms"])
+        )
+
+
+if __name__ == "__main__":
+    main()
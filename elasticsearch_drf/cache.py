@@ -0,0 +1,97 @@
+"""
+列表查询结果缓存
+
+按 索引 + 归一化的最终查询体(含分页) 缓存序列化后的JSON响应, 命中时既不请求ES也不再做JSON编码。
+每个索引维护一个代数计数器, 写操作(perform_create/perform_update/perform_destroy/perform_bulk)使其加一,
+缓存键包含当前代数, 写入后旧缓存自然失效。
+写入在ES刷新(refresh_interval)之前对查询不可见, 写入后 RESULT_CACHE_REFRESH_INTERVAL 秒内读到的可能仍是旧数据,
+这段时间内的列表结果不缓存, 避免旧数据以新的代数缓存到过期为止。
+"""
+from typing import Optional
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from elasticsearch_dsl import Search
+
+from elasticsearch_drf.settings import api_settings
+from elasticsearch_drf.utils import get_search_hash
+
+
+def _get_result_cache():
+    return caches[api_settings.RESULT_CACHE]
+
+
+def _get_generation_key(model_class) -> str:
+    return _get_index_generation_key(model_class._index._name)
+
+
+def _get_index_generation_key(index: str) -> str:
+    return "es_generation:%s" % index
+
+
+def _get_index_refreshing_key(index: str) -> str:
+    return "es_generation:%s:refreshing" % index
+
+
+def get_generation(model_class) -> int:
+    """当前索引数据的代数"""
+    return _get_result_cache().get(_get_generation_key(model_class), 0)
+
+
+def bump_generation(model_class, refreshed: bool = False):
+    """
+    索引数据已变更, 使该索引的全部结果缓存失效
+    :param model_class:
+    :param refreshed: 写入时已等待刷新(refresh=wait_for), 写入的数据已对查询可见
+    """
+    bump_index_generation(model_class._index._name, refreshed)
+
+
+def bump_index_generation(index: str, refreshed: bool = False):
+    """同bump_generation, 用于只知道索引名的场景(如写后索引队列的刷写任务)"""
+    cache = _get_result_cache()
+    key = _get_index_generation_key(index)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # 计数器恰好被淘汰
+        cache.set(key, 1, timeout=None)
+    if not refreshed and api_settings.RESULT_CACHE_REFRESH_INTERVAL:
+        cache.set(_get_index_refreshing_key(index), 1, timeout=api_settings.RESULT_CACHE_REFRESH_INTERVAL)
+
+
+def get_result_key(model_class, search: Search, *parts) -> Optional[str]:
+    """
+    :param model_class:
+    :param search: 执行的search
+    :param parts: 其他影响响应内容的参数, 如视图类名、分页参数
+    :return: 索引刚写入、数据尚未刷新时返回None, 不读写缓存
+    """
+    index = model_class._index._name
+    generation_key, refreshing_key = _get_index_generation_key(index), _get_index_refreshing_key(index)
+    # 代数和刷新标记一次读取
+    values = _get_result_cache().get_many([generation_key, refreshing_key])
+    if refreshing_key in values:
+        return None
+    search_hash = get_search_hash(search.extra(_cache_parts=[str(part) for part in parts]))
+    return "es_result:%s:%s:%s" % (index, values.get(generation_key, 0), search_hash)
+
+
+def get_cached_result(key: str):
+    return _get_result_cache().get(key)
+
+
+def set_cached_result(key: str, content: bytes, timeout: int):
+    _get_result_cache().set(key, content, timeout)
+
+
+class CachedJSONResponse(HttpResponse):
+    """
+    直接返回已序列化的JSON内容, 不再重复编码
+    不继承JsonResponse, 处理JsonResponse的中间件(如统一响应格式)不会把内容解码后重新编码, 应识别该类型直接拼接内容
+    """
+
+    def __init__(self, content, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super(CachedJSONResponse, self).__init__(content=content, **kwargs)
@@ -0,0 +1,87 @@
+"""
+分页总数的计数策略
+
+超大索引上精确计数的代价远高于取一页结果, COUNT_POLICY 控制 ESPagination 返回的 count：
+    exact      精确计数, count_relation 恒为 "eq"
+    capped     最多精确计数到 COUNT_CAP 条(track_total_hits=COUNT_CAP), 超过时 count 为 COUNT_CAP, count_relation 为 "gte"
+    estimated  没有过滤条件的查询不再计数, 直接使用进程内缓存的索引统计(primaries.docs.count),
+               最多滞后 COUNT_STATS_CACHE_TIMEOUT 秒, 索引含nested字段时该值包含nested文档,
+               不是精确值也不是下界, count_relation 为 "estimated";
+               有过滤条件的查询按 capped 处理
+"""
+import time
+
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.connections import get_connection
+
+from elasticsearch_drf.settings import api_settings
+
+COUNT_POLICIES = ("exact", "capped", "estimated")
+
+
+def is_unfiltered_search(search: Search) -> bool:
+    """查询没有任何过滤条件, 命中索引中的全部文档"""
+    d = search.to_dict()
+    return d.get("query", {"match_all": {}}) == {"match_all": {}} and "post_filter" not in d
+
+
+def get_track_total_hits(policy: str, cap: int, estimated: bool = False):
+    """
+    :param policy: 计数策略
+    :param cap: capped策略的计数上限
+    :param estimated: 总数已由索引统计给出, 查询本身无需计数
+    :return: 查询的track_total_hits参数
+    """
+    assert policy in COUNT_POLICIES, "Unknown count policy '%s', options: %s" % (policy, COUNT_POLICIES)
+    if estimated:
+        return False
+    return True if policy == "exact" else cap
+
+
+class IndexStatsCache:
+    """
+    按ES连接和索引缓存文档数, 超过 COUNT_STATS_CACHE_TIMEOUT 秒后重新获取
+    """
+
+    def __init__(self):
+        self._cache = {}
+
+    @staticmethod
+    def _get_key(search: Search):
+        return search._using, ",".join(search._index or ["_all"])
+
+    def _get_fresh(self, key):
+        entry = self._cache.get(key)
+        if entry is not None and entry["expires"] > time.monotonic():
+            return entry["count"]
+        return None
+
+    def _set(self, key, stats: dict) -> int:
+        count = stats["_all"]["primaries"]["docs"]["count"]
+        self._cache[key] = {"expires": time.monotonic() + api_settings.COUNT_STATS_CACHE_TIMEOUT, "count": count}
+        return count
+
+    def get_doc_count(self, search: Search) -> int:
+        key = self._get_key(search)
+        count = self._get_fresh(key)
+        if count is None:
+            count = self._set(key, get_connection(search._using).indices.stats(index=key[1], metric="docs"))
+        return count
+
+    async def aget_doc_count(self, search: Search, es) -> int:
+        """
+        get_doc_count的异步版本
+        :param search:
+        :param es: AsyncElasticsearch
+        """
+        key = self._get_key(search)
+        count = self._get_fresh(key)
+        if count is None:
+            count = self._set(key, await es.indices.stats(index=key[1], metric="docs"))
+        return count
+
+    def invalidate(self):
+        self._cache.clear()
+
+
+index_stats_cache = IndexStatsCache()
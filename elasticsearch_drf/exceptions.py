@@ -0,0 +1,30 @@
+"""
+Handled exceptions raised by elasticsearch_drf views.
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _("The document was modified concurrently.")
+    default_code = "conflict"
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = _("The document has changed since it was read.")
+    default_code = "precondition_failed"
+
+
+class IndexBlocked(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _("The index is being rebuilt, try again later.")
+    default_code = "index_blocked"
+
+
+class SearchTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _("The search took too long, try again later or narrow the query.")
+    default_code = "search_timeout"
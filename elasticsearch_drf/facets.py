@@ -0,0 +1,51 @@
+"""
+分面(聚合)结果缓存
+
+同一查询条件下的分面统计与分页、排序无关, 按归一化查询哈希缓存在Django cache(Redis)中,
+命中缓存时分页查询不再携带聚合, 未命中时从分页查询的响应中读取聚合结果并写入缓存。
+"""
+from django.core.cache import caches
+from elasticsearch_dsl import Search
+
+from elasticsearch_drf.settings import api_settings
+from elasticsearch_drf.utils import get_partial_status, get_search_hash
+
+# 不影响聚合结果的查询体键
+NON_FACET_KEYS = ("from", "size", "sort", "_source", "track_total_hits", "search_after", "pit", "highlight")
+
+
+def _get_facets_cache():
+    return caches[api_settings.FACETS_CACHE]
+
+
+def get_facets_key(search: Search) -> str:
+    return "es_facets:%s" % get_search_hash(search, exclude=NON_FACET_KEYS)
+
+
+def get_cached_facets(key: str):
+    return _get_facets_cache().get(key)
+
+
+def set_cached_facets(key: str, facets: dict):
+    _get_facets_cache().set(key, facets, api_settings.FACETS_CACHE_TIMEOUT)
+
+
+def parse_facets(response) -> dict:
+    """
+    :return: {分面名: 桶列表}, 非桶聚合原样返回
+    """
+    aggregations = response.to_dict().get("aggregations", {})
+    return {name: agg.get("buckets", agg) for name, agg in aggregations.items()}
+
+
+def execute_facets(search: Search, key: str) -> dict:
+    """
+    读取search响应中的聚合结果并写入缓存, 不完整(超时、分片失败)的聚合结果不缓存
+    search未执行过(如深分页走search_after)时, 单独执行一次size=0的聚合查询
+    """
+    if not hasattr(search, "_response"):
+        search = search[:0].extra(track_total_hits=False)
+    facets = parse_facets(search.execute())
+    if get_partial_status(search) is None:
+        set_cached_facets(key, facets)
+    return facets
@@ -1,11 +1,12 @@
-from functools import reduce
+from fnmatch import fnmatchcase
 
 from django.template import loader
 from django.utils.encoding import force_str
 from django.utils.translation import gettext_lazy as _
-from elasticsearch_dsl import Q
+from elasticsearch_dsl import A, Q
 from rest_framework.compat import coreapi, coreschema
 
+from elasticsearch_drf.mappings import mapping_cache
 from elasticsearch_drf.settings import api_settings
 
 
@@ -28,24 +29,96 @@ class ESBaseFilterBackend:
     def get_schema_operation_parameters(self, view):
         return []
 
+    def get_mapping_properties(self, view):
+        """
+        Top level mapping properties of the view's index, served from the process-level mapping cache.
+        """
+        model_class = getattr(view, "model_class", None)
+        assert model_class is not None
+        return mapping_cache.get_properties(model_class)
+
+    def get_field_types(self, view):
+        """
+        {field path: mapping type} of the view's index, served from the process-level mapping cache.
+        """
+        model_class = getattr(view, "model_class", None)
+        if model_class is None:
+            return {}
+        return mapping_cache.get_field_types(model_class)
+
 
 class ESFilter(ESBaseFilterBackend):
-    def get_filter_kwargs(self, request, search, view):
+    """
+    Filters by the view's `filter_fields`, in filter context so the clauses are
+    not scored and can be served from the node query cache.
+
+    Besides exact matches (?field=value), Django style lookups are supported:
+    ?field__gte=1, __gt, __lte, __lt, __in=a,b, __exists=true|false, __prefix=ab.
+    `filter_fields` is either a list of fields allowing every lookup, or a dict
+    of {field: [lookups]}, e.g. {"status": ["exact", "in"], "created_at": ["gte", "lt"]}.
+    """
+
+    lookup_sep = "__"
+    lookups = ("exact", "gt", "gte", "lt", "lte", "in", "exists", "prefix")
+    match_field_types = ("text", "match_only_text", "search_as_you_type")
+    range_field_types = ("integer_range", "float_range", "long_range", "double_range", "date_range", "ip_range")
+
+    def get_filter_lookups(self, view):
         filter_fields = getattr(view, "filter_fields", [])
+        if isinstance(filter_fields, dict):
+            return {field: tuple(lookups) for field, lookups in filter_fields.items()}
+        return {field: self.lookups for field in filter_fields}
+
+    def split_lookup(self, param):
+        field, sep, lookup = param.rpartition(self.lookup_sep)
+        if not sep or lookup not in self.lookups:
+            return param, "exact"
+        return field, lookup
+
+    def get_filter_kwargs(self, request, search, view):
+        filter_lookups = self.get_filter_lookups(view)
 
-        filter_kwargs = {k: v for k, v in request.query_params.items() if k in filter_fields}
+        filter_kwargs = {}
+        for k, v in request.query_params.items():
+            field, lookup = self.split_lookup(k)
+            if lookup in filter_lookups.get(field, ()):
+                filter_kwargs[k] = v
         return filter_kwargs
 
+    def get_field_query(self, field, value, field_type):
+        """
+        Pick the query by mapping type: full text fields are matched,
+        range fields must contain the value, anything else is an exact term.
+        """
+        if field_type in self.match_field_types:
+            return Q("match", **{field: value})
+        if field_type in self.range_field_types:
+            return Q("range", **{field: {"gte": value, "lte": value}})
+        return Q("terms" if isinstance(value, list) else "term", **{field: value})
+
+    def get_lookup_query(self, field, lookup, value, field_type):
+        if lookup == "exact":
+            return self.get_field_query(field, value, field_type)
+        if lookup == "in":
+            values = value if isinstance(value, list) else [v.strip() for v in value.split(",") if v.strip()]
+            return Q("terms", **{field: values})
+        if lookup == "exists":
+            query = Q("exists", field=field)
+            return ~query if str(value).lower() in ("false", "0") else query
+        if lookup == "prefix":
+            return Q("prefix", **{field: value})
+        return Q("range", **{field: {lookup: value}})
+
     def filter_search(self, request, search, view):
         filter_kwargs = self.get_filter_kwargs(request, search, view)
         if not filter_kwargs:
             return search
 
-        dsl = reduce(
-            lambda x, y: x & y,
-            [Q("terms" if isinstance(v, list) else "term", **{k: v}) for k, v in filter_kwargs.items()],
-        )
-        return search.query(dsl)
+        field_types = self.get_field_types(view)
+        for k, v in filter_kwargs.items():
+            field, lookup = self.split_lookup(k)
+            search = search.filter(self.get_lookup_query(field, lookup, v, field_types.get(field)))
+        return search
 
 
 class ESearchFilter(ESBaseFilterBackend):
@@ -112,6 +185,72 @@ class ESearchFilter(ESBaseFilterBackend):
         ]
 
 
+class ESSourceFilter(ESBaseFilterBackend):
+    """
+    Sparse fieldsets: ?fields=a,b / ?exclude=c are turned into `_source` includes/excludes,
+    so only the requested fields leave ES. Wildcards are allowed, unknown fields are ignored.
+    """
+
+    fields_param = api_settings.FIELDS_PARAM
+    exclude_param = api_settings.EXCLUDE_PARAM
+    fields_description = _("Comma separated fields to include in the results.")
+    exclude_description = _("Comma separated fields to exclude from the results.")
+
+    def get_fields(self, request, param, view):
+        params = request.query_params.get(param)
+        if not params:
+            return []
+
+        fields = [param.strip() for param in params.split(",") if param.strip()]
+        return self.remove_invalid_fields(fields, request, view)
+
+    def remove_invalid_fields(self, fields, request, view):
+        valid_fields = list(self.get_field_types(view))
+        return [field for field in fields if any(fnmatchcase(valid, field) for valid in valid_fields)]
+
+    def filter_search(self, request, search, view):
+        includes = self.get_fields(request, self.fields_param, view)
+        excludes = self.get_fields(request, self.exclude_param, view)
+
+        if not includes and not excludes:
+            return search
+
+        return search.source(includes=includes or None, excludes=excludes or None)
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, "coreapi must be installed to use `get_schema_fields()`"
+        assert coreschema is not None, "coreschema must be installed to use `get_schema_fields()`"
+        return [
+            coreapi.Field(
+                name=param,
+                required=False,
+                location="query",
+                schema=coreschema.String(title=param, description=force_str(description)),
+            )
+            for param, description in (
+                (self.fields_param, self.fields_description),
+                (self.exclude_param, self.exclude_description),
+            )
+        ]
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": param,
+                "required": False,
+                "in": "query",
+                "description": force_str(description),
+                "schema": {
+                    "type": "string",
+                },
+            }
+            for param, description in (
+                (self.fields_param, self.fields_description),
+                (self.exclude_param, self.exclude_description),
+            )
+        ]
+
+
 class ESOrderingFilter(ESBaseFilterBackend):
     ordering_param = api_settings.ORDERING_PARAM
     ordering_fields = None
@@ -145,13 +284,9 @@ class ESOrderingFilter(ESBaseFilterBackend):
 
     def get_valid_fields(self, request, view):
         valid_fields = getattr(view, "ordering_fields", self.ordering_fields)
-        model_class = getattr(view, "model_class", None)
-        assert model_class is not None
 
         if valid_fields is None or valid_fields == "__all__":
-            mappings = list(model_class._index.get_mapping().values())
-            properties = mappings[0]["mappings"]["properties"]
-            valid_fields = list(properties)
+            valid_fields = list(self.get_mapping_properties(view))
 
         return valid_fields
 
@@ -219,3 +354,34 @@ class ESOrderingFilter(ESBaseFilterBackend):
                 },
             },
         ]
+
+
+class ESFacetFilter(ESBaseFilterBackend):
+    """
+    Adds the aggregations declared in the view's `facets`, {name: aggregation body}, e.g.
+    {"tag": {"terms": {"field": "tag"}}, "price": {"range": {"field": "price", "ranges": [{"to": 100}]}}}.
+    They are computed by the page query itself and returned as `facets` in the paginated response.
+    ?facets=a,b restricts the facets computed for the request.
+    """
+
+    facets_param = api_settings.FACETS_PARAM
+
+    def get_facets(self, request, view):
+        facets = getattr(view, "facets", None) or {}
+        params = request.query_params.get(self.facets_param)
+        if params is None:
+            return facets
+
+        names = {param.strip() for param in params.split(",")}
+        return {name: body for name, body in facets.items() if name in names}
+
+    def filter_search(self, request, search, view):
+        facets = self.get_facets(request, view)
+        if not facets:
+            return search
+
+        # aggs.bucket() modifies the search in place
+        search = search._clone()
+        for name, body in facets.items():
+            search.aggs.bucket(name, A(body))
+        return search
@@ -1,7 +1,18 @@
-from django.http import Http404
+import copy
+
+from django.http import Http404, QueryDict
+from elasticsearch.exceptions import ConnectionTimeout, NotFoundError, TransportError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
 from rest_framework.views import APIView
 
+from elasticsearch_drf import writebehind
+from elasticsearch_drf.cache import bump_generation, get_result_key
+from elasticsearch_drf.exceptions import IndexBlocked, SearchTimeout
+from elasticsearch_drf.msearch import execute_searches
+from elasticsearch_drf.renderers import NDJSONRenderer
 from elasticsearch_drf.settings import api_settings
+from elasticsearch_drf.utils import get_partial_status
 
 
 class ESGenericAPIView(APIView):
@@ -15,10 +26,38 @@ class ESGenericAPIView(APIView):
 
     permission_classes = []
 
+    renderer_classes = [*APIView.renderer_classes, NDJSONRenderer]
+
     filter_backends = api_settings.DEFAULT_FILTER_BACKENDS
 
     pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
 
+    # 列表查询直接返回ES原始_source, 跳过elasticsearch_dsl的文档包装, 大分页时显著降低CPU开销
+    raw_hits = False
+    # raw_hits模式下合并到每条结果中的hit元数据字段, 如 ("_id", "_score")
+    raw_meta_fields = ()
+
+    # 列表查询结果缓存时间(秒), None表示不缓存
+    result_cache_timeout = None
+
+    # 列表查询的ES端超时(秒), 超时后ES返回已收集的部分结果
+    search_timeout = api_settings.SEARCH_TIMEOUT
+    # 列表查询每个分片收集的命中数上限, 达到后提前结束, 命中总数为下界
+    terminate_after = api_settings.TERMINATE_AFTER
+    # 等待ES响应的客户端超时(秒), 超时返回503, 不让慢查询长时间占用工作线程
+    request_timeout = api_settings.REQUEST_TIMEOUT
+    # 结果不完整(ES端超时、部分分片失败)时返回带 partial 标记的部分结果, 为False时返回503
+    allow_partial_results = api_settings.ALLOW_PARTIAL_RESULTS
+    # 只读的视图操作, 客户端等待超时返回503; POST的msearch同样只读
+    read_actions = ("list", "retrieve", "batch_retrieve", "msearch", "autocomplete")
+
+    # 相同的并发查询在进程内合并后再通过redis跨进程合并(需配置 SINGLE_FLIGHT_REDIS), 每次查询多几次redis往返,
+    # 只在缓存失效时大量进程同时查询的热点视图开启; 异步视图只在进程内合并
+    single_flight_redis = False
+
+    # 为True时新增和更新写入缓冲队列后直接返回202, 由Celery任务批量写入ES, 见 elasticsearch_drf.writebehind
+    write_behind = False
+
     def get_form(self, *args, **kwargs):
         assert self.form_class is not None, (
             "'%s' should either include a `form_class` attribute, "
@@ -48,7 +87,16 @@ class ESGenericAPIView(APIView):
             "attribute on the view correctly." % (self.__class__.__name__, lookup_url_kwarg)
         )
 
-        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        lookup_value = self.kwargs[lookup_url_kwarg]
+        # 按_id查找且没有过滤条件时, 直接走实时GET接口, 不占用search线程池
+        index = self.get_direct_index(search) if self.lookup_field == "_id" else None
+        if index is not None:
+            try:
+                return self.model_class.get(id=lookup_value, index=index, **self.get_source_params(search))
+            except NotFoundError:
+                raise Http404
+
+        filter_kwargs = {self.lookup_field: lookup_value}
         try:
             obj = search.query("term", **filter_kwargs).execute()[0]
         except IndexError:
@@ -56,11 +104,165 @@ class ESGenericAPIView(APIView):
 
         return obj
 
-    def filter_search(self, search):
+    def get_objects(self, lookup_values):
+        """
+        按lookup_field批量查找, 按lookup_values顺序返回, 未找到的位置为None
+        按_id查找且没有过滤条件时, 一次mget请求取回全部文档
+        """
+        search = self.filter_search(self.get_search())
+        index = self.get_direct_index(search) if self.lookup_field == "_id" else None
+        if index is not None:
+            return self.model_class.mget(lookup_values, index=index, missing="none", **self.get_source_params(search))
+
+        search = search.filter("terms", **{self.lookup_field: lookup_values})[: len(lookup_values)]
+        objs = {}
+        for obj in search.execute():
+            value = obj.meta.id if self.lookup_field == "_id" else getattr(obj, self.lookup_field, None)
+            objs.setdefault(value, obj)
+        return [objs.get(value) for value in lookup_values]
+
+    @staticmethod
+    def get_source_params(search):
+        """search中的_source过滤转换为GET/mget接口参数"""
+        source = search.to_dict().get("_source")
+        if source is None:
+            return {}
+        if not isinstance(source, dict):
+            return {"_source": source}
+        params = {}
+        if source.get("includes"):
+            params["_source_includes"] = source["includes"]
+        if source.get("excludes"):
+            params["_source_excludes"] = source["excludes"]
+        return params
+
+    @staticmethod
+    def is_unfiltered(search):
+        d = search.to_dict()
+        return "query" not in d and "post_filter" not in d
+
+    def get_direct_index(self, search):
+        """
+        可以按_id直接GET/mget的索引, 否则返回None, 按search查找
+        search没有过滤条件且只查询文档类自身的索引时返回该索引; get_search()改为查询通配符、多个索引或其他别名时,
+        文档可能不在默认索引中, GET接口也不支持指向多个索引的别名
+        """
+        if not self.is_unfiltered(search):
+            return None
+        index = self.model_class._default_index()
+        if list(search._index or [index]) != [index] or "*" in index or "," in index:
+            return None
+        return index
+
+    def filter_search(self, search, request=None):
+        """
+        :param search:
+        :param request: 默认为当前请求, 多查询接口中为各个查询构造的子请求
+        :return:
+        """
+        request = self.request if request is None else request
         for backend in list(self.filter_backends):
-            search = backend().filter_search(self.request, search, self)
+            search = backend().filter_search(request, search, self)
+        return search
+
+    def limit_search(self, search, terminate=True):
+        """
+        列表查询加上ES端超时、提前结束条数和客户端请求超时
+        :param terminate: 是否加上提前结束条数, 流式返回全部结果时不截断
+        """
+        extra = {}
+        if self.search_timeout is not None:
+            extra["timeout"] = "%dms" % (self.search_timeout * 1000)
+        if terminate and self.terminate_after is not None:
+            extra["terminate_after"] = self.terminate_after
+        if extra:
+            search = search.extra(**extra)
+        if self.request_timeout is not None:
+            search = search.params(request_timeout=self.request_timeout)
         return search
 
+    def check_partial_results(self, searches):
+        """不允许返回部分结果时, ES端超时或部分分片失败返回503; 提前结束是预期的截断, 不视为失败"""
+        if self.allow_partial_results:
+            return
+        status = get_partial_status(*searches)
+        if status is not None and (status["timed_out"] or status["failed_shards"]):
+            raise SearchTimeout
+
+    def handle_exception(self, exc):
+        # 查询时客户端等待ES响应超时, 快速返回503; 写入超时时写入可能已生效, 不作为查询超时处理
+        if isinstance(exc, ConnectionTimeout) and self.is_read_request():
+            exc = SearchTimeout()
+        # 索引重建期间源索引禁止写入
+        elif isinstance(exc, TransportError) and exc.error == "cluster_block_exception":
+            exc = IndexBlocked()
+        return super(ESGenericAPIView, self).handle_exception(exc)
+
+    def is_read_request(self):
+        action = getattr(self, "action", None)
+        if action is not None:
+            return action in self.read_actions
+        return self.request.method in SAFE_METHODS
+
+    def get_subrequest(self, params):
+        """
+        以params为url参数构造子请求, 用于在一个请求中执行多个查询
+        子请求沿用本次请求的认证方式和已认证的用户, 按用户过滤的filter backend在子请求中同样生效
+        """
+        django_request = copy.copy(self.request._request)
+        django_request.GET = QueryDict(mutable=True)
+        for key, value in params.items():
+            values = value if isinstance(value, list) else [value]
+            django_request.GET.setlist(key, [str(v) for v in values])
+        subrequest = Request(
+            django_request,
+            parsers=self.request.parsers,
+            authenticators=self.request.authenticators,
+            negotiator=self.request.negotiator,
+            parser_context=dict(self.request.parser_context),
+        )
+        # 已完成认证时直接共用结果, 不再重复认证
+        if hasattr(self.request, "_user"):
+            subrequest.user = self.request.user
+            subrequest.auth = self.request.auth
+        return subrequest
+
+    def execute_searches(self, searches):
+        """一次_msearch执行本次请求需要的多个search, 之后的读取直接使用缓存的响应"""
+        execute_searches(searches, self.single_flight_redis)
+
+    def get_result_cache_key(self, search):
+        """
+        JSON格式的列表响应才缓存, 未开启缓存时返回None
+        :param search: 分页之前的search, 键包含分页参数, 命中时不再分页(游标分页在分页时即请求ES);
+                       分页链接是绝对地址, 键同样包含请求的站点
+        """
+        if self.result_cache_timeout is None or self.request.accepted_renderer.format != "json":
+            return None
+        page_params = () if self.paginator is None else self.paginator.get_cache_params(self.request)
+        return get_result_key(
+            self.model_class,
+            search,
+            self.__class__.__qualname__,
+            self.raw_hits,
+            self.raw_meta_fields,
+            self.request.build_absolute_uri("/"),
+            *page_params,
+        )
+
+    def enqueue_write(self, action: dict):
+        """写后索引: bulk action写入缓冲队列, 列表结果缓存在刷写任务写入ES后失效"""
+        assert self.model_class is not None
+        writebehind.enqueue(self.model_class._get_using(), action)
+
+    def invalidate_cached_results(self, refreshed=False):
+        """
+        写操作后调用, 使该索引的列表结果缓存失效
+        :param refreshed: 写入时已等待刷新, 见 elasticsearch_drf.cache.bump_generation
+        """
+        if self.model_class is not None:
+            bump_generation(self.model_class, refreshed)
+
     @property
     def paginator(self):
         if not hasattr(self, "_paginator"):
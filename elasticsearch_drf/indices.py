@@ -0,0 +1,87 @@
+"""
+版本化索引与别名切换
+
+文档类的 Index.name 作为读写别名, 数据存放在 <别名>-<版本> 索引中。重建时写入新版本的索引,
+完成后在一次 update_aliases 请求中把别名从旧索引移到新索引, 切换是原子的, 查询不会中断。
+别名同名的普通索引(尚未使用别名的旧索引)在同一请求中删除, 因此无法保留。
+"""
+import time
+
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch_dsl import Index
+
+# 批量写入期间使用的索引设置, 写入完成后恢复为文档类声明的设置
+BULK_INDEX_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+
+
+def get_versioned_name(alias: str, version: str = None) -> str:
+    return "%s-%s" % (alias, version or time.strftime("%Y%m%d%H%M%S"))
+
+
+def create_versioned_index(document, version: str = None, settings: dict = None) -> str:
+    """
+    按文档类的mappings和settings创建新版本的索引
+    :param document: Document子类
+    :param version: 版本号, 默认为当前时间
+    :param settings: 覆盖文档类声明的索引设置, 如 BULK_INDEX_SETTINGS
+    :return: 新索引名
+    """
+    index = document._index.clone(get_versioned_name(document._index._name, version))
+    if settings:
+        index.settings(**settings)
+    index.create()
+    return index._name
+
+
+def restore_index_settings(document, index: str, settings: dict = None):
+    """批量写入完成后恢复settings中被覆盖的设置, 文档类未声明的设置恢复为ES默认值"""
+    declared = document._index._settings
+    body = {name: declared.get(name) for name in settings or BULK_INDEX_SETTINGS}
+    es = document._get_connection()
+    es.indices.put_settings(index=index, body={"index": body})
+    es.indices.refresh(index=index)
+
+
+def set_write_block(es, indices: list, blocked: bool):
+    """设置或解除索引的写入阻塞(index.blocks.write), 阻塞期间的写入被拒绝, 错误类型为 cluster_block_exception"""
+    es.indices.put_settings(index=",".join(indices), body={"index.blocks.write": True if blocked else None})
+
+
+def is_write_blocked(error) -> bool:
+    """bulk结果中的错误是否因索引禁止写入, 此类写入可在别名切换后重试"""
+    return isinstance(error, dict) and error.get("type") == "cluster_block_exception"
+
+
+def get_alias_indices(es, alias: str) -> list:
+    """别名当前指向的索引"""
+    try:
+        return list(es.indices.get_alias(name=alias))
+    except NotFoundError:
+        return []
+
+
+def check_keep_old(es, alias: str, delete_old: bool):
+    """别名同名的普通索引在切换时必须删除, 要求保留旧索引时在重建开始前报错"""
+    if not delete_old and not get_alias_indices(es, alias) and Index(alias).exists(using=es):
+        raise ValueError("'%s' is a concrete index, it is replaced by the alias and can not be kept." % alias)
+
+
+def swap_alias(es, alias: str, index: str, delete_old: bool = False) -> list:
+    """
+    原子地把别名切换到index
+    :param es: Elasticsearch
+    :param alias: 别名
+    :param index: 新索引
+    :param delete_old: 切换后删除别名原来指向的索引
+    :return: 别名原来指向的索引
+    """
+    check_keep_old(es, alias, delete_old)
+    old_indices = [name for name in get_alias_indices(es, alias) if name != index]
+    actions = [{"remove": {"index": name, "alias": alias}} for name in old_indices]
+    if not old_indices and Index(alias).exists(using=es):
+        actions.append({"remove_index": {"index": alias}})
+    actions.append({"add": {"index": index, "alias": alias}})
+    es.indices.update_aliases(body={"actions": actions})
+    if delete_old and old_indices:
+        es.indices.delete(index=",".join(old_indices))
+    return old_indices
@@ -0,0 +1,193 @@
+"""
+ES请求统计
+
+在elasticsearch客户端的连接层(perform_request)记录每次ES请求的服务端耗时(took)、客户端耗时和响应大小,
+按Django请求汇总到上下文变量中, 同步视图和异步视图均可使用, 例如：
+
+from elasticsearch_dsl.connections import connections
+from elasticsearch_drf.instrumentation import InstrumentedConnection
+connections.configure(default={"hosts": "localhost", "connection_class": InstrumentedConnection})
+
+异步连接(elasticsearch_drf.aio.connections)沿用同名别名的参数时自动换成 AsyncInstrumentedConnection,
+汇总结果由 common.middleware.es_instrumentation.ESInstrumentationMiddleware 输出;
+流式响应由 wrap_streaming_response 在生成内容时继续统计, 内容结束后才输出
+"""
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable
+
+from elasticsearch.connection import Urllib3HttpConnection
+
+_TOOK_RE = re.compile(r'"took"\s*:\s*(\d+)')
+
+# took是search、msearch、bulk响应的第一个字段, 只在响应开头查找, 避免扫描大响应
+_TOOK_SEARCH_LENGTH = 64
+
+
+class RequestStats:
+    """一次Django请求内的ES请求统计, 耗时单位均为毫秒"""
+
+    __slots__ = ("calls", "took", "duration", "size", "_lock")
+
+    def __init__(self):
+        self.calls = 0
+        self.took = 0
+        self.duration = 0.0
+        self.size = 0
+        # 并行导出等场景下多个线程同时记录
+        self._lock = threading.Lock()
+
+    def record(self, took: int, duration: float, size: int):
+        with self._lock:
+            self.calls += 1
+            self.took += took
+            self.duration += duration
+            self.size += size
+
+    def to_dict(self) -> dict:
+        return {"calls": self.calls, "took": self.took, "duration": round(self.duration, 3), "size": self.size}
+
+
+_request_stats: ContextVar = ContextVar("es_request_stats", default=None)
+
+
+def start_request_stats():
+    """
+    开始统计当前请求的ES请求, 返回 (统计对象, token), 请求结束后使用token调用 stop_request_stats
+    同步视图和异步视图中的ES请求都会继承当前上下文, 记录到同一个统计对象中
+    """
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def stop_request_stats(token):
+    _request_stats.reset(token)
+
+
+def get_request_stats():
+    """当前请求的统计对象, 不在统计中时返回None"""
+    return _request_stats.get()
+
+
+def _get_took(response) -> int:
+    if not isinstance(response, str):
+        return 0
+    match = _TOOK_RE.search(response[:_TOOK_SEARCH_LENGTH])
+    return int(match.group(1)) if match else 0
+
+
+def _get_size(headers, response) -> int:
+    """响应大小: 优先使用Content-Length(压缩时为传输的字节数), 没有时为解码后的长度, 不重新编码响应"""
+    length = headers.get("content-length") if headers else None
+    if length is not None:
+        try:
+            return int(length)
+        except ValueError:
+            pass
+    return len(response) if isinstance(response, (str, bytes)) else 0
+
+
+def _record(headers, response, duration: float):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.record(_get_took(response), duration * 1000, _get_size(headers, response))
+
+
+def _record_error(duration: float):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.record(0, duration * 1000, 0)
+
+
+class InstrumentationMixin:
+    """
+    Connection混入类, 包装perform_request记录统计, 成功和失败的请求都计入, 失败的请求只计入次数和耗时
+    """
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        start = time.time()
+        try:
+            status, response_headers, data = super(InstrumentationMixin, self).perform_request(
+                method, url, params, body, timeout=timeout, ignore=ignore, headers=headers
+            )
+        except Exception:
+            _record_error(time.time() - start)
+            raise
+        _record(response_headers, data, time.time() - start)
+        return status, response_headers, data
+
+
+class AsyncInstrumentationMixin:
+    """InstrumentationMixin的异步版本, 用于AIOHttpConnection"""
+
+    async def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        start = time.time()
+        try:
+            status, response_headers, data = await super(AsyncInstrumentationMixin, self).perform_request(
+                method, url, params, body, timeout=timeout, ignore=ignore, headers=headers
+            )
+        except Exception:
+            _record_error(time.time() - start)
+            raise
+        _record(response_headers, data, time.time() - start)
+        return status, response_headers, data
+
+
+class InstrumentedConnection(InstrumentationMixin, Urllib3HttpConnection):
+    pass
+
+
+_DONE = object()
+
+
+def iter_with_request_stats(iterator, stats: RequestStats, on_close: Callable = None):
+    """
+    流式响应的内容在视图返回之后才逐块生成, 此时已不在统计的上下文中;
+    生成每一块时把stats设置为当前请求的统计, 迭代结束或被关闭时调用on_close
+    """
+    try:
+        iterator = iter(iterator)
+        while True:
+            token = _request_stats.set(stats)
+            try:
+                part = next(iterator, _DONE)
+            finally:
+                _request_stats.reset(token)
+            if part is _DONE:
+                return
+            yield part
+    finally:
+        if on_close is not None:
+            on_close()
+
+
+async def aiter_with_request_stats(iterator, stats: RequestStats, on_close: Callable = None):
+    """iter_with_request_stats的异步版本, 结束时同时关闭iterator"""
+    try:
+        while True:
+            token = _request_stats.set(stats)
+            try:
+                part = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                _request_stats.reset(token)
+            yield part
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+        if on_close is not None:
+            on_close()
+
+
+def wrap_streaming_response(response, stats: RequestStats, on_close: Callable = None):
+    """
+    流式响应生成内容时的ES请求同样计入stats, 内容迭代结束或响应被关闭时调用on_close(如记录日志)
+    响应头在开始发送内容之前就已确定, Server-Timing 只能包含视图返回之前的ES请求
+    """
+    if getattr(response, "is_async", False):
+        response.streaming_content = aiter_with_request_stats(response.async_streaming_content, stats, on_close)
+    else:
+        response.streaming_content = iter_with_request_stats(response.streaming_content, stats, on_close)
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from elasticsearch_drf import sync
+from elasticsearch_drf.settings import api_settings
+
+
+class Command(BaseCommand):
+    help = "从数据库全量重建已注册模型的ES索引, 写入新版本的索引后原子地切换别名"
+
+    def add_arguments(self, parser):
+        parser.add_argument("models", nargs="*", help="模型label, 如 usermanage.User, 默认为全部已注册的模型")
+        parser.add_argument("--parallel", type=int, default=4, help="并行写入的线程数")
+        parser.add_argument("--batch-size", type=int, default=api_settings.BULK_CHUNK_SIZE, help="每次读取的行数")
+        parser.add_argument("--keep-old", action="store_true", help="切换别名后保留旧索引")
+
+    def handle(self, *args, **options):
+        labels = options["models"] or list(sync.get_registered())
+        for label in labels:
+            start = time.monotonic()
+            try:
+                index, count = sync.rebuild(
+                    label, options["parallel"], options["batch_size"], delete_old=not options["keep_old"]
+                )
+            except (LookupError, ValueError) as e:
+                raise CommandError(e)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "%s: %s documents indexed into %s in %.1fs" % (label, count, index, time.monotonic() - start)
+                )
+            )
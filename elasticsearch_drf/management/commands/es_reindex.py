@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from elasticsearch_drf import reindex, sync
+
+
+def parse_slices(value: str):
+    """--slices 的值, "auto" 或正整数"""
+    if value == "auto":
+        return value
+    if not value.isdigit() or int(value) < 1:
+        raise CommandError('--slices must be "auto" or a positive integer, got %r.' % value)
+    return int(value)
+
+
+class Command(BaseCommand):
+    help = "按文档类当前的mapping零停机重建ES索引: _reindex到新版本的索引后原子地切换别名"
+
+    def add_arguments(self, parser):
+        parser.add_argument("documents", nargs="+", help="文档类路径如 usermanage.documents.UserDocument, 或已注册同步的模型label")
+        parser.add_argument("--slices", default="auto", help='并行切片数, 默认"auto"(每个分片一个切片)')
+        parser.add_argument("--requests-per-second", type=float, default=None, help="每秒写入的文档数上限, 默认不限速")
+        parser.add_argument("--poll-interval", type=float, default=None, help="进度轮询间隔, 单位秒")
+        parser.add_argument("--keep-old", action="store_true", help="切换别名后保留旧索引")
+
+    def get_document(self, name):
+        try:
+            return sync.get_registered(name)[1]
+        except LookupError:
+            pass
+        try:
+            return import_string(name)
+        except ImportError as e:
+            raise CommandError(e)
+
+    def write_progress(self, progress):
+        done = progress["created"] + progress["updated"] + progress["version_conflicts"]
+        self.stdout.write(
+            "  %s/%s documents, %s batches, throttled %.1fs"
+            % (done, progress["total"], progress["batches"], progress["throttled_millis"] / 1000)
+        )
+
+    def handle(self, *args, **options):
+        slices = parse_slices(str(options["slices"]))
+        for name in options["documents"]:
+            document = self.get_document(name)
+            start = time.monotonic()
+            try:
+                index, progress = reindex.reindex(
+                    document,
+                    slices=slices,
+                    requests_per_second=options["requests_per_second"],
+                    delete_old=not options["keep_old"],
+                    poll_interval=options["poll_interval"],
+                    on_progress=self.write_progress,
+                )
+            except (reindex.ReindexError, ValueError) as e:
+                raise CommandError(e)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "%s: %s documents reindexed into %s, %s writes during the copy caught up, in %.1fs"
+                    % (name, progress["created"], index, progress["caught_up"], time.monotonic() - start)
+                )
+            )
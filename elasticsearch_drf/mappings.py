@@ -0,0 +1,88 @@
+"""
+进程级ES索引mapping缓存
+
+过滤、排序等后端校验字段时不再每个请求都向ES查询mapping, 例如：
+
+from elasticsearch_drf.mappings import mapping_cache
+mapping_cache.get_field_types(MyDocument)  # {"title": "text", "title.keyword": "keyword", ...}
+mapping_cache.invalidate(MyDocument)  # 索引mapping变更后显式失效
+"""
+import time
+from typing import Dict
+
+from elasticsearch_drf.settings import api_settings
+
+
+def _flatten_field_types(properties: dict, prefix: str = "") -> Dict[str, str]:
+    """
+    将mapping properties展开为 {字段路径: 字段类型}, 包含object/nested子字段和multi-fields
+    """
+    field_types = {}
+    for name, field in properties.items():
+        path = prefix + name
+        field_types[path] = field.get("type", "object")
+        if "properties" in field:
+            field_types.update(_flatten_field_types(field["properties"], path + "."))
+        if "fields" in field:
+            field_types.update(_flatten_field_types(field["fields"], path + "."))
+    return field_types
+
+
+class MappingCache:
+    """
+    按ES连接和索引缓存mapping, 超过 MAPPING_CACHE_TIMEOUT 秒后重新获取
+    """
+
+    def __init__(self):
+        self._cache = {}
+
+    @staticmethod
+    def _get_key(model_class):
+        return model_class._get_using(), model_class._index._name
+
+    @staticmethod
+    def _make_entry(mapping: dict) -> dict:
+        properties = list(mapping.values())[0]["mappings"].get("properties", {})
+        return {
+            "expires": time.monotonic() + api_settings.MAPPING_CACHE_TIMEOUT,
+            "properties": properties,
+            "field_types": _flatten_field_types(properties),
+        }
+
+    def _is_fresh(self, key) -> bool:
+        entry = self._cache.get(key)
+        return entry is not None and entry["expires"] > time.monotonic()
+
+    def _get_entry(self, model_class):
+        key = self._get_key(model_class)
+        if not self._is_fresh(key):
+            self._cache[key] = self._make_entry(model_class._index.get_mapping())
+        return self._cache[key]
+
+    async def aload(self, model_class, es):
+        """
+        通过异步ES客户端加载(已缓存且未过期时跳过)model_class的mapping, 之后的同步读取不再请求ES
+        :param model_class:
+        :param es: AsyncElasticsearch
+        """
+        key = self._get_key(model_class)
+        if not self._is_fresh(key):
+            self._cache[key] = self._make_entry(await es.indices.get_mapping(index=model_class._index._name))
+
+    def get_properties(self, model_class) -> dict:
+        """索引mapping的顶层properties"""
+        return self._get_entry(model_class)["properties"]
+
+    def get_field_types(self, model_class) -> Dict[str, str]:
+        """索引全部字段(含子字段)的类型"""
+        return self._get_entry(model_class)["field_types"]
+
+    def invalidate(self, model_class=None):
+        """使model_class对应索引的mapping缓存失效, 未指定model_class时全部失效"""
+        if model_class is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(self._get_key(model_class), None)
+
+
+mapping_cache = MappingCache()
@@ -1,8 +1,30 @@
+import uuid
+from collections import OrderedDict
+
+from django.http import Http404, StreamingHttpResponse
+from elasticsearch import helpers
+from elasticsearch.exceptions import ConflictError, NotFoundError
 from rest_framework import status
-from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, NotFound, ValidationError
 from rest_framework.response import Response
 
-from elasticsearch_drf.utils import get_search_data
+from elasticsearch_drf.autocomplete import (
+    AUTOCOMPLETE_FIELD_TYPES,
+    filter_suggestions,
+    get_autocomplete_key,
+    get_autocomplete_search,
+    get_scope_search,
+    parse_suggestions,
+    prefix_cache,
+)
+from elasticsearch_drf.cache import CachedJSONResponse, get_cached_result, set_cached_result
+from elasticsearch_drf.exceptions import Conflict, PreconditionFailed
+from elasticsearch_drf.mappings import mapping_cache
+from elasticsearch_drf.reindex import record_bulk_deletes, record_deletes
+from elasticsearch_drf.renderers import NDJSONRenderer, StreamingJSONRenderer
+from elasticsearch_drf.settings import api_settings
+from elasticsearch_drf.utils import get_partial_status, get_search_data, iter_search_data
 
 
 class ESCreateModelMixin:
@@ -10,54 +32,404 @@ class ESCreateModelMixin:
         form = self.get_form(data=request.data)
         if form.is_valid() is False:
             raise ValidationError(form.errors)
-        self.perform_create(form)
-        return Response(form.cleaned_data, status=status.HTTP_201_CREATED)
+        doc = self.perform_create(form)
+        return Response(get_create_data(doc, form, self.write_behind), status=get_create_status(self.write_behind))
 
     def perform_create(self, form):
         assert self.model_class is not None
-        self.model_class(**form.cleaned_data).save()
+        doc = self.model_class(**form.cleaned_data)
+        if self.write_behind:
+            doc.full_clean()
+            self.enqueue_write(get_index_action(doc))
+            return doc
+        doc.save()
+        self.invalidate_cached_results()
+        return doc
 
 
 class ESListModelMixin:
+    # 为True时流式返回全部查询结果(不分页); 单个请求也可通过 ?format=ndjson 开启
+    stream = False
+
     def list(self, request, *args, **kwargs):
         search = self.filter_search(self.get_search())
 
-        page_search = self.paginate_search(search)
+        if self.stream or isinstance(request.accepted_renderer, NDJSONRenderer):
+            return self.get_streaming_response(self.get_stream_search(self.limit_search(search, terminate=False)))
+
+        limited = self.limit_search(search)
+        cache_key = self.get_result_cache_key(limited)
+        if cache_key is not None:
+            content = get_cached_result(cache_key)
+            if content is not None:
+                return CachedJSONResponse(content)
+
+        page_search = self.paginate_search(limited)
+
+        searches = []
         if page_search is not None:
-            data = get_search_data(page_search)
-            return self.get_paginated_response(data)
+            searches = [page_search, *self.paginator.get_searches()]
+            self.execute_searches(searches)
+            self.check_partial_results(searches)
+            data = get_search_data(page_search, self.raw_hits, self.raw_meta_fields)
+            response = self.get_paginated_response(data)
+        else:
+            # 不分页的结果没有命中总数和partial标记, 不加提前结束条数, 以免结果被悄悄截断
+            search = self.limit_search(search, terminate=False)
+            response = Response(get_search_data(search, self.raw_hits, self.raw_meta_fields))
+
+        # 不完整的结果不缓存
+        if cache_key is not None and get_partial_status(*searches) is None:
+            return self.cache_response(cache_key, response)
+        return response
+
+    @action(detail=False, methods=["post"])
+    def msearch(self, request, *args, **kwargs):
+        """
+        多个命名查询合并为一次_msearch, 按名称返回各自的列表结果
+        请求体为 {名称: list接口的url参数, ...}, 如 {"latest": {"ordering": "-created_at", "size": 5}, "t1": {"tag": "t1"}}
+        """
+        queries = []
+        for name, params in self.get_msearch_queries(request).items():
+            subrequest = self.get_subrequest(params)
+            search = self.filter_search(self.get_search(), subrequest)
+            paginator = None if self.pagination_class is None else self.pagination_class()
+            page_search = (
+                None
+                if paginator is None
+                else paginator.paginate_search(self.limit_search(search), subrequest, view=self)
+            )
+            # 与list相同, 不分页时不加提前结束条数
+            search = self.limit_search(search, terminate=page_search is not None)
+            queries.append((name, search, paginator, page_search))
+
+        searches = []
+        for name, search, paginator, page_search in queries:
+            if page_search is not None:
+                searches.extend([page_search, *paginator.get_searches()])
+        self.execute_searches(searches)
+        self.check_partial_results(searches)
+
+        results = OrderedDict()
+        for name, search, paginator, page_search in queries:
+            if page_search is None:
+                results[name] = get_search_data(search, self.raw_hits, self.raw_meta_fields)
+            else:
+                data = get_search_data(page_search, self.raw_hits, self.raw_meta_fields)
+                results[name] = paginator.get_paginated_response(data).data
+        return Response(results)
+
+    def get_msearch_queries(self, request):
+        queries = request.data
+        if not isinstance(queries, dict) or not queries:
+            raise ValidationError("Expected a dict of {name: query params}.")
+        if len(queries) > api_settings.MSEARCH_MAX_QUERIES:
+            raise ValidationError("At most %d queries are allowed." % api_settings.MSEARCH_MAX_QUERIES)
+        for name, params in queries.items():
+            if not isinstance(params, dict):
+                raise ValidationError({name: ["Expected a dict of query params."]})
+        return queries
+
+    def cache_response(self, cache_key, response):
+        """将响应序列化后写入缓存, 命中与未命中返回相同的内容"""
+        renderer = self.request.accepted_renderer
+        content = renderer.render(response.data, self.request.accepted_media_type, self.get_renderer_context())
+        set_cached_result(cache_key, content, self.result_cache_timeout)
+        return CachedJSONResponse(content)
+
+    def get_stream_search(self, search):
+        """流式返回时 ?size= 限制返回的条数, get_search中已有[:n]切片时取两者中较小的"""
+        param = api_settings.PAGE_SIZE_QUERY_PARAM
+        if param not in self.request.query_params:
+            return search
+        try:
+            size = int(self.request.query_params[param])
+        except ValueError:
+            size = 0
+        if size <= 0:
+            raise ValidationError({param: ["A positive integer is required."]})
+        limit = search.to_dict().get("size")
+        return search.extra(size=size if limit is None else min(size, limit))
+
+    def get_streaming_response(self, search):
+        """
+        边从ES分批拉取边输出, 内存占用恒定, 客户端无需等待全部结果即可开始接收
+        ?format=ndjson 时每行一个文档, 否则输出JSON数组
+        ASGI部署需使用 elasticsearch_drf.asgi.get_asgi_application, Django自带的handler在事件循环中迭代流式响应,
+        导出期间阻塞整个worker
+        """
+        renderer = self.request.accepted_renderer
+        if not isinstance(renderer, StreamingJSONRenderer):
+            renderer = StreamingJSONRenderer()
+        data = iter_search_data(search, self.raw_hits, self.raw_meta_fields)
+        return StreamingHttpResponse(renderer.render_stream(data), content_type=renderer.media_type)
+
+
+def get_create_status(write_behind: bool) -> int:
+    return status.HTTP_202_ACCEPTED if write_behind else status.HTTP_201_CREATED
+
+
+def get_create_data(doc, form, write_behind: bool) -> dict:
+    """写入缓冲队列时文档尚未写入ES, 响应带上入队时生成的_id"""
+    if write_behind:
+        return {"_id": doc.meta.id, **form.cleaned_data}
+    return form.cleaned_data
+
+
+def get_index_action(doc) -> dict:
+    """
+    新增文档的bulk action
+    入队时即生成_id, 刷写任务至少执行一次(at-least-once), 重放同一action只会覆盖写入同一文档, 不会产生重复文档
+    """
+    if "id" not in doc.meta:
+        doc.meta.id = uuid.uuid4().hex
+    return {
+        "_op_type": "index",
+        "_index": doc._get_index(),
+        "_id": doc.meta.id,
+        "_source": doc.to_dict(skip_empty=True),
+    }
 
-        return Response(get_search_data(search))
+
+def get_update_action(index: str, _id, body: dict, concurrency: dict) -> dict:
+    """
+    :param index: 文档所在的索引
+    :param body: update接口请求体, {"doc": ...} 或 {"script": ...}
+    :param concurrency: get_concurrency_params()的结果, 只支持retry_on_conflict
+    """
+    return {"_op_type": "update", "_index": index, "_id": _id, **body, **concurrency}
+
+
+# 批量写入中按视图过滤范围限定的操作, 及其对应的单条写入钩子(按优先顺序)
+BULK_SCOPED_OP_TYPES = ("update", "delete")
+BULK_WRITE_HOOKS = {"update": ("perform_update", "perform_partial_update"), "delete": ("perform_destroy",)}
+
+
+def get_bulk_ids(actions) -> list:
+    """批量更新和删除的_id"""
+    return [i["_id"] for i in actions if i.get("_op_type") in BULK_SCOPED_OP_TYPES]
+
+
+def get_bulk_id_chunks(ids: list):
+    """按max_result_window分批, 每批一次ids查询"""
+    for i in range(0, len(ids), api_settings.ES_MAX_OFFSET):
+        yield ids[i : i + api_settings.ES_MAX_OFFSET]
+
+
+def is_write_behind_update(write_behind: bool, body: dict, concurrency: dict) -> bool:
+    """
+    只有不带 If-Match 的doc更新写入缓冲队列;
+    脚本更新(如increment)不是幂等的, 刷写任务重放时会重复执行, 总是同步写入
+    """
+    return write_behind and "retry_on_conflict" in concurrency and "script" not in body
+
+
+def get_etag_headers(seq_no, primary_term):
+    """文档版本作为ETag返回, 更新时通过 If-Match 请求头带回做乐观并发控制"""
+    if seq_no is None or primary_term is None:
+        return None
+    return {"ETag": '"%s:%s"' % (seq_no, primary_term)}
 
 
 class ESRetrieveModelMixin:
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        return Response(instance.to_dict())
+        headers = get_etag_headers(getattr(instance.meta, "seq_no", None), getattr(instance.meta, "primary_term", None))
+        return Response(instance.to_dict(), headers=headers)
+
+    @action(detail=False, methods=["get"])
+    def batch_retrieve(self, request, *args, **kwargs):
+        """?ids=a,b,c 批量查询, 按ids顺序返回, 未找到的位置为null"""
+        instances = self.get_objects(self.get_batch_ids(request))
+        return Response([None if instance is None else instance.to_dict() for instance in instances])
+
+    def get_batch_ids(self, request):
+        ids_param = api_settings.IDS_PARAM
+        ids = [i.strip() for i in request.query_params.get(ids_param, "").split(",") if i.strip()]
+        if not ids:
+            raise ValidationError({ids_param: ["This field is required."]})
+        # 超过max_result_window时按search查找会被ES拒绝
+        if len(ids) > api_settings.ES_MAX_OFFSET:
+            raise ValidationError({ids_param: ["At most %d ids are allowed." % api_settings.ES_MAX_OFFSET]})
+        return ids
+
+
+class ESAutocompleteModelMixin:
+    """
+    自动补全, 基于视图 autocomplete_field 声明的 completion 或 search_as_you_type 字段
+    ?prefix=ab 返回 [{"_id": 文档id, "text": 补全文本}, ...]
+    """
+
+    autocomplete_field = None
+    autocomplete_size = api_settings.AUTOCOMPLETE_SIZE
+
+    @action(detail=False, methods=["get"])
+    def autocomplete(self, request, *args, **kwargs):
+        prefix = self.get_autocomplete_prefix(request)
+        if not prefix:
+            return Response([])
+
+        search = self.filter_search(self.get_search())
+        suggest_search = self.get_autocomplete_search(search, prefix)
+        cache_key = get_autocomplete_key(suggest_search, prefix)
+        suggestions = None if cache_key is None else prefix_cache.get(cache_key)
+        if suggestions is None:
+            suggestions = parse_suggestions(suggest_search.execute(), self.autocomplete_field)
+            if self.needs_suggestion_scope(search, suggestions):
+                suggestions = filter_suggestions(suggestions, get_scope_search(search, suggestions).execute())
+            if cache_key is not None:
+                prefix_cache.set(cache_key, suggestions)
+        return Response(suggestions)
+
+    def get_autocomplete_prefix(self, request):
+        if self.autocomplete_field is None:
+            raise NotFound("Autocomplete is not enabled.")
+        return request.query_params.get(api_settings.AUTOCOMPLETE_PARAM, "").strip()
+
+    def get_autocomplete_field_type(self):
+        field_type = mapping_cache.get_field_types(self.model_class).get(self.autocomplete_field)
+        assert (
+            field_type in AUTOCOMPLETE_FIELD_TYPES
+        ), "'%s.autocomplete_field' should be a completion or search_as_you_type field, got '%s'." % (
+            self.__class__.__name__,
+            field_type,
+        )
+        return field_type
+
+    def get_autocomplete_search(self, search, prefix):
+        """
+        :param search: 经过滤后端处理后的search
+        :param prefix: 用户输入的前缀
+        """
+        field_type = self.get_autocomplete_field_type()
+        return get_autocomplete_search(search, self.autocomplete_field, field_type, prefix, self.autocomplete_size)
+
+    def needs_suggestion_scope(self, search, suggestions):
+        """completion建议不受查询条件限制, 视图有过滤条件时需再查询一次过滤范围"""
+        return (
+            bool(suggestions) and not self.is_unfiltered(search) and self.get_autocomplete_field_type() == "completion"
+        )
 
 
 class ESUpdateModelMixin:
+    """
+    按_id更新且没有过滤条件时, 一次update请求完成更新, 并返回update接口给出的更新后_source
+    请求头 If-Match 带上retrieve/update响应中的ETag时按 if_seq_no/if_primary_term 做乐观并发控制,
+    版本不一致返回412; 否则版本冲突时由ES重试 update_retry_on_conflict 次
+    开启write_behind时, 不带 If-Match 的更新写入缓冲队列并返回202, 不返回更新后的_source; increment总是同步更新
+    perform_update(instance, data) 把校验后的数据转为 {"doc": ...} 后交给 perform_partial_update(_id, index, body),
+    increment 直接调用 perform_partial_update; 需要修改update请求体或换用其他写入方式时重写 perform_partial_update
+    """
+
+    update_retry_on_conflict = 3
+    # 允许通过 increment 接口原子增减的数值字段
+    increment_fields = ()
+    # 参数化的固定脚本, ES只需编译一次
+    increment_script = (
+        "for (entry in params.increments.entrySet()) {"
+        " def value = ctx._source[entry.getKey()];"
+        " ctx._source[entry.getKey()] = (value == null ? 0 : value) + entry.getValue(); }"
+    )
+
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop("partial", False)
-        instance = self.get_object()
         form = self.get_form(data=request.data, partial=partial)
         if form.is_valid() is False:
             raise ValidationError(form.errors)
         data = form.cleaned_data
         if partial:
             data = {k: v for k, v in data.items() if k in request.data}
-        self.perform_update(instance, data)
-        return Response({**instance.to_dict(), **data})
-
-    def perform_update(self, instance, data):
-        if not data:
-            return
-        instance.update(**data)
+        result = self.perform_update(self.get_update_instance(), data)
+        return self.get_update_response(result)
 
     def partial_update(self, request, *args, **kwargs):
         kwargs["partial"] = True
         return self.update(request, *args, **kwargs)
 
+    @action(detail=True, methods=["post"])
+    def increment(self, request, *args, **kwargs):
+        """{"字段": 增量, ...} 原子增减 increment_fields 中的数值字段, 返回更新后的_source"""
+        script = {
+            "source": self.increment_script,
+            "lang": "painless",
+            "params": {"increments": self.get_increments(request)},
+        }
+        instance = self.get_update_instance()
+        result = self.perform_partial_update(instance.meta.id, instance.meta.index, {"script": script})
+        return self.get_update_response(result)
+
+    def get_increments(self, request):
+        if not isinstance(request.data, dict) or not request.data:
+            raise ValidationError("Expected a dict of {field: delta}.")
+        errors = {}
+        for field, delta in request.data.items():
+            if field not in self.increment_fields:
+                errors[field] = ["This field can not be incremented."]
+            elif isinstance(delta, bool) or not isinstance(delta, (int, float)):
+                errors[field] = ["A number is required."]
+        if errors:
+            raise ValidationError(errors)
+        return request.data
+
+    def get_update_instance(self):
+        """
+        按_id查找且没有过滤条件时直接使用url中的_id, 不再查询文档, 返回只有meta(_id和索引)的文档;
+        否则先在过滤范围内查出文档, 保证只能更新视图范围内的文档, 更新写入该文档实际所在的索引
+        """
+        index = self.get_direct_index(self.filter_search(self.get_search())) if self.lookup_field == "_id" else None
+        if index is not None:
+            return self.model_class(
+                meta={"id": self.kwargs[self.lookup_url_kwarg or self.lookup_field], "index": index}
+            )
+        return self.get_object()
+
+    def get_concurrency_params(self):
+        if_match = self.request.headers.get("If-Match")
+        if if_match is None:
+            return {"retry_on_conflict": self.update_retry_on_conflict}
+        try:
+            seq_no, primary_term = if_match.strip().strip('"').split(":")
+            return {"if_seq_no": int(seq_no), "if_primary_term": int(primary_term)}
+        except ValueError:
+            raise ValidationError({"If-Match": ['Expected the ETag "<seq_no>:<primary_term>".']})
+
+    def perform_update(self, instance, data):
+        """
+        :param instance: 待更新的文档, 直接按_id更新时只有meta中的_id和索引
+        :param data: 校验后的待更新字段
+        :return: perform_partial_update的结果
+        """
+        doc = self.model_class(**data).to_dict(skip_empty=False)
+        return self.perform_partial_update(instance.meta.id, instance.meta.index, {"doc": doc})
+
+    def perform_partial_update(self, _id, index, body):
+        """
+        :param _id: 文档_id
+        :param index: 文档所在的索引
+        :param body: update接口请求体, {"doc": ...} 或 {"script": ...}
+        :return: update接口响应, 包含更新后的_source; 写入缓冲队列时返回None
+        """
+        assert self.model_class is not None
+        concurrency = self.get_concurrency_params()
+        if is_write_behind_update(self.write_behind, body, concurrency):
+            self.enqueue_write(get_update_action(index, _id, body, concurrency))
+            return None
+        es = self.model_class._get_connection()
+        try:
+            result = es.update(index=index, id=_id, body=body, _source=True, **concurrency)
+        except NotFoundError:
+            raise Http404
+        except ConflictError:
+            raise PreconditionFailed if "if_seq_no" in concurrency else Conflict
+        self.invalidate_cached_results()
+        return result
+
+    def get_update_response(self, result):
+        if result is None:
+            return Response(status=status.HTTP_202_ACCEPTED)
+        headers = get_etag_headers(result.get("_seq_no"), result.get("_primary_term"))
+        return Response(result["get"]["_source"], headers=headers)
+
 
 class ESDestroyModelMixin:
     def destroy(self, request, *args, **kwargs):
@@ -66,4 +438,196 @@ class ESDestroyModelMixin:
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def perform_destroy(self, instance):
+        record_deletes(instance._get_index(), [instance.meta.id])
         instance.delete()
+        self.invalidate_cached_results()
+
+
+class ESBulkModelMixin:
+    """
+    批量写入, 请求体为数据列表, 每条数据经form_class校验后通过 helpers.streaming_bulk 分批发送到ES
+    ?refresh=false|wait_for 控制写入后的刷新策略, 响应按请求顺序返回每条数据的处理结果
+    视图有过滤条件时, 批量更新和删除只作用于过滤范围内的文档, 范围外的_id返回404;
+    视图重写了 perform_update/perform_partial_update/perform_destroy 时, 批量更新和删除逐条调用这些钩子, 不合并为bulk请求
+    """
+
+    bulk_refresh_policies = ("false", "wait_for")
+    # 单条写入钩子的默认实现, 与bulk请求等效
+    default_write_hooks = (
+        ESUpdateModelMixin.perform_update,
+        ESUpdateModelMixin.perform_partial_update,
+        ESDestroyModelMixin.perform_destroy,
+    )
+
+    @action(detail=False, methods=["post"])
+    def bulk_create(self, request, *args, **kwargs):
+        """[{"_id": 可选, 字段...}, ...]"""
+        actions = []
+        for item in self.get_bulk_items(request):
+            _id, data, error = self.parse_bulk_item(item, id_required=False)
+            if error is not None:
+                actions.append({"_id": _id, "status": status.HTTP_400_BAD_REQUEST, "error": error})
+                continue
+            form = self.get_form(data=data)
+            if form.is_valid() is False:
+                actions.append({"_id": _id, "status": status.HTTP_400_BAD_REQUEST, "error": form.errors})
+                continue
+            doc = self.model_class(**form.cleaned_data)
+            if _id is not None:
+                doc.meta.id = _id
+            actions.append({"_op_type": "index", **doc.to_dict(include_meta=True)})
+        return self.get_bulk_response(actions)
+
+    @action(detail=False, methods=["post"])
+    def bulk_update(self, request, *args, **kwargs):
+        """[{"_id": 必填, 待更新字段...}, ...]"""
+        actions = []
+        for item in self.get_bulk_items(request):
+            _id, data, error = self.parse_bulk_item(item)
+            if error is not None:
+                actions.append({"_id": _id, "status": status.HTTP_400_BAD_REQUEST, "error": error})
+                continue
+            form = self.get_form(data=data, partial=True)
+            if form.is_valid() is False:
+                actions.append({"_id": _id, "status": status.HTTP_400_BAD_REQUEST, "error": form.errors})
+                continue
+            data = {k: v for k, v in form.cleaned_data.items() if k in data}
+            doc = self.model_class(**data).to_dict(skip_empty=False)
+            action = {"_op_type": "update", "_id": _id, "doc": doc}
+            if self.get_write_hook("update") is not None:
+                # 只交给单条写入钩子, 不发送到ES
+                action["data"] = data
+            actions.append(action)
+        return self.get_bulk_response(actions)
+
+    @action(detail=False, methods=["post"])
+    def bulk_destroy(self, request, *args, **kwargs):
+        """["_id", ...] 或 [{"_id": ...}, ...]"""
+        actions = []
+        for item in self.get_bulk_items(request):
+            _id, _, error = self.parse_bulk_item(item if isinstance(item, dict) else {"_id": item})
+            if error is not None:
+                actions.append({"_id": _id, "status": status.HTTP_400_BAD_REQUEST, "error": error})
+                continue
+            actions.append({"_op_type": "delete", "_id": _id})
+        return self.get_bulk_response(actions)
+
+    @staticmethod
+    def parse_bulk_item(item, id_required=True):
+        """
+        :param item: 请求体中的一条数据
+        :param id_required: _id是否必填
+        :return: (_id, 其余字段, 校验错误), 校验通过时错误为None
+        """
+        if not isinstance(item, dict):
+            return None, None, {"non_field_errors": ["Expected an object."]}
+        data = dict(item)
+        _id = data.pop("_id", None)
+        if _id is None:
+            return None, data, {"_id": ["This field is required."]} if id_required else None
+        if isinstance(_id, bool) or not isinstance(_id, (str, int)) or _id == "":
+            return None, data, {"_id": ["Expected a string or an integer."]}
+        return str(_id), data, None
+
+    def get_bulk_items(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError("Expected a list of items.")
+        return request.data
+
+    def get_bulk_refresh(self):
+        refresh = self.request.query_params.get("refresh", "false")
+        if refresh not in self.bulk_refresh_policies:
+            raise ValidationError({"refresh": ["Must be one of: %s." % ", ".join(self.bulk_refresh_policies)]})
+        return refresh
+
+    def get_bulk_response(self, actions):
+        # 校验失败的数据(带status)不发送到ES, 直接作为结果返回
+        refresh = self.get_bulk_refresh()
+        ids = get_bulk_ids(actions)
+        if ids:
+            actions = self.scope_bulk_actions(actions, self.get_bulk_indices(ids))
+        es_results = self.perform_bulk([i for i in actions if "_op_type" in i], refresh)
+        return self.build_bulk_response(actions, es_results)
+
+    def get_bulk_indices(self, ids):
+        """
+        :param ids: 批量更新和删除的_id
+        :return: {_id: 文档所在的索引}, 不在视图过滤范围内的_id不包含在内
+        """
+        search = self.filter_search(self.get_search())
+        index = self.get_direct_index(search)
+        if index is not None:
+            return {_id: index for _id in ids}
+        indices = {}
+        for chunk in get_bulk_id_chunks(ids):
+            for hit in search.filter("ids", values=chunk).source(False)[: len(chunk)].execute():
+                indices[hit.meta.id] = hit.meta.index
+        return indices
+
+    @staticmethod
+    def scope_bulk_actions(actions, indices):
+        """更新和删除写入文档所在的索引, 不在视图过滤范围内的_id不发送到ES, 返回404"""
+        scoped = []
+        for i in actions:
+            if i.get("_op_type") in BULK_SCOPED_OP_TYPES:
+                if i["_id"] in indices:
+                    i = {**i, "_index": indices[i["_id"]]}
+                else:
+                    i = {"_id": i["_id"], "status": status.HTTP_404_NOT_FOUND, "error": "Not found."}
+            scoped.append(i)
+        return scoped
+
+    def get_write_hook(self, op_type):
+        """视图重写了op_type对应的单条写入钩子时返回 (钩子名, 钩子), 否则返回None"""
+        for name in BULK_WRITE_HOOKS.get(op_type, ()):
+            method = getattr(type(self), name, None)
+            if method is not None and method not in self.default_write_hooks:
+                return name, getattr(self, name)
+        return None
+
+    def perform_write_hook(self, action):
+        """以单条写入钩子执行action, 返回与bulk接口格式相同的结果"""
+        op_type, _id = action["_op_type"], action["_id"]
+        name, hook = self.get_write_hook(op_type)
+        instance = self.model_class(meta={"id": _id, "index": action["_index"]})
+        result = {"_id": _id, "status": status.HTTP_200_OK, "result": "%sd" % op_type}
+        try:
+            if name == "perform_update":
+                hook(instance, action["data"])
+            elif name == "perform_partial_update":
+                hook(_id, action["_index"], {"doc": action["doc"]})
+            else:
+                hook(instance)
+        except (Http404, NotFoundError):
+            result = {"_id": _id, "status": status.HTTP_404_NOT_FOUND, "error": "Not found."}
+        except APIException as e:
+            result = {"_id": _id, "status": e.status_code, "error": e.detail}
+        return {op_type: result}
+
+    def build_bulk_response(self, actions, es_results):
+        """按请求顺序合并校验失败的数据和ES返回的处理结果"""
+        es_results = iter(es_results)
+        items = []
+        for i in actions:
+            if "_op_type" not in i:
+                items.append(i)
+                continue
+            result = next(iter(next(es_results).values()))
+            items.append({k: result[k] for k in ("_id", "status", "result", "error") if k in result})
+        errors = any(i["status"] >= status.HTTP_300_MULTIPLE_CHOICES for i in items)
+        return Response({"errors": errors, "items": items})
+
+    def perform_bulk(self, actions, refresh):
+        assert self.model_class is not None
+        hooked = [self.get_write_hook(i["_op_type"]) is not None for i in actions]
+        bulk_actions = [i for i, h in zip(actions, hooked) if not h]
+        items = iter(())
+        if bulk_actions:
+            record_bulk_deletes(bulk_actions)
+            es = self.model_class._get_connection()
+            results = helpers.streaming_bulk(
+                es, bulk_actions, chunk_size=api_settings.BULK_CHUNK_SIZE, raise_on_error=False, refresh=refresh
+            )
+            items = iter([item for ok, item in results])
+            self.invalidate_cached_results(refreshed=refresh == "wait_for")
+        return [self.perform_write_hook(i) if h else next(items) for i, h in zip(actions, hooked)]
@@ -0,0 +1,85 @@
+"""
+多个search合并为一次_msearch执行
+
+执行后每个search的响应缓存在 search._response 中, 分页、列表、分面等代码调用
+search.execute()、get_search_total()、execute_facets() 时直接读取, 不再单独请求ES, 例如：
+
+from elasticsearch_drf.msearch import execute_searches
+execute_searches([page_search, facets_search])
+page_search.execute()  # 读取_msearch中的响应
+"""
+import hashlib
+import json
+from typing import Dict, List
+
+from elasticsearch.exceptions import TransportError
+from elasticsearch_dsl import MultiSearch, Search
+from elasticsearch_dsl.connections import get_connection
+
+from elasticsearch_drf.settings import api_settings
+from elasticsearch_drf.singleflight import coalesce, execute
+
+
+def is_batchable(search: Search) -> bool:
+    """
+    只有一次search请求即可完成的查询可以合并,
+    未指定size(需先count)和超出max_result_window(走search_after)的查询由 iter_hits 单独执行
+    """
+    if search is None or hasattr(search, "_response"):
+        return False
+    d = search.to_dict()
+    size = d.get("size")
+    return size is not None and d.get("from", 0) + size <= api_settings.ES_MAX_OFFSET
+
+
+def group_searches(searches: List[Search]) -> Dict[str, List[Search]]:
+    """按ES连接分组待执行的search, 同一个search只执行一次"""
+    groups = {}
+    for search in searches:
+        if not is_batchable(search):
+            continue
+        group = groups.setdefault(search._using, [])
+        if not any(search is s for s in group):
+            group.append(search)
+    return groups
+
+
+def get_msearch_body(searches: List[Search]) -> list:
+    multi_search = MultiSearch()
+    for search in searches:
+        multi_search = multi_search.add(search)
+    return multi_search.to_dict()
+
+
+def set_responses(searches: List[Search], responses: dict):
+    """将_msearch的响应按顺序缓存到各search中, 与 MultiSearch.execute() 一样任一查询出错时抛出异常"""
+    for search, response in zip(searches, responses["responses"]):
+        if response.get("error", False):
+            raise TransportError("N/A", response["error"]["type"], response["error"])
+        search._response = search._response_class(search, response)
+
+
+def get_msearch_params(searches: List[Search]) -> dict:
+    """各search的客户端请求超时取最大值, 作为_msearch请求的超时"""
+    timeouts = [search._params["request_timeout"] for search in searches if "request_timeout" in search._params]
+    return {"request_timeout": max(timeouts)} if timeouts else {}
+
+
+def get_msearch_key(using: str, body: list) -> str:
+    raw = json.dumps(body, sort_keys=True, ensure_ascii=False, default=str)
+    return "%s:msearch:%s" % (using, hashlib.md5(raw.encode()).hexdigest())
+
+
+def execute_searches(searches: List[Search], redis: bool = False):
+    """
+    合并执行searches, 只有一个待执行的search时直接执行; 并发的相同查询由 singleflight 合并为一次请求
+    :param redis: 同 singleflight.coalesce, 通过redis跨进程合并
+    """
+    for using, group in group_searches(searches).items():
+        if len(group) == 1:
+            execute(group[0], redis)
+            continue
+        es = get_connection(using)
+        body = get_msearch_body(group)
+        params = get_msearch_params(group)
+        set_responses(group, coalesce(get_msearch_key(using, body), lambda: es.msearch(body=body, **params), redis))
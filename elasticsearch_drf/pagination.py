@@ -1,8 +1,25 @@
 from collections import OrderedDict
 
+from django.core import signing
+from django.utils.translation import gettext_lazy as _
+from elasticsearch.exceptions import NotFoundError
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
+from elasticsearch_drf.counts import get_track_total_hits, index_stats_cache, is_unfiltered_search
+from elasticsearch_drf.facets import execute_facets, get_cached_facets, get_facets_key
 from elasticsearch_drf.settings import api_settings
+from elasticsearch_drf.utils import (
+    close_point_in_time,
+    get_partial_status,
+    get_search_count,
+    get_search_hash,
+    open_point_in_time,
+    reverse_sort,
+    with_tiebreaker,
+    without_aggs,
+)
 
 
 def _positive_int(integer_string, strict=False, cutoff=None):
@@ -17,25 +34,109 @@ def _positive_int(integer_string, strict=False, cutoff=None):
     return ret
 
 
-class ESPagination:
+def get_count_relation(search, relation):
+    """
+    A search that timed out or terminated early counted only part of the hits,
+    so its total is a lower bound.
+    """
+    partial = get_partial_status(search)
+    if partial is not None and (partial["timed_out"] or partial["terminated_early"]):
+        return "gte"
+    return relation
+
+
+class ESFacetsMixin:
+    """
+    Returns the aggregations added by `ESFacetFilter` as a `facets` block.
+    Cached facets are reused and their aggregations dropped from the page query.
+    """
+
+    def prepare_facets(self, search):
+        self.facets = None
+        self.facets_key = None
+        if not search.to_dict().get("aggs"):
+            return search
+
+        self.facets_key = get_facets_key(search)
+        self.facets = get_cached_facets(self.facets_key)
+        return search if self.facets is None else without_aggs(search)
+
+    def get_facets_search(self):
+        """The search whose response carries the aggregations."""
+        return self.search
+
+    def get_facets(self):
+        if self.facets is None and self.facets_key is not None:
+            self.facets = execute_facets(self.get_facets_search(), self.facets_key)
+        return self.facets
+
+    def get_searches(self):
+        """
+        Searches the paginated response reads, so the view can send them
+        together with the page search in one `_msearch`.
+        """
+        return [self.search, self.get_facets_search()]
+
+    def build_response(self, items, facets, data):
+        if facets is not None:
+            items.append(("facets", facets))
+        # Timed out, early terminated or shard-failed pages are flagged as partial.
+        partial = get_partial_status(*self.get_searches())
+        if partial is not None:
+            items.append(("partial", partial))
+        return Response(OrderedDict(items + [("results", data)]))
+
+
+class ESPagination(ESFacetsMixin):
     page_query_param = api_settings.PAGE_QUERY_PARAM
     page_size_query_param = api_settings.PAGE_SIZE_QUERY_PARAM
     page_size = api_settings.PAGE_SIZE
     max_page_size = None
     display_page_controls = False
+    # The total is read from `hits.total` of the page response itself,
+    # so a page costs a single search request instead of count + search.
+    # Use the "capped" or "estimated" policy to avoid exact counting on huge indices.
+    count_policy = api_settings.COUNT_POLICY
+    count_cap = api_settings.COUNT_CAP
 
     def __init__(self):
         self.total = None
+        self.count_relation = None
+        self.estimated = False
+        self.search = None
+        self.total_search = None
 
     def paginate_search(self, search, request, view=None):
         self.page_size = self.get_page_size(request)
         if not self.page_size:
             return None
 
-        self.total = search.count()
+        search = self.prepare_facets(search)
         page_number = self.get_page_number(request)
         start = (page_number - 1) * self.page_size
-        return search.extra(from_=start, size=self.page_size)
+        # Unfiltered searches take the "estimated" total from the cached index stats.
+        self.estimated = self.count_policy == "estimated" and is_unfiltered_search(search)
+        track_total_hits = get_track_total_hits(self.count_policy, self.count_cap, self.estimated)
+        self.search = search.extra(from_=start, size=self.page_size, track_total_hits=track_total_hits)
+        if start + self.page_size > api_settings.ES_MAX_OFFSET:
+            # Deep pages are fetched with search_after, the total and
+            # the facets then come from a single size=0 search.
+            needs_total_search = not self.estimated or self.facets_key is not None
+            self.total_search = search.extra(size=0, track_total_hits=track_total_hits) if needs_total_search else None
+        else:
+            self.total_search = self.search
+        return self.search
+
+    def get_facets_search(self):
+        return self.total_search
+
+    def get_total(self):
+        if self.total is None and self.estimated:
+            self.total, self.count_relation = index_stats_cache.get_doc_count(self.search), "estimated"
+        elif self.total is None and self.total_search is not None:
+            self.total, self.count_relation = get_search_count(self.total_search)
+            self.count_relation = get_count_relation(self.total_search, self.count_relation)
+        return self.total
 
     def get_page_size(self, request):
         if self.page_size_query_param:
@@ -48,6 +149,13 @@ class ESPagination:
 
         return self.page_size
 
+    def get_cache_params(self, request):
+        """
+        The query params selecting the page; the view's result cache key is
+        built from them before paginating.
+        """
+        return [request.query_params.get(self.page_query_param), request.query_params.get(self.page_size_query_param)]
+
     def get_page_number(self, request):
         page_number = request.query_params.get(self.page_query_param, 1)
         try:
@@ -56,4 +164,151 @@ class ESPagination:
             return 1
 
     def get_paginated_response(self, data):
-        return Response(OrderedDict([("count", self.total), ("results", data)]))
+        items = [("count", self.get_total()), ("count_relation", self.count_relation)]
+        return self.build_response(items, self.get_facets(), data)
+
+
+class ESCursorPagination(ESFacetsMixin):
+    """
+    Opaque cursor pagination built on search_after and a point in time (PIT).
+
+    Every page, the first included, searches a PIT with the sort produced by
+    the ordering filter plus a unique tiebreaker, so all pages read the same
+    snapshot in the same order and scrolling never issues deep `from`-based
+    queries or `count()` calls. Cursors carry the sort values of the page's
+    last/first hit together with the PIT id and are bound to the query and
+    sort they were issued for. The PIT of a result that fits on the first
+    page is closed straight away; others expire after `keep_alive` seconds
+    without a request, after which their cursors are answered with a 404.
+    Cache list results of cursor-paginated views for less than `keep_alive`.
+    """
+
+    cursor_query_param = api_settings.CURSOR_QUERY_PARAM
+    page_size_query_param = api_settings.PAGE_SIZE_QUERY_PARAM
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = None
+    keep_alive = api_settings.SEARCH_AFTER_KEEP_ALIVE
+    display_page_controls = False
+    invalid_cursor_message = _("Invalid cursor")
+    expired_cursor_message = _("Cursor expired")
+    cursor_salt = "elasticsearch_drf.pagination.ESCursorPagination"
+    # Body keys that may differ between the pages of one query.
+    search_hash_exclude = ("aggs", "from", "size", "track_total_hits", "_source", "highlight")
+
+    def __init__(self):
+        self.request = None
+        self.cursor = None
+        self.search_hash = None
+        self.pit_id = None
+        self.search = None
+        self.response = None
+
+    def paginate_search(self, search, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.request = request
+        self.search_hash = get_search_hash(search, exclude=self.search_hash_exclude)
+        self.cursor = self.decode_cursor(request)
+        # Facets only come with the first page
+        search = without_aggs(search) if self.cursor else search
+        search = self.prepare_facets(search)
+        self.pit_id = self.cursor["pit"] if self.cursor else open_point_in_time(search, self.keep_alive)
+        page_search = self.get_page_search(search)
+
+        # Executed here so an expired PIT surfaces as a 404; the view reuses the cached response.
+        try:
+            self.response = page_search.execute()
+        except NotFoundError:
+            raise NotFound(self.expired_cursor_message)
+        self.pit_id = self.response.to_dict().get("pit_id", self.pit_id)
+        self.search = page_search
+        if self.is_single_page():
+            close_point_in_time(search, self.pit_id)
+        return page_search
+
+    def is_single_page(self):
+        """Whether the first page holds the whole result, leaving no cursor to follow."""
+        return not self.cursor and len(self.response.to_dict()["hits"]["hits"]) <= self.page_size
+
+    def get_page_search(self, search):
+        # Fetch one extra hit to tell whether there is a following page.
+        size = self.page_size + 1
+        sort = with_tiebreaker(search.to_dict().get("sort"))
+        if self.cursor and self.cursor["reverse"]:
+            sort = reverse_sort(sort)
+        page_search = (
+            search.index()
+            .sort(*sort)
+            .extra(pit={"id": self.pit_id, "keep_alive": "%ds" % self.keep_alive}, track_total_hits=False)[:size]
+        )
+        if not self.cursor:
+            return page_search
+        return page_search.extra(search_after=self.cursor["position"])
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    # The look-ahead hit must fit in the result window too.
+                    cutoff=min(self.max_page_size or api_settings.ES_MAX_OFFSET, api_settings.ES_MAX_OFFSET - 1),
+                )
+            except (KeyError, ValueError):
+                pass
+
+        return self.page_size
+
+    def get_cache_params(self, request):
+        """
+        The query params selecting the page. A cache hit then skips the page
+        search that `paginate_search` runs.
+        """
+        return [request.query_params.get(self.cursor_query_param), request.query_params.get(self.page_size_query_param)]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            cursor = signing.loads(encoded, salt=self.cursor_salt)
+        except signing.BadSignature:
+            raise NotFound(self.invalid_cursor_message)
+        # A cursor issued for another query or sort would silently skip or repeat hits.
+        if cursor.get("search") != self.search_hash:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, position, reverse):
+        cursor = {
+            "position": position,
+            "reverse": reverse,
+            "pit": self.pit_id,
+            "search": self.search_hash,
+        }
+        encoded = signing.dumps(cursor, salt=self.cursor_salt, compress=True)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data):
+        items, data = self.get_page_links(data)
+        return self.build_response(items, self.get_facets(), data)
+
+    def get_page_links(self, data):
+        """
+        Returns the next/previous links and the page's data, trimmed of the look-ahead hit.
+        """
+        hits = self.response.to_dict()["hits"]["hits"]
+        reverse = bool(self.cursor and self.cursor["reverse"])
+        has_more = len(hits) > self.page_size
+        hits, data = hits[: self.page_size], data[: self.page_size]
+        if reverse:
+            hits, data = hits[::-1], data[::-1]
+
+        has_next = has_more if not reverse else True
+        has_previous = has_more if reverse else bool(self.cursor)
+        next_link = self.encode_cursor(hits[-1]["sort"], False) if hits and has_next else None
+        previous_link = self.encode_cursor(hits[0]["sort"], True) if hits and has_previous else None
+        return [("next", next_link), ("previous", previous_link)], data
@@ -0,0 +1,282 @@
+"""
+零停机重建索引
+
+修改文档类的mapping后, 由ES的 _reindex 把别名当前指向的索引复制到按新mapping创建的新版本索引,
+完成后原子地切换别名(见 elasticsearch_drf.indices), 重建期间查询照常访问旧索引：
+
+python manage.py es_reindex usermanage.documents.UserDocument --requests-per-second 500
+
+_reindex 以 slices=auto 按分片并行, requests_per_second 限制每秒写入的文档数, 避免影响线上查询延迟,
+执行中可通过 rethrottle 调整; 复制期间每隔 REINDEX_POLL_INTERVAL 秒通过tasks接口获取进度。
+
+_reindex 复制的是开始时的快照, 复制期间源索引照常写入, 复制结束后追上这段时间的写入：
+- 新增和更新: 复制开始前记录源索引各主分片的 _seq_no 检查点, 之后写入的文档 _seq_no 更大, 按分片查询后写入新索引;
+- 删除: 视图和增量同步删除文档前把_id记入redis(REINDEX_REDIS), 源索引中已不存在的从新索引删除。
+先在源索引可写时追上复制期间的写入, 再设置 index.blocks.write 禁止写入, 追上剩余的少量写入后切换别名,
+只有最后这一小段时间的写入被拒绝: 视图的写入返回503, 增量同步(elasticsearch_drf.sync)和
+写后队列(elasticsearch_drf.writebehind)在切换别名后重试。
+未配置 REINDEX_REDIS 时无法得知复制期间删除了哪些文档, 整个复制期间源索引禁止写入。
+直接写入ES(不经过视图和增量同步)的删除不会被记录。
+"""
+import logging
+import time
+from collections import defaultdict
+from typing import Callable
+
+from elasticsearch import helpers
+
+from elasticsearch_drf.cache import bump_index_generation
+from elasticsearch_drf.indices import (
+    BULK_INDEX_SETTINGS,
+    check_keep_old,
+    create_versioned_index,
+    get_alias_indices,
+    restore_index_settings,
+    set_write_block,
+    swap_alias,
+)
+from elasticsearch_drf.mappings import mapping_cache
+from elasticsearch_drf.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+# 正在复制的索引名(别名及其指向的索引) -> 别名
+COPYING_KEY = "{es_reindex}:copying"
+# 复制期间删除的_id集合, 按别名区分
+DELETES_KEY = "{es_reindex}:deletes:%s"
+
+# ARGV[1]正在复制时把ARGV[2:]记入其别名的删除集合
+RECORD_DELETES_SCRIPT = """
+local alias = redis.call('HGET', KEYS[1], ARGV[1])
+if alias then
+    redis.call('SADD', '{es_reindex}:deletes:' .. alias, unpack(ARGV, 2))
+end
+return alias
+"""
+
+# 开始记录删除后等待的秒数, 此前已判断为不在复制中的删除在这段时间内完成
+RECORD_GRACE_PERIOD = 1
+
+
+class ReindexError(Exception):
+    def __init__(self, task_id, errors):
+        self.task_id = task_id
+        self.errors = errors
+        super(ReindexError, self).__init__("Reindex task %s failed: %s" % (task_id, errors))
+
+
+def get_progress(task: dict) -> dict:
+    """
+    :param task: tasks接口的响应
+    :return: 任务状态中的 total、created、updated、deleted、version_conflicts、batches、
+             requests_per_second、throttled_millis
+    """
+    status = task["task"]["status"]
+    fields = ("total", "created", "updated", "deleted", "version_conflicts", "batches", "requests_per_second")
+    progress = {name: status.get(name) for name in fields}
+    progress["throttled_millis"] = status.get("throttled_millis", 0)
+    return progress
+
+
+def wait_for_task(es, task_id: str, poll_interval: float = None, on_progress: Callable = None) -> dict:
+    """
+    等待 _reindex 任务完成
+    :param es: Elasticsearch
+    :param task_id: 任务id
+    :param poll_interval: 轮询间隔, 单位秒
+    :param on_progress: 每次轮询后以get_progress的结果调用
+    :return: 任务完成时的进度
+    """
+    poll_interval = poll_interval or api_settings.REINDEX_POLL_INTERVAL
+    while True:
+        task = es.tasks.get(task_id=task_id)
+        progress = get_progress(task)
+        if on_progress is not None:
+            on_progress(progress)
+        if task.get("completed"):
+            errors = task.get("error") or task.get("response", {}).get("failures")
+            if errors:
+                raise ReindexError(task_id, errors)
+            return progress
+        time.sleep(poll_interval)
+
+
+def rethrottle(es, task_id: str, requests_per_second: float = None):
+    """调整执行中的 _reindex 任务的限速, None表示不限速"""
+    return es.reindex_rethrottle(task_id=task_id, requests_per_second=requests_per_second or -1)
+
+
+def _get_client():
+    get_client = api_settings.REINDEX_REDIS
+    return None if get_client is None else get_client()
+
+
+def record_deletes(index: str, ids: list):
+    """
+    视图和增量同步删除文档前调用: index(别名或其指向的索引)正在复制时记录删除的_id, 复制结束后从新索引中删除
+    redis不可用时只记录日志, 不影响删除
+    """
+    if not ids or api_settings.REINDEX_REDIS is None:
+        return
+    try:
+        client = _get_client()
+        client.register_script(RECORD_DELETES_SCRIPT)(keys=[COPYING_KEY], args=[index, *ids])
+    except Exception:
+        logger.exception("Failed to record ES deletes during reindex: %s", ids[:10])
+
+
+def record_bulk_deletes(actions):
+    """bulk actions中的删除按索引分别调用record_deletes"""
+    ids = defaultdict(list)
+    for action in actions:
+        if action.get("_op_type") == "delete":
+            ids[action["_index"]].append(action["_id"])
+    for index, index_ids in ids.items():
+        record_deletes(index, index_ids)
+
+
+def _start_recording(client, alias: str, source: list):
+    client.delete(DELETES_KEY % alias)
+    client.hset(COPYING_KEY, mapping={name: alias for name in [alias, *source]})
+    time.sleep(RECORD_GRACE_PERIOD)
+
+
+def _stop_recording(client, alias: str, source: list):
+    client.hdel(COPYING_KEY, alias, *source)
+    client.delete(DELETES_KEY % alias)
+
+
+def get_checkpoints(es, indices: list) -> dict:
+    """各索引各主分片已处理完的 _seq_no(local_checkpoint), {(索引, 分片): checkpoint}"""
+    stats = es.indices.stats(index=",".join(indices), level="shards", metric="docs")
+    checkpoints = {}
+    for name, index_stats in stats["indices"].items():
+        for shard, copies in index_stats["shards"].items():
+            for copy in copies:
+                if copy["routing"]["primary"]:
+                    checkpoints[(name, int(shard))] = copy["seq_no"]["local_checkpoint"]
+    return checkpoints
+
+
+def _get_copy_action(index: str, hit: dict) -> dict:
+    action = {"_op_type": "index", "_index": index, "_id": hit["_id"], "_source": hit["_source"]}
+    if "_routing" in hit:
+        action["routing"] = hit["_routing"]
+    return action
+
+
+def catch_up(es, source: list, index: str, checkpoints: dict) -> tuple:
+    """
+    把源索引中 _seq_no 大于检查点(检查点之后新增或更新)的文档写入新索引index
+    :return: (新的检查点, 写入数)
+    """
+    # 先取检查点再刷新, 检查点以内的写入都已可查询
+    latest = get_checkpoints(es, source)
+    es.indices.refresh(index=",".join(source))
+    count = 0
+    for (name, shard), checkpoint in checkpoints.items():
+        if latest[(name, shard)] <= checkpoint:
+            continue
+        hits = helpers.scan(
+            es,
+            query={"query": {"range": {"_seq_no": {"gt": checkpoint}}}},
+            index=name,
+            preference="_shards:%d" % shard,
+            size=api_settings.REINDEX_BATCH_SIZE,
+        )
+        actions = (_get_copy_action(index, hit) for hit in hits)
+        for ok, item in helpers.streaming_bulk(es, actions, chunk_size=api_settings.BULK_CHUNK_SIZE):
+            count += 1
+    return latest, count
+
+
+def apply_deletes(es, client, alias: str, source: list, index: str) -> int:
+    """复制期间记录的删除中, 源索引中已不存在(没有被重新创建)的文档从新索引删除, 返回删除数"""
+    ids = sorted(
+        member.decode() if isinstance(member, bytes) else member for member in client.smembers(DELETES_KEY % alias)
+    )
+    count = 0
+    for i in range(0, len(ids), api_settings.REINDEX_BATCH_SIZE):
+        chunk = ids[i : i + api_settings.REINDEX_BATCH_SIZE]
+        response = es.search(
+            index=",".join(source), body={"query": {"ids": {"values": chunk}}, "_source": False, "size": len(chunk)}
+        )
+        existing = {hit["_id"] for hit in response["hits"]["hits"]}
+        actions = [{"_op_type": "delete", "_index": index, "_id": _id} for _id in chunk if _id not in existing]
+        for ok, item in helpers.streaming_bulk(
+            es, actions, chunk_size=api_settings.BULK_CHUNK_SIZE, raise_on_error=False
+        ):
+            result = item["delete"]
+            if not ok and result.get("status") != 404:
+                raise helpers.BulkIndexError("Failed to delete from %s: %s" % (index, result), [item])
+            count += 1
+    return count
+
+
+def reindex(
+    document,
+    slices="auto",
+    requests_per_second: float = None,
+    delete_old: bool = True,
+    poll_interval: float = None,
+    on_progress: Callable = None,
+) -> tuple:
+    """
+    把文档类别名当前指向的索引复制到按当前mapping创建的新版本索引, 追上复制期间的写入后切换别名
+    :param document: Document子类
+    :param slices: _reindex的并行切片数, "auto" 为每个分片一个切片
+    :param requests_per_second: 每秒写入的文档数上限, None表示不限速
+    :param delete_old: 切换后删除旧索引, 为False时旧索引恢复写入; 源为别名同名的普通索引时无法保留, 抛出ValueError
+    :param poll_interval: 进度轮询间隔, 单位秒
+    :param on_progress: 每次轮询后以进度调用
+    :return: (新索引名, 完成时的进度), 进度中的 caught_up 为复制之后追上的写入和删除数
+    """
+    es = document._get_connection()
+    alias = document._index._name
+    check_keep_old(es, alias, delete_old)
+    # 别名不存在时, 源为与别名同名的普通索引
+    source = get_alias_indices(es, alias) or [alias]
+    client = _get_client()
+
+    index = task_id = None
+    try:
+        index = create_versioned_index(document, settings=BULK_INDEX_SETTINGS)
+        if client is None:
+            set_write_block(es, source, True)
+        else:
+            _start_recording(client, alias, source)
+            checkpoints = get_checkpoints(es, source)
+        es.indices.refresh(index=",".join(source))
+        body = {
+            "conflicts": "proceed",
+            "source": {"index": source, "size": api_settings.REINDEX_BATCH_SIZE},
+            "dest": {"index": index},
+        }
+        task_id = es.reindex(
+            body=body, slices=slices, requests_per_second=requests_per_second or -1, wait_for_completion=False
+        )["task"]
+        progress = wait_for_task(es, task_id, poll_interval, on_progress)
+        progress["caught_up"] = 0
+        if client is not None:
+            # 可写时先追上复制期间的写入, 禁止写入后只需追上这段时间内的少量写入
+            checkpoints, count = catch_up(es, source, index, checkpoints)
+            set_write_block(es, source, True)
+            checkpoints, final_count = catch_up(es, source, index, checkpoints)
+            progress["caught_up"] = count + final_count + apply_deletes(es, client, alias, source, index)
+        restore_index_settings(document, index)
+        swap_alias(es, alias, index, delete_old)
+    except BaseException:
+        if task_id is not None:
+            es.tasks.cancel(task_id=task_id, ignore=404)
+        if index is not None:
+            es.indices.delete(index=index, ignore=404)
+        set_write_block(es, source, False)
+        raise
+    finally:
+        if client is not None:
+            _stop_recording(client, alias, source)
+    if not delete_old:
+        set_write_block(es, source, False)
+    bump_index_generation(alias)
+    mapping_cache.invalidate(document)
+    return index, progress
@@ -0,0 +1,77 @@
+from itertools import islice
+
+from rest_framework.renderers import JSONRenderer
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _achunked(iterable, size):
+    chunk = []
+    async for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """
+    Renders an iterable of documents as a JSON array, chunk by chunk,
+    to feed a `StreamingHttpResponse` without building the whole list.
+    """
+
+    chunk_size = 500
+
+    def render_stream(self, items):
+        yield b"["
+        for i, chunk in enumerate(_chunked(items, self.chunk_size)):
+            # One json.dumps per chunk, with the list brackets stripped.
+            rendered = self.render(chunk)[1:-1]
+            yield b"," + rendered if i else rendered
+        yield b"]"
+
+    async def arender_stream(self, items):
+        """
+        Same as `render_stream`, for an async iterable of documents.
+        """
+        yield b"["
+        i = 0
+        async for chunk in _achunked(items, self.chunk_size):
+            rendered = self.render(chunk)[1:-1]
+            yield b"," + rendered if i else rendered
+            i += 1
+        yield b"]"
+
+
+class NDJSONRenderer(StreamingJSONRenderer):
+    """
+    Newline delimited JSON, one document per line.
+    Selected with `?format=ndjson` or `Accept: application/x-ndjson`.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        items = data if isinstance(data, list) else [data]
+        return b"".join(super(NDJSONRenderer, self).render(item) + b"\n" for item in items)
+
+    def render_stream(self, items):
+        for chunk in _chunked(items, self.chunk_size):
+            yield self.render(chunk)
+
+    async def arender_stream(self, items):
+        async for chunk in _achunked(items, self.chunk_size):
+            yield self.render(chunk)
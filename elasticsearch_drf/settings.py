@@ -3,11 +3,14 @@ Settings for elasticsearch_drf are all namespaced in the ES_REST_FRAMEWORK setti
 For example your project's `settings.py` file might look like this:
 
 ES_REST_FRAMEWORK = {
+    # or "elasticsearch_drf.pagination.ESCursorPagination" for infinite scroll
     "DEFAULT_PAGINATION_CLASS": "elasticsearch_drf.pagination.ESPagination",
     "DEFAULT_FILTER_BACKENDS": [
         "elasticsearch_drf.filters.ESFilter",
         "elasticsearch_drf.filters.ESearchFilter",
         "elasticsearch_drf.filters.ESOrderingFilter",
+        "elasticsearch_drf.filters.ESSourceFilter",
+        "elasticsearch_drf.filters.ESFacetFilter",
     ],
 }
 
@@ -15,6 +18,7 @@ This module provides the `api_setting` object, that is used to access
 elasticsearch_drf settings, checking for user settings first, then falling
 back to the defaults.
 """
+
 from django.conf import settings
 from django.test.signals import setting_changed
 from django.utils.module_loading import import_string
@@ -26,22 +30,110 @@ DEFAULTS = {
         "elasticsearch_drf.filters.ESFilter",
         "elasticsearch_drf.filters.ESearchFilter",
         "elasticsearch_drf.filters.ESOrderingFilter",
+        "elasticsearch_drf.filters.ESSourceFilter",
+        "elasticsearch_drf.filters.ESFacetFilter",
+    ],
+    # Async generic views (elasticsearch_drf.aio), require aiohttp
+    "DEFAULT_ASYNC_PAGINATION_CLASS": "elasticsearch_drf.aio.pagination.AsyncESPagination",
+    "DEFAULT_ASYNC_FILTER_BACKENDS": [
+        "elasticsearch_drf.aio.filters.AsyncESFilter",
+        "elasticsearch_drf.filters.ESearchFilter",
+        "elasticsearch_drf.aio.filters.AsyncESOrderingFilter",
+        "elasticsearch_drf.aio.filters.AsyncESSourceFilter",
+        "elasticsearch_drf.filters.ESFacetFilter",
     ],
     # Pagination
     "PAGE_SIZE": 10,
     "PAGE_QUERY_PARAM": "page",
     "PAGE_SIZE_QUERY_PARAM": "size",
+    "CURSOR_QUERY_PARAM": "cursor",
+    # Page count policy, see elasticsearch_drf.counts
+    "COUNT_POLICY": "exact",  # "exact", "capped" or "estimated"
+    "COUNT_CAP": 10000,  # hits counted accurately by the "capped" policy
+    "COUNT_STATS_CACHE_TIMEOUT": 60,  # seconds, process-level index doc count cache of the "estimated" policy
     # Filtering
     "SEARCH_PARAM": "search",
     "ORDERING_PARAM": "ordering",
+    "IDS_PARAM": "ids",
+    "FIELDS_PARAM": "fields",
+    "EXCLUDE_PARAM": "exclude",
+    "FACETS_PARAM": "facets",
+    # Facets
+    "FACETS_CACHE": "default",  # django cache alias storing facet results
+    "FACETS_CACHE_TIMEOUT": 60,  # seconds
+    # List result cache, enabled per view with `result_cache_timeout`
+    "RESULT_CACHE": "default",  # django cache alias storing serialized list responses
+    # seconds, the index refresh_interval: list results read this soon after a write are not cached
+    "RESULT_CACHE_REFRESH_INTERVAL": 1,
+    # Coalescing of identical concurrent searches
+    "SINGLE_FLIGHT": True,  # share one ES request between threads running the same search
+    "SINGLE_FLIGHT_REDIS": None,  # function returning a redis client, coalesces across processes for views opting in
+    "SINGLE_FLIGHT_TIMEOUT": 10,  # seconds, lock expiry and the longest wait for another caller's result
+    # Autocomplete
+    "AUTOCOMPLETE_PARAM": "prefix",
+    "AUTOCOMPLETE_SIZE": 10,
+    "AUTOCOMPLETE_CACHE_MAX_PREFIX_LENGTH": 3,  # only prefixes up to this length are cached
+    "AUTOCOMPLETE_CACHE_SIZE": 1024,  # entries of the process-level LRU
+    "AUTOCOMPLETE_CACHE_TIMEOUT": 60,  # seconds
+    # Multi search endpoint
+    "MSEARCH_MAX_QUERIES": 10,  # named queries per request
     # ES settings
+    # elasticsearch_dsl connections configured on startup, {alias: Elasticsearch kwargs},
+    # e.g. {"default": {"hosts": ["localhost:9200"]}}; connection_class defaults to InstrumentedConnection
+    "ES_CONNECTIONS": {},
     "ES_MAX_OFFSET": 5000,  # index.max_result_window
+    "MAPPING_CACHE_TIMEOUT": 300,  # seconds, process-level index mapping cache
+    "BULK_CHUNK_SIZE": 500,  # documents per bulk request
+    # Search limits of list views, overridable per view
+    "SEARCH_TIMEOUT": None,  # seconds, ES-side search timeout returning the hits collected so far
+    "TERMINATE_AFTER": None,  # hits collected per shard before the search terminates early
+    "REQUEST_TIMEOUT": None,  # seconds, client-side wait for the ES response, answered with a 503
+    "ALLOW_PARTIAL_RESULTS": True,  # return timed out or shard-failed pages as partial, else a 503
+    # Per-request ES instrumentation (elasticsearch_drf.instrumentation)
+    "INSTRUMENTATION_MAX_ROUND_TRIPS": 5,  # requests making more ES calls are logged as warnings, None disables
+    # Deep paging (search_after + point in time)
+    "SEARCH_AFTER_TIEBREAKER": "_shard_doc",  # unique sort field appended to every search_after sort
+    "SEARCH_AFTER_KEEP_ALIVE": 60,  # seconds, PIT keep_alive and lifetime of cached sort-key checkpoints
+    "SEARCH_AFTER_MAX_CHECKPOINTS": 200,  # checkpoints kept per query
+    "SEARCH_AFTER_CACHE": "default",  # django cache alias storing the checkpoints
+    # Parallel export of unordered unbounded results (PIT slices + search_after)
+    "EXPORT_SLICES": 1,  # slices fetched in parallel threads, 1 keeps the single scroll
+    "EXPORT_BATCH_SIZE": 1000,  # hits per slice request
+    "EXPORT_BUFFER_SIZE": 8,  # batches buffered between the slice threads and the consumer
+    "EXPORT_KEEP_ALIVE": 300,  # seconds, PIT keep_alive and lifetime of the per-slice checkpoints
+    # Write-behind indexing, enabled per view with `write_behind` (elasticsearch_drf.writebehind)
+    "WRITE_BEHIND_REDIS": None,  # function returning the redis client holding the buffer
+    "WRITE_BEHIND_FLUSH_TASK": None,  # celery task flushing a connection's buffer, triggered by full batches
+    "WRITE_BEHIND_BATCH_SIZE": 500,  # actions per flushed batch
+    "WRITE_BEHIND_FLUSH_INTERVAL": 1,  # seconds, suppresses repeated size triggers between flushes
+    "WRITE_BEHIND_MAX_ATTEMPTS": 5,  # bulk attempts of a rejected (429/5xx) action before dead-lettering
+    "WRITE_BEHIND_LOCK_TIMEOUT": 60,  # seconds, flush lock expiry, renewed after every batch
+    # Django model sync (elasticsearch_drf.sync)
+    "SYNC_REDIS": None,  # function returning the redis client holding the change log
+    "SYNC_TASK": None,  # celery task running sync_changes(), triggered when SYNC_BATCH_SIZE changes are pending
+    "SYNC_BATCH_SIZE": 500,  # changed rows synced per batch
+    "SYNC_INTERVAL": 1,  # seconds, suppresses repeated size triggers between syncs
+    "SYNC_LOCK_TIMEOUT": 60,  # seconds, sync lock expiry, renewed after every batch
+    # Zero-downtime reindex (elasticsearch_drf.reindex)
+    "REINDEX_BATCH_SIZE": 1000,  # documents per _reindex scroll batch
+    "REINDEX_POLL_INTERVAL": 5,  # seconds between task progress checks
+    # function returning a redis client recording deletes made during the copy, so the source stays writable;
+    # without it the source is write-blocked for the whole copy
+    "REINDEX_REDIS": None,
 }
 
 # List of settings that may be in string import notation.
 IMPORT_STRINGS = [
     "DEFAULT_PAGINATION_CLASS",
     "DEFAULT_FILTER_BACKENDS",
+    "DEFAULT_ASYNC_PAGINATION_CLASS",
+    "DEFAULT_ASYNC_FILTER_BACKENDS",
+    "SINGLE_FLIGHT_REDIS",
+    "WRITE_BEHIND_REDIS",
+    "WRITE_BEHIND_FLUSH_TASK",
+    "SYNC_REDIS",
+    "SYNC_TASK",
+    "REINDEX_REDIS",
 ]
 
 # List of settings that have been removed
@@ -0,0 +1,255 @@
+"""
+相同查询的合并执行(single flight)
+
+缓存失效的瞬间大量请求同时发出相同的查询, 只由一个调用方请求ES, 其余调用方等待并共享它的响应：
+进程内按查询键合并并发线程; 配置 SINGLE_FLIGHT_REDIS 并在视图上开启 single_flight_redis 后,
+各进程中执行查询的线程再通过redis锁合并, 持有锁的进程执行查询, 有其他进程等待时把响应写入redis,
+等待的进程阻塞在BLPOP上直到收到完成信号, 例如：
+
+ES_REST_FRAMEWORK = {
+    "SINGLE_FLIGHT_REDIS": "common.utils.redis.get_redis_client",
+}
+
+class HotViewSet(ESModelViewSet):
+    single_flight_redis = True
+
+跨进程合并的每次查询多2~3次redis往返, 等待方各占用一个redis连接, 只适合缓存失效时大量进程同时查询的热点视图
+
+查询键为 连接别名 + 索引 + 归一化的查询体, 只合并同时进行的查询, 不缓存已完成的结果;
+异步视图(elasticsearch_drf.aio)的查询由 acoalesce 在同一事件循环内合并, 不经过redis
+"""
+import asyncio
+import json
+import threading
+import uuid
+from typing import Callable
+
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.connections import get_connection
+
+from elasticsearch_drf.settings import api_settings
+from elasticsearch_drf.utils import get_search_hash
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.content = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    进程内合并: 同一个键同时只有一个线程执行fn, 其余线程等待它的结果
+    响应字典会被各调用方修改(如raw模式合并元数据字段), 有等待方时结果序列化一次, 每个等待方各自反序列化
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            if not call.done.wait(api_settings.SINGLE_FLIGHT_TIMEOUT):
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return json.loads(call.content)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # 移出后不会再有新的等待方
+            with self._lock:
+                del self._calls[key]
+            if call.error is None and call.waiters:
+                call.content = json.dumps(result)
+            call.done.set()
+        return result
+
+
+single_flight = SingleFlight()
+
+
+class _AsyncCall:
+    def __init__(self, future):
+        self.future = future
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight的asyncio版本: 同一事件循环中同一个键同时只有一个协程执行fn, 其余协程等待它的结果
+    执行方被取消时等待方各自执行fn, 等待方被取消不影响执行方
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key: str, fn: Callable):
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        call = self._calls.get(call_key)
+        if call is not None:
+            call.waiters += 1
+            try:
+                content = await asyncio.wait_for(asyncio.shield(call.future), api_settings.SINGLE_FLIGHT_TIMEOUT)
+            except asyncio.TimeoutError:
+                return await fn()
+            except asyncio.CancelledError:
+                if not call.future.cancelled():
+                    raise
+                return await fn()
+            return json.loads(content)
+
+        call = self._calls[call_key] = _AsyncCall(loop.create_future())
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            call.future.cancel()
+            raise
+        except BaseException as e:
+            call.future.set_exception(e)
+            # 没有等待方时异常不会被读取, 避免asyncio的未读取异常警告
+            call.future.exception()
+            raise
+        finally:
+            del self._calls[call_key]
+        call.future.set_result(json.dumps(result) if call.waiters else None)
+        return result
+
+
+async_single_flight = AsyncSingleFlight()
+
+
+# 登记为等待方: 锁仍被持有时等待数加一, 返回持有锁的token
+JOIN_SCRIPT = """
+local token = redis.call('GET', KEYS[1])
+if token then
+    local waiters = KEYS[1] .. ':' .. token .. ':waiters'
+    redis.call('INCR', waiters)
+    redis.call('EXPIRE', waiters, ARGV[1])
+end
+return token
+"""
+
+# 释放锁, 有等待方时写入结果(ARGV[2]为空表示执行失败)并给每个等待方发一个完成信号
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+local prefix = KEYS[1] .. ':' .. ARGV[1]
+local waiters = tonumber(redis.call('GET', prefix .. ':waiters') or '0')
+if waiters > 0 then
+    if ARGV[2] ~= '' then
+        redis.call('SET', prefix .. ':result', ARGV[2], 'EX', ARGV[3])
+    end
+    for i = 1, waiters do
+        redis.call('RPUSH', prefix .. ':done', 1)
+    end
+    redis.call('EXPIRE', prefix .. ':done', ARGV[3])
+end
+return waiters
+"""
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _redis_do(get_client: Callable, key: str, fn: Callable):
+    """
+    跨进程合并: 获得锁的进程执行fn, 释放锁时有等待方登记则写入结果并通知; 等待方以BLPOP阻塞等待完成信号,
+    结果为空(执行失败或登记晚于写入结果)时自行执行
+    锁的值为本次执行的token, 等待数、结果和完成信号均按token区分, 不会读到上一次执行的结果
+    登记和释放均为原子的脚本, 锁释放后不会再有等待方登记, 等待方不会错过完成信号
+    """
+    timeout = api_settings.SINGLE_FLIGHT_TIMEOUT
+    lock_key = "es_singleflight:%s" % key
+    token = uuid.uuid4().hex
+    try:
+        client = get_client()
+        acquired = client.set(lock_key, token, nx=True, ex=timeout)
+    except Exception:
+        # redis不可用时退化为直接执行
+        return fn()
+
+    if acquired:
+        content = ""
+        try:
+            result = fn()
+            if int(client.get("%s:%s:waiters" % (lock_key, token)) or 0) > 0:
+                content = json.dumps(result)
+            return result
+        finally:
+            client.register_script(RELEASE_SCRIPT)(keys=[lock_key], args=[token, content, timeout])
+
+    try:
+        content = _wait_result(client, lock_key, timeout)
+    except Exception:
+        content = None
+    return fn() if content is None else json.loads(content)
+
+
+def _wait_result(client, lock_key: str, timeout: int):
+    token = _decode(client.register_script(JOIN_SCRIPT)(keys=[lock_key], args=[timeout]))
+    if token is None:
+        return None
+    if client.blpop("%s:%s:done" % (lock_key, token), timeout=timeout) is None:
+        return None
+    return client.get("%s:%s:result" % (lock_key, token))
+
+
+def coalesce(key: str, fn: Callable, redis: bool = False):
+    """
+    合并执行返回可JSON序列化结果(ES原始响应)的fn
+    :param key: 查询键
+    :param fn: 实际请求ES的函数
+    :param redis: 进程内合并后再通过redis跨进程合并, 未配置 SINGLE_FLIGHT_REDIS 时忽略
+    :return:
+    """
+    if not api_settings.SINGLE_FLIGHT:
+        return fn()
+    get_client = api_settings.SINGLE_FLIGHT_REDIS
+    if not redis or get_client is None:
+        return single_flight.do(key, fn)
+    return single_flight.do(key, lambda: _redis_do(get_client, key, fn))
+
+
+async def acoalesce(key: str, fn: Callable):
+    """
+    coalesce的异步版本, fn返回协程; 只在进程内合并, 不使用 SINGLE_FLIGHT_REDIS
+    """
+    if not api_settings.SINGLE_FLIGHT:
+        return await fn()
+    return await async_single_flight.do(key, fn)
+
+
+def get_search_key(search: Search) -> str:
+    params = json.dumps(search._params, sort_keys=True, default=str)
+    return "%s:%s:%s" % (search._using, get_search_hash(search), params)
+
+
+def execute(search: Search, redis: bool = False):
+    """合并执行search, 与search.execute()一样将响应缓存在search._response中, redis同coalesce"""
+    if not hasattr(search, "_response"):
+        es = get_connection(search._using)
+        response = coalesce(
+            get_search_key(search),
+            lambda: es.search(index=search._index, body=search.to_dict(), **search._params),
+            redis,
+        )
+        search._response = search._response_class(search, response)
+    return search._response
@@ -0,0 +1,360 @@
+"""
+Django模型到ES文档的增量同步
+
+在app的 documents.py 中声明模型对应的文档类, 启动时自动加载：
+
+@sync.register(User)
+class UserDocument(Document):
+    username = Keyword()
+    nickname = Text()
+
+    class Index:
+        name = "usermanage-user"
+
+模型的 post_save/post_delete 在事务提交后把 "模型:主键" 记入redis变更集合, 由Celery任务(SYNC_TASK)批量取出,
+按主键从数据库读取最新数据, 存在的行写入ES, 已删除的行从ES删除。同一行在两次同步之间的多次变更只同步一次,
+写入量取决于变更的行数而不是表的大小; queryset.update()等不触发信号的写入需调用 record_changes。
+每批先原子地移入处理中集合, 同步完成后才删除, 至少同步一次(at-least-once); 429、5xx和索引禁止写入(重建期间)的失败项
+放回变更集合, 下次同步重试。
+
+文档类可定义类方法 get_queryset() 预加载关联数据, 类方法 prepare(instance) 自定义模型实例到_source的转换,
+默认读取模型实例上与文档字段同名的属性。
+全量重建使用 manage.py es_rebuild, 从数据库并行写入新版本的索引后切换别名(见 elasticsearch_drf.indices)
+"""
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_delete, post_save
+from elasticsearch import helpers
+from elasticsearch.helpers import BulkIndexError
+
+from elasticsearch_drf.cache import bump_index_generation
+from elasticsearch_drf.indices import (
+    BULK_INDEX_SETTINGS,
+    check_keep_old,
+    create_versioned_index,
+    is_write_blocked,
+    restore_index_settings,
+    swap_alias,
+)
+from elasticsearch_drf.mappings import mapping_cache
+from elasticsearch_drf.reindex import record_bulk_deletes
+from elasticsearch_drf.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+CHANGES_KEY = "{es_sync}"
+PROCESSING_KEY = "{es_sync}:processing"
+LOCK_KEY = "{es_sync}:lock"
+SCHEDULED_KEY = "{es_sync}:scheduled"
+# 别名 -> 正在重建的新索引, 重建期间的变更同时写入新索引
+REBUILDING_KEY = "{es_sync}:rebuilding"
+# 重建期间同步删除的主键(墓碑), 重建写入完成后从新索引中再次删除
+TOMBSTONES_KEY = "{es_sync}:tombstones:%s"
+
+# 从变更集合中随机取出至多ARGV[1]项移入处理中集合
+MOVE_BATCH_SCRIPT = """
+local items = redis.call('SPOP', KEYS[1], tonumber(ARGV[1]))
+if #items > 0 then
+    redis.call('SADD', KEYS[2], unpack(items))
+end
+return items
+"""
+
+# 模型label -> (模型, 文档类)
+_registry = {}
+
+
+def register(model):
+    """类装饰器, 声明model同步到被装饰的文档类"""
+
+    def decorator(document):
+        label = model._meta.label_lower
+        _registry[label] = (model, document)
+        post_save.connect(_on_change, sender=model, dispatch_uid="es_sync_save:%s" % label)
+        post_delete.connect(_on_change, sender=model, dispatch_uid="es_sync_delete:%s" % label)
+        return document
+
+    return decorator
+
+
+def get_registered(label: str = None):
+    """
+    :param label: 模型label, 如 "usermanage.user", 为None时返回全部已注册的 {label: (模型, 文档类)}
+    :return: (模型, 文档类)
+    """
+    if label is None:
+        return dict(_registry)
+    try:
+        return _registry[label.lower()]
+    except KeyError:
+        raise LookupError("Model '%s' is not registered for ES sync, options: %s" % (label, list(_registry)))
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _get_client():
+    get_client = api_settings.SYNC_REDIS
+    assert get_client is not None, "Set the `SYNC_REDIS` setting to use ES sync."
+    return get_client()
+
+
+def _on_change(sender, instance, using=None, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: record_changes(sender, [pk]), using=using)
+
+
+def record_changes(model, pks):
+    """
+    记录model中主键为pks的行已变更, 由下次同步写入ES
+    redis不可用时只记录日志, 不影响数据库写入, 遗漏的变更由全量重建修复
+    """
+    members = ["%s:%s" % (model._meta.label_lower, pk) for pk in pks]
+    if not members:
+        return
+    try:
+        client = _get_client()
+        client.sadd(CHANGES_KEY, *members)
+        task = api_settings.SYNC_TASK
+        if task is None or client.scard(CHANGES_KEY) < api_settings.SYNC_BATCH_SIZE:
+            return
+        if client.set(SCHEDULED_KEY, 1, nx=True, ex=api_settings.SYNC_INTERVAL):
+            task.delay()
+    except Exception:
+        logger.exception("Failed to record ES sync changes: %s", members[:10])
+
+
+def get_document_label(document):
+    """文档类对应的已注册模型label, 未注册时返回None"""
+    for label, (model, registered) in _registry.items():
+        if registered is document:
+            return label
+    return None
+
+
+def start_dual_write(alias: str, index: str):
+    """重建期间同步的变更同时写入别名和新索引index"""
+    client = _get_client()
+    client.delete(TOMBSTONES_KEY % alias)
+    client.hset(REBUILDING_KEY, alias, index)
+
+
+def stop_dual_write(alias: str):
+    client = _get_client()
+    client.hdel(REBUILDING_KEY, alias)
+    client.delete(TOMBSTONES_KEY % alias)
+
+
+def _get_queryset(model, document):
+    if hasattr(document, "get_queryset"):
+        return document.get_queryset()
+    return model._default_manager.all()
+
+
+def prepare(document, instance) -> dict:
+    """模型实例转换为文档_source"""
+    if hasattr(document, "prepare"):
+        return document.prepare(instance)
+    return document(**{name: getattr(instance, name) for name in document._doc_type.mapping}).to_dict()
+
+
+def _get_actions(model, document, pks: list, rebuilding: dict):
+    """按主键从数据库读取最新数据, 生成 (变更项, bulk action)"""
+    alias = document._index._name
+    indices = [alias, *([rebuilding[alias]] if alias in rebuilding else [])]
+    instances = {str(pk): instance for pk, instance in _get_queryset(model, document).in_bulk(pks).items()}
+    label = model._meta.label_lower
+    for pk in pks:
+        instance = instances.get(pk)
+        for index in indices:
+            if instance is None:
+                action = {"_op_type": "delete", "_index": index, "_id": pk}
+            else:
+                action = {"_op_type": "index", "_index": index, "_id": pk, "_source": prepare(document, instance)}
+            yield "%s:%s" % (label, pk), action
+
+
+def _sync_batch(client, members: list) -> dict:
+    rebuilding = {_decode(k): _decode(v) for k, v in client.hgetall(REBUILDING_KEY).items()}
+    pks = defaultdict(list)
+    for member in members:
+        label, pk = member.split(":", 1)
+        pks[label].append(pk)
+
+    stats = {"synced": 0, "retried": 0, "dropped": 0}
+    retries, aliases = set(), set()
+    for label, label_pks in pks.items():
+        if label not in _registry:
+            stats["dropped"] += len(label_pks)
+            continue
+        model, document = _registry[label]
+        aliases.add(document._index._name)
+        pairs = list(_get_actions(model, document, label_pks, rebuilding))
+        record_bulk_deletes([action for member, action in pairs])
+        _record_tombstones(client, document, rebuilding, [action for member, action in pairs])
+        results = helpers.streaming_bulk(
+            document._get_connection(),
+            [action for member, action in pairs],
+            chunk_size=api_settings.BULK_CHUNK_SIZE,
+            raise_on_error=False,
+        )
+        for (member, action), (ok, item) in zip(pairs, results):
+            op_type, result = item.popitem()
+            status = result.get("status", 500)
+            if ok or (op_type == "delete" and status == 404):
+                stats["synced"] += 1
+            elif status == 429 or status >= 500 or is_write_blocked(result.get("error")):
+                retries.add(member)
+            else:
+                stats["dropped"] += 1
+                logger.error("Failed to sync %s to ES: %s", member, result.get("error"))
+
+    if retries:
+        client.sadd(CHANGES_KEY, *retries)
+    stats["retried"] = len(retries)
+    for alias in aliases:
+        bump_index_generation(alias)
+    return stats
+
+
+def _record_tombstones(client, document, rebuilding: dict, actions: list):
+    """
+    记录写入正在重建的新索引的删除
+    删除可能先于重建读取到的旧数据写入新索引, create不会覆盖已删除的文档, 重建写入完成后需按墓碑再次删除
+    """
+    alias = document._index._name
+    pks = [
+        action["_id"]
+        for action in actions
+        if action["_op_type"] == "delete" and action["_index"] == rebuilding.get(alias)
+    ]
+    if pks:
+        client.sadd(TOMBSTONES_KEY % alias, *pks)
+
+
+def sync_changes() -> dict:
+    """
+    同步变更集合中的全部变更, 同时只有一个同步者
+    :return: {"synced": 写入数, "retried": 放回变更集合数, "dropped": 丢弃数}, 其他同步者正在执行时返回None
+    """
+    client = _get_client()
+    lock = client.lock(LOCK_KEY, timeout=api_settings.SYNC_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        return None
+
+    stats = {"synced": 0, "retried": 0, "dropped": 0}
+    move_batch = client.register_script(MOVE_BATCH_SCRIPT)
+    try:
+        # 上次同步中断时遗留的批次先重新同步
+        batch = client.smembers(PROCESSING_KEY)
+        while True:
+            if not batch:
+                batch = move_batch(keys=[CHANGES_KEY, PROCESSING_KEY], args=[api_settings.SYNC_BATCH_SIZE])
+            if not batch:
+                break
+            batch_stats = _sync_batch(client, sorted(_decode(member) for member in batch))
+            for name, n in batch_stats.items():
+                stats[name] += n
+            client.delete(PROCESSING_KEY)
+            if batch_stats["retried"]:
+                # ES拒绝了部分写入, 留给下次同步重试
+                break
+            lock.reacquire()
+            batch = None
+    finally:
+        client.delete(SCHEDULED_KEY)
+        if lock.owned():
+            lock.release()
+    return stats
+
+
+def _index_chunks(model, document, index: str, chunks: list) -> int:
+    """在一个线程中把若干批主键对应的行写入index, 返回写入数"""
+    es = document._get_connection()
+    queryset = _get_queryset(model, document)
+    count, errors = 0, []
+    try:
+        for pks in chunks:
+            # 使用create: 重建期间同步写入新索引的较新数据不会被覆盖
+            actions = [
+                {"_op_type": "create", "_index": index, "_id": str(instance.pk), "_source": prepare(document, instance)}
+                for instance in queryset.in_bulk(pks).values()
+            ]
+            for ok, item in helpers.streaming_bulk(
+                es, actions, chunk_size=api_settings.BULK_CHUNK_SIZE, raise_on_error=False
+            ):
+                result = item["create"]
+                if ok or result.get("status") == 409:
+                    count += 1
+                else:
+                    errors.append(item)
+    finally:
+        close_old_connections()
+    if errors:
+        raise BulkIndexError("%s document(s) failed to index." % len(errors), errors)
+    return count
+
+
+def _apply_tombstones(model, document, index: str) -> int:
+    """从新索引中删除重建期间同步删除的行, 此后又重新插入的行除外, 返回删除数"""
+    alias = document._index._name
+    pks = sorted(_decode(pk) for pk in _get_client().smembers(TOMBSTONES_KEY % alias))
+    existing = {str(pk) for pk in _get_queryset(model, document).filter(pk__in=pks).values_list("pk", flat=True)}
+    actions = [{"_op_type": "delete", "_index": index, "_id": pk} for pk in pks if pk not in existing]
+    count, errors = 0, []
+    for ok, item in helpers.streaming_bulk(
+        document._get_connection(), actions, chunk_size=api_settings.BULK_CHUNK_SIZE, raise_on_error=False
+    ):
+        if ok:
+            count += 1
+        elif item["delete"].get("status") != 404:
+            errors.append(item)
+    if errors:
+        raise BulkIndexError("%s tombstone(s) failed to apply." % len(errors), errors)
+    return count
+
+
+def rebuild(label: str, parallel: int = 4, batch_size: int = None, delete_old: bool = True) -> tuple:
+    """
+    从数据库全量重建模型的ES索引: 写入新版本的索引, 完成后原子地切换别名
+    重建期间增量同步照常写入别名指向的旧索引, 同时写入新索引, 切换后不会丢失重建期间的变更;
+    重建期间删除的行记为墓碑, 写入完成后从新索引中删除, 不会被重建读取到的旧数据恢复
+    :param label: 模型label
+    :param parallel: 并行写入的线程数, 按主键顺序分段
+    :param batch_size: 每次从数据库读取的行数
+    :param delete_old: 切换后删除旧索引, 别名同名的普通索引无法保留, 抛出ValueError
+    :return: (新索引名, 写入数)
+    """
+    model, document = get_registered(label)
+    batch_size = batch_size or api_settings.BULK_CHUNK_SIZE
+    es = document._get_connection()
+    alias = document._index._name
+    check_keep_old(es, alias, delete_old)
+
+    index = create_versioned_index(document, settings=BULK_INDEX_SETTINGS)
+    start_dual_write(alias, index)
+    try:
+        # 开始双写之后再读取主键, 此后新增的行由增量同步写入新索引
+        pks = list(_get_queryset(model, document).order_by("pk").values_list("pk", flat=True))
+        chunks = [pks[i : i + batch_size] for i in range(0, len(pks), batch_size)]
+        step = -(-len(chunks) // parallel) or 1
+        with ThreadPoolExecutor(parallel) as pool:
+            segments = [chunks[i : i + step] for i in range(0, len(chunks), step)]
+            count = sum(pool.map(partial(_index_chunks, model, document, index), segments))
+        # 此后同步的删除直接作用于已写入的文档, 之前的删除可能被重建的create恢复
+        count -= _apply_tombstones(model, document, index)
+        restore_index_settings(document, index)
+        swap_alias(es, alias, index, delete_old)
+    except BaseException:
+        es.indices.delete(index=index, ignore=404)
+        raise
+    finally:
+        stop_dual_write(alias)
+    bump_index_generation(alias)
+    mapping_cache.invalidate(document)
+    return index, count
@@ -0,0 +1,171 @@
+"""
+测试共用的ES替身、文档类和表单
+
+请求照常经过 elasticsearch 客户端的序列化和Transport, 由 RecordingConnection 按请求内容生成响应,
+测试使用单独的连接别名, 不影响项目配置的ES连接
+"""
+import asyncio
+import itertools
+import json
+import threading
+
+from django import forms
+from django.test import SimpleTestCase
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from elasticsearch.exceptions import ConnectionError as ESConnectionError
+from elasticsearch_dsl import Document, Keyword, Long, connections
+
+from elasticsearch_drf.aio import connections as async_connections
+from elasticsearch_drf.benchmarks.fake import FakeConnection
+from elasticsearch_drf.mappings import mapping_cache
+
+USING = "elasticsearch_drf_tests"
+INDEX = "test-docs"
+
+
+def get_ids_query(query):
+    """查询中ids条件的_id集合, 没有ids条件时返回None"""
+    if isinstance(query, dict):
+        if "ids" in query:
+            return set(query["ids"]["values"])
+        children = query.values()
+    elif isinstance(query, list):
+        children = query
+    else:
+        return None
+    for child in children:
+        ids = get_ids_query(child)
+        if ids is not None:
+            return ids
+    return None
+
+
+def is_descending(sort) -> bool:
+    """sort的最后一个排序字段(唯一的tiebreaker, 决定命中的先后)是否为倒序"""
+    if not sort or not isinstance(sort[-1], dict):
+        return False
+    ((field, order),) = sort[-1].items()
+    return (order.get("order") if isinstance(order, dict) else order) == "desc"
+
+
+class RecordingConnection(FakeConnection):
+    """
+    记录收到的请求的 FakeConnection, 第n个命中的_id为n, 各排序值均为n
+    在 FakeConnection 的基础上识别ids条件和倒序的search_after, 可验证批量写入的过滤范围和游标的上一页;
+    _mapping 请求返回 TestDocument 的mapping
+    :param fail_bulk: 为True时bulk请求记录后抛出连接错误, 模拟ES已写入但响应丢失
+    """
+
+    def __init__(self, fail_bulk=False, **kwargs):
+        super(RecordingConnection, self).__init__(**kwargs)
+        self.fail_bulk = fail_bulk
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        with self._lock:
+            self.requests.append((method, url, body))
+        if self.fail_bulk and url.endswith("/_bulk"):
+            raise ESConnectionError("N/A", "connection reset after sending the bulk request", None)
+        return super(RecordingConnection, self).perform_request(method, url, params, body, timeout, ignore, headers)
+
+    def route(self, method, url, params, body):
+        if url.endswith("/_mapping"):
+            return 200, {INDEX: {"mappings": TestDocument._doc_type.mapping.to_dict()}}
+        return super(RecordingConnection, self).route(method, url, params, body)
+
+    def get_requests(self, endpoint: str) -> list:
+        """url以endpoint结尾的请求体"""
+        return [body for method, url, body in self.requests if url.endswith(endpoint)]
+
+    def get_bulk_actions(self) -> list:
+        """全部bulk请求中的 (op_type, 元数据)"""
+        actions = []
+        for body in self.get_requests("/_bulk"):
+            if isinstance(body, bytes):
+                body = body.decode("utf-8")
+            lines = iter(json.loads(line) for line in body.splitlines() if line.strip())
+            for action in lines:
+                ((op_type, meta),) = action.items()
+                if op_type != "delete":
+                    next(lines)
+                actions.append((op_type, meta))
+        return actions
+
+    def get_hits(self, index, start, size, body):
+        if "slice" in body:
+            return super(RecordingConnection, self).get_hits(index, start, size, body)
+        sort = body.get("sort", ())
+        if "search_after" in body and is_descending(sort):
+            positions = range(min(body["search_after"][0], self.total) - 1, -1, -1)
+        else:
+            positions = range(start, self.total)
+        ids = get_ids_query(body.get("query"))
+        if ids is not None:
+            positions = (i for i in positions if str(i) in ids)
+        source = body.get("_source", True) is not False
+        return [self.get_hit(index, i, len(sort), source) for i in itertools.islice(positions, size)]
+
+
+class AsyncRecordingConnection(RecordingConnection):
+    """RecordingConnection 的异步版本, 供 AsyncElasticsearch 使用"""
+
+    async def perform_request(self, *args, **kwargs):
+        # 让出事件循环, 并发的请求才会交替执行
+        await asyncio.sleep(0)
+        return super(AsyncRecordingConnection, self).perform_request(*args, **kwargs)
+
+    async def close(self):
+        pass
+
+
+class TestDocument(Document):
+    name = Keyword()
+    tag = Keyword()
+    n = Long()
+
+    class Index:
+        name = INDEX
+        using = USING
+
+
+class TestForm(forms.Form):
+    name = forms.CharField()
+    tag = forms.CharField(required=False)
+    n = forms.IntegerField(required=False)
+
+
+class ESTestCase(SimpleTestCase):
+    """
+    每个测试使用新的 connection_class(默认为 RecordingConnection), connection_kwargs 为其参数
+    进程级的mapping缓存在每个测试前清空
+    """
+
+    connection_class = RecordingConnection
+    connection_kwargs = {}
+
+    def setUp(self):
+        self.es = Elasticsearch(connection_class=self.connection_class, max_retries=0, **self.connection_kwargs)
+        connections.add_connection(USING, self.es)
+        self.addCleanup(connections.remove_connection, USING)
+        mapping_cache.invalidate()
+
+    @property
+    def connection(self) -> RecordingConnection:
+        return self.es.transport.get_connection()
+
+
+class AsyncESTestCase(ESTestCase):
+    """异步视图的测试, 同一连接别名下另外注册使用 AsyncRecordingConnection 的 AsyncElasticsearch"""
+
+    def setUp(self):
+        super(AsyncESTestCase, self).setUp()
+        self.async_es = AsyncElasticsearch(
+            connection_class=AsyncRecordingConnection, max_retries=0, **self.connection_kwargs
+        )
+        async_connections.add_connection(USING, self.async_es)
+        self.addCleanup(async_connections.remove_connection, USING)
+
+    @property
+    def connection(self) -> AsyncRecordingConnection:
+        return self.async_es.transport.get_connection()
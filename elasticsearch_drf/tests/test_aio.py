@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.aio.utils import execute
+from elasticsearch_drf.aio.viewsets import AsyncESModelViewSet
+from elasticsearch_drf.asgi import AsyncStreamingHttpResponse
+from elasticsearch_drf.tests.base import AsyncESTestCase, TestDocument
+
+TOTAL = 25
+
+
+class AsyncViewSet(AsyncESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+
+
+class AsyncStreamTests(AsyncESTestCase):
+    connection_kwargs = {"documents": [{"n": i} for i in range(TOTAL)], "total": TOTAL}
+
+    def setUp(self):
+        super(AsyncStreamTests, self).setUp()
+        self.factory = APIRequestFactory()
+
+    async def stream(self, params):
+        view = AsyncViewSet.as_view({"get": "list"})
+        response = await view(self.factory.get("/", {"format": "ndjson", **params}))
+        self.assertIsInstance(response, AsyncStreamingHttpResponse)
+        content = b"".join([part async for part in response.async_streaming_content])
+        return [json.loads(line)["n"] for line in content.splitlines()]
+
+    @override_settings(ES_REST_FRAMEWORK={"ES_MAX_OFFSET": 10})
+    def test_stream_is_fetched_in_batches(self):
+        positions = asyncio.run(self.stream({}))
+
+        self.assertEqual(sorted(positions), list(range(TOTAL)))
+        # 超过max_result_window的结果分批拉取, 不是一次取回
+        self.assertGreater(len(self.connection.get_requests("/_search/scroll")), 1)
+
+    def test_size_limits_the_stream(self):
+        self.assertEqual(asyncio.run(self.stream({"size": 3})), [0, 1, 2])
+
+
+class AsyncSingleFlightTests(AsyncESTestCase):
+    def test_concurrent_searches_are_coalesced(self):
+        async def run():
+            return await asyncio.gather(*[execute(TestDocument.search()[:3]) for _ in range(5)])
+
+        responses = asyncio.run(run())
+
+        self.assertEqual(len(self.connection.get_requests("/_search")), 1)
+        self.assertEqual({len(response.hits) for response in responses}, {3})
+        # 各调用方得到各自的响应对象
+        self.assertEqual(len({id(response.to_dict()["hits"]) for response in responses}), 5)
+
+    @override_settings(ES_REST_FRAMEWORK={"SINGLE_FLIGHT": False})
+    def test_disabled(self):
+        async def run():
+            return await asyncio.gather(*[execute(TestDocument.search()[:3]) for _ in range(3)])
+
+        asyncio.run(run())
+        self.assertEqual(len(self.connection.get_requests("/_search")), 3)
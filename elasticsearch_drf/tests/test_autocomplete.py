@@ -0,0 +1,110 @@
+import json
+
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.autocomplete import SUGGEST_NAME, prefix_cache
+from elasticsearch_drf.tests.base import INDEX, ESTestCase, RecordingConnection, TestDocument
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+MAPPING = {"properties": {"suggest": {"type": "completion"}, "title": {"type": "search_as_you_type"}}}
+
+
+class SuggestConnection(RecordingConnection):
+    """completion建议返回_id为0和7的两条补全(7不在索引的文档范围内), 文档的title为 "title <位置>" """
+
+    def route(self, method, url, params, body):
+        if url.endswith("/_mapping"):
+            return 200, {INDEX: {"mappings": MAPPING}}
+        return super(SuggestConnection, self).route(method, url, params, body)
+
+    def get_source(self, position):
+        return {"title": "title %s" % position}
+
+    def get_search_response(self, index, from_, size, body):
+        response = super(SuggestConnection, self).get_search_response(index, from_, size, body)
+        if "suggest" in body:
+            prefix = body["suggest"][SUGGEST_NAME]["prefix"]
+            options = [{"_id": _id, "text": "%s %s" % (prefix, _id)} for _id in ("0", "7")]
+            response["suggest"] = {SUGGEST_NAME: [{"text": prefix, "options": options}]}
+        return response
+
+
+class CompletionViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+    autocomplete_field = "suggest"
+
+
+class FilteredCompletionViewSet(CompletionViewSet):
+    def get_search(self):
+        return super(FilteredCompletionViewSet, self).get_search().filter("term", tag="a")
+
+
+class SearchAsYouTypeViewSet(CompletionViewSet):
+    autocomplete_field = "title"
+    autocomplete_size = 2
+
+
+class DisabledViewSet(CompletionViewSet):
+    autocomplete_field = None
+
+
+class AutocompleteTests(ESTestCase):
+    connection_class = SuggestConnection
+    connection_kwargs = {"total": 5}
+
+    def setUp(self):
+        super(AutocompleteTests, self).setUp()
+        prefix_cache.clear()
+        self.factory = APIRequestFactory()
+
+    def autocomplete(self, prefix, viewset=CompletionViewSet):
+        return viewset.as_view({"get": "autocomplete"})(self.factory.get("/", {"prefix": prefix}))
+
+    def get_search_bodies(self):
+        return [json.loads(body) for body in self.connection.get_requests("/_search")]
+
+    def test_completion(self):
+        response = self.autocomplete("ab")
+
+        self.assertEqual(response.data, [{"_id": "0", "text": "ab 0"}, {"_id": "7", "text": "ab 7"}])
+        (body,) = self.get_search_bodies()
+        self.assertEqual(
+            body["suggest"][SUGGEST_NAME],
+            {"prefix": "ab", "completion": {"field": "suggest", "size": 10, "skip_duplicates": True}},
+        )
+        self.assertEqual((body["size"], body["_source"]), (0, False))
+
+    def test_short_prefixes_are_cached(self):
+        for prefix in ("ab", "ab", "abcd", "abcd"):
+            self.autocomplete(prefix)
+        self.assertEqual(
+            [body["suggest"][SUGGEST_NAME]["prefix"] for body in self.get_search_bodies()], ["ab", "abcd", "abcd"]
+        )
+
+    def test_filtered_completion_drops_suggestions_out_of_scope(self):
+        response = self.autocomplete("ab", viewset=FilteredCompletionViewSet)
+
+        self.assertEqual(response.data, [{"_id": "0", "text": "ab 0"}])
+        suggest, scope = self.get_search_bodies()
+        self.assertIn({"term": {"tag": "a"}}, scope["query"]["bool"]["filter"])
+
+    def test_search_as_you_type(self):
+        response = self.autocomplete("ti", viewset=SearchAsYouTypeViewSet)
+
+        self.assertEqual(response.data, [{"_id": "0", "text": "title 0"}, {"_id": "1", "text": "title 1"}])
+        (body,) = self.get_search_bodies()
+        self.assertEqual(
+            body["query"]["multi_match"],
+            {"query": "ti", "type": "bool_prefix", "fields": ["title", "title._2gram", "title._3gram"]},
+        )
+
+    def test_empty_prefix(self):
+        self.assertEqual(self.autocomplete(" ").data, [])
+        self.assertEqual(self.get_search_bodies(), [])
+
+    def test_not_enabled(self):
+        response = self.autocomplete("ab", viewset=DisabledViewSet)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,29 @@
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from elasticsearch_dsl import connections
+
+from elasticsearch_drf.benchmarks import views
+
+
+@override_settings(ES_REST_FRAMEWORK={"ES_MAX_OFFSET": 20})
+class ViewBenchmarkTests(SimpleTestCase):
+    """以很小的规模运行全部场景, 只验证基准测试可以离线运行及其统计结果"""
+
+    def setUp(self):
+        caches["default"].clear()
+        self.addCleanup(connections.remove_connection, views.CONNECTION_ALIAS)
+
+    def test_all_cases_run_offline(self):
+        results = views.run(requests=3, total=50, unpaged_hits=30, bulk_requests=1)
+
+        self.assertEqual(list(results), ["shallow", "deep", "unpaged", "scan", "retrieve", "create"])
+        for name, result in results.items():
+            self.assertEqual(set(result), {"rps", "round_trips", "peak_kib", "p50_ms", "p99_ms"}, name)
+            self.assertGreater(result["rps"], 0, name)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"], name)
+        # 浅分页、按_id查询和新增各只需一次ES请求
+        self.assertEqual([results[name]["round_trips"] for name in ("shallow", "retrieve", "create")], [1, 1, 1])
+
+    def test_selected_cases(self):
+        results = views.run(requests=2, total=50, cases=["retrieve"])
+        self.assertEqual(list(results), ["retrieve"])
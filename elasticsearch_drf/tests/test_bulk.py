@@ -0,0 +1,80 @@
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.tests.base import INDEX, ESTestCase, TestDocument, TestForm
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+
+class BulkViewSet(ESModelViewSet):
+    model_class = TestDocument
+    form_class = TestForm
+    authentication_classes = []
+    permission_classes = []
+
+
+class ScopedBulkViewSet(BulkViewSet):
+    def get_search(self):
+        return super(ScopedBulkViewSet, self).get_search().filter("term", tag="a")
+
+
+class HookedBulkViewSet(ScopedBulkViewSet):
+    destroyed = None
+
+    def perform_destroy(self, instance):
+        self.destroyed.append((instance.meta.id, instance.meta.index))
+        super(HookedBulkViewSet, self).perform_destroy(instance)
+
+
+class BulkScopeTests(ESTestCase):
+    """RecordingConnection 中只有_id为0~4的文档在过滤范围内"""
+
+    connection_kwargs = {"total": 5}
+
+    def setUp(self):
+        super(BulkScopeTests, self).setUp()
+        self.factory = APIRequestFactory()
+
+    def post(self, viewset, name, data, **initkwargs):
+        view = viewset.as_view({"post": name}, **initkwargs)
+        return view(self.factory.post("/", data, format="json"))
+
+    def get_results(self, response):
+        return [(item["_id"], item["status"]) for item in response.data["items"]]
+
+    def test_unfiltered_view_writes_without_lookup(self):
+        response = self.post(BulkViewSet, "bulk_update", [{"_id": "1", "n": 1}, {"_id": "7", "n": 1}])
+
+        self.assertEqual(self.get_results(response), [("1", 200), ("7", 200)])
+        self.assertEqual(self.connection.get_requests("/_search"), [])
+        self.assertEqual(
+            [(op_type, meta["_id"], meta["_index"]) for op_type, meta in self.connection.get_bulk_actions()],
+            [("update", "1", INDEX), ("update", "7", INDEX)],
+        )
+
+    def test_update_outside_scope(self):
+        response = self.post(ScopedBulkViewSet, "bulk_update", [{"_id": "1", "n": 1}, {"_id": "7", "n": 1}])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["errors"])
+        self.assertEqual(self.get_results(response), [("1", 200), ("7", 404)])
+        self.assertEqual([meta["_id"] for op_type, meta in self.connection.get_bulk_actions()], ["1"])
+
+    def test_destroy_outside_scope(self):
+        response = self.post(ScopedBulkViewSet, "bulk_destroy", ["7", "2"])
+
+        self.assertEqual(self.get_results(response), [("7", 404), ("2", 200)])
+        self.assertEqual(self.connection.get_bulk_actions(), [("delete", {"_index": INDEX, "_id": "2"})])
+
+    def test_invalid_items(self):
+        response = self.post(ScopedBulkViewSet, "bulk_update", [{"_id": "1", "n": "x"}, {"n": 1}, {"_id": "2", "n": 1}])
+
+        self.assertEqual(self.get_results(response), [("1", 400), (None, 400), ("2", 200)])
+        self.assertEqual([meta["_id"] for op_type, meta in self.connection.get_bulk_actions()], ["2"])
+
+    def test_overridden_hooks_are_called_per_item(self):
+        destroyed = []
+        response = self.post(HookedBulkViewSet, "bulk_destroy", ["1", "7"], destroyed=destroyed)
+
+        self.assertEqual(self.get_results(response), [("1", 200), ("7", 404)])
+        self.assertEqual(destroyed, [("1", INDEX)])
+        self.assertEqual(self.connection.get_requests("/_bulk"), [])
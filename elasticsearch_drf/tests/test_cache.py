@@ -0,0 +1,87 @@
+import json
+
+from django.core.cache import caches
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.pagination import ESCursorPagination
+from elasticsearch_drf.tests.base import ESTestCase, TestDocument, TestForm
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+
+class CachedViewSet(ESModelViewSet):
+    model_class = TestDocument
+    form_class = TestForm
+    authentication_classes = []
+    permission_classes = []
+    result_cache_timeout = 60
+
+
+class CachedCursorViewSet(CachedViewSet):
+    pagination_class = ESCursorPagination
+
+
+class ResultCacheTests(ESTestCase):
+    connection_kwargs = {"total": 25}
+
+    def setUp(self):
+        super(ResultCacheTests, self).setUp()
+        caches["default"].clear()
+        self.factory = APIRequestFactory()
+
+    def list(self, params=None, viewset=CachedViewSet, **extra):
+        response = viewset.as_view({"get": "list"})(self.factory.get("/", params or {}, **extra))
+        if hasattr(response, "render"):
+            # 未缓存的响应(如刚写入后)是普通的Response
+            response.render()
+        return json.loads(response.content)
+
+    def count_searches(self):
+        return len(self.connection.get_requests("/_search"))
+
+    def test_hit_skips_es(self):
+        first = self.list()
+        self.assertEqual(self.count_searches(), 1)
+        self.assertEqual(self.list(), first)
+        self.assertEqual(self.count_searches(), 1)
+        # 分页参数不同的页分别缓存
+        self.list({"page": 2})
+        self.assertEqual(self.count_searches(), 2)
+
+    def test_cursor_hit_skips_the_page_search(self):
+        link = self.list(viewset=CachedCursorViewSet)["next"]
+        params = {"cursor": link.split("cursor=")[1]}
+        self.list(params, viewset=CachedCursorViewSet)
+        searches, pits = self.count_searches(), len(self.connection.get_requests("/_pit"))
+
+        self.list(params, viewset=CachedCursorViewSet)
+        self.assertEqual(self.count_searches(), searches)
+        self.assertEqual(len(self.connection.get_requests("/_pit")), pits)
+
+    def test_links_are_cached_per_host(self):
+        first = self.list(viewset=CachedCursorViewSet, HTTP_HOST="a.example.com")
+        second = self.list(viewset=CachedCursorViewSet, HTTP_HOST="b.example.com")
+
+        self.assertTrue(first["next"].startswith("http://a.example.com/"))
+        self.assertTrue(second["next"].startswith("http://b.example.com/"))
+
+    def test_not_cached_before_the_write_is_refreshed(self):
+        CachedViewSet.as_view({"post": "create"})(self.factory.post("/", {"name": "a"}, format="json"))
+        self.list()
+        self.list()
+        self.assertEqual(self.count_searches(), 2)
+
+    @override_settings(ES_REST_FRAMEWORK={"RESULT_CACHE_REFRESH_INTERVAL": 0})
+    def test_write_invalidates(self):
+        self.list()
+        CachedViewSet.as_view({"post": "create"})(self.factory.post("/", {"name": "a"}, format="json"))
+        self.list()
+        self.list()
+        self.assertEqual(self.count_searches(), 2)
+
+    def test_bulk_waiting_for_refresh_is_cached_at_once(self):
+        view = CachedViewSet.as_view({"post": "bulk_create"})
+        view(self.factory.post("/?refresh=wait_for", [{"name": "a"}], format="json"))
+        self.list()
+        self.list()
+        self.assertEqual(self.count_searches(), 1)
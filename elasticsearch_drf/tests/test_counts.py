@@ -0,0 +1,66 @@
+import json
+
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.counts import index_stats_cache
+from elasticsearch_drf.pagination import ESPagination
+from elasticsearch_drf.tests.base import ESTestCase, TestDocument
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+TOTAL = 25
+
+
+class CappedPagination(ESPagination):
+    count_policy = "capped"
+    count_cap = 10
+
+
+class EstimatedPagination(CappedPagination):
+    count_policy = "estimated"
+
+
+class CappedViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+    filter_fields = ["tag"]
+    pagination_class = CappedPagination
+
+
+class EstimatedViewSet(CappedViewSet):
+    pagination_class = EstimatedPagination
+
+
+class CountPolicyTests(ESTestCase):
+    connection_kwargs = {"total": TOTAL}
+
+    def setUp(self):
+        super(CountPolicyTests, self).setUp()
+        index_stats_cache._cache.clear()
+        self.factory = APIRequestFactory()
+
+    def list(self, viewset, params=None):
+        data = viewset.as_view({"get": "list"})(self.factory.get("/", params or {})).data
+        return data["count"], data["count_relation"]
+
+    def get_track_total_hits(self):
+        return [json.loads(body)["track_total_hits"] for body in self.connection.get_requests("/_search")]
+
+    def test_capped_count_is_a_lower_bound(self):
+        self.assertEqual(self.list(CappedViewSet), (10, "gte"))
+        self.assertEqual(self.get_track_total_hits(), [10])
+
+    def test_capped_count_under_the_cap_is_exact(self):
+        self.connection.set_total(5)
+        self.assertEqual(self.list(CappedViewSet), (5, "eq"))
+
+    def test_estimated_count_comes_from_cached_index_stats(self):
+        for _ in range(2):
+            self.assertEqual(self.list(EstimatedViewSet), (TOTAL, "estimated"))
+
+        self.assertEqual(self.get_track_total_hits(), [False, False])
+        self.assertEqual(len(self.connection.get_requests("/_stats/docs")), 1)
+
+    def test_filtered_estimated_count_is_capped(self):
+        self.assertEqual(self.list(EstimatedViewSet, {"tag": "a"}), (10, "gte"))
+        self.assertEqual(self.connection.get_requests("/_stats/docs"), [])
@@ -0,0 +1,73 @@
+import threading
+
+from django.core.cache import caches
+from django.test import override_settings
+
+from elasticsearch_drf.tests.base import ESTestCase, RecordingConnection, TestDocument
+from elasticsearch_drf.utils import iter_sliced_hits
+
+TOTAL = 30
+EXPORT_SETTINGS = {"EXPORT_SLICES": 2, "EXPORT_BATCH_SIZE": 5, "EXPORT_BUFFER_SIZE": 1}
+
+
+class FailingSliceConnection(RecordingConnection):
+    """切片1的查询返回500"""
+
+    def search(self, index, params, body):
+        if body.get("slice", {}).get("id") == 1:
+            return 500, {"error": {"type": "exception", "reason": "slice failed"}, "status": 500}
+        return super(FailingSliceConnection, self).search(index, params, body)
+
+
+@override_settings(ES_REST_FRAMEWORK=EXPORT_SETTINGS)
+class ExportTestCase(ESTestCase):
+    connection_kwargs = {"total": TOTAL}
+
+    def setUp(self):
+        super(ExportTestCase, self).setUp()
+        caches["default"].clear()
+
+    def closed_pits(self):
+        return [url for method, url, body in self.connection.requests if method == "DELETE" and url == "/_pit"]
+
+    def export_threads(self):
+        return [t for t in threading.enumerate() if t.name.startswith("es-export")]
+
+
+class SlicedExportTests(ExportTestCase):
+    def test_complete_export_closes_the_pit(self):
+        ids = [hit["_id"] for hit in iter_sliced_hits(TestDocument.search(), raw=True)]
+
+        self.assertEqual(sorted(ids, key=int), [str(i) for i in range(TOTAL)])
+        self.assertEqual(len(self.closed_pits()), 1)
+
+    def test_early_close_stops_the_workers_and_closes_the_pit(self):
+        hits = iter_sliced_hits(TestDocument.search(), raw=True)
+        next(hits)
+        hits.close()
+
+        self.assertEqual(len(self.closed_pits()), 1)
+        self.assertEqual(self.export_threads(), [])
+
+    def test_checkpointed_export_keeps_the_pit_until_resumed(self):
+        hits = iter_sliced_hits(TestDocument.search(), raw=True, checkpoint_key="job")
+        first = [next(hits)["_id"] for _ in range(7)]
+        hits.close()
+        self.assertEqual(self.closed_pits(), [])
+
+        rest = [hit["_id"] for hit in iter_sliced_hits(TestDocument.search(), raw=True, checkpoint_key="job")]
+        # 中断时未消费完的那一批重新返回
+        self.assertEqual(sorted(set(first + rest), key=int), [str(i) for i in range(TOTAL)])
+        self.assertEqual(len(self.closed_pits()), 1)
+        self.assertEqual(len(self.connection.get_requests("/_pit")), 2)
+
+
+class FailingSlicedExportTests(ExportTestCase):
+    connection_class = FailingSliceConnection
+
+    def test_worker_error_closes_the_pit(self):
+        with self.assertRaises(Exception):
+            list(iter_sliced_hits(TestDocument.search(), raw=True))
+
+        self.assertEqual(len(self.closed_pits()), 1)
+        self.assertEqual(self.export_threads(), [])
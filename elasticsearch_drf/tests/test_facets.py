@@ -0,0 +1,70 @@
+import json
+
+from django.core.cache import caches
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.tests.base import ESTestCase, RecordingConnection, TestDocument
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+
+class FacetConnection(RecordingConnection):
+    """各聚合返回一个桶, doc_count 为文档总数"""
+
+    def get_search_response(self, index, from_, size, body):
+        response = super(FacetConnection, self).get_search_response(index, from_, size, body)
+        if body.get("aggs"):
+            response["aggregations"] = {
+                name: {"buckets": [{"key": name, "doc_count": self.total}]} for name in body["aggs"]
+            }
+        return response
+
+
+class FacetViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+    facets = {
+        "tag": {"terms": {"field": "tag"}},
+        "n": {"range": {"field": "n", "ranges": [{"to": 10}, {"from": 10}]}},
+    }
+
+
+class FacetTests(ESTestCase):
+    connection_class = FacetConnection
+    connection_kwargs = {"total": 25}
+
+    def setUp(self):
+        super(FacetTests, self).setUp()
+        caches["default"].clear()
+        self.factory = APIRequestFactory()
+
+    def list(self, params=None):
+        return FacetViewSet.as_view({"get": "list"})(self.factory.get("/", params or {})).data
+
+    def get_search_bodies(self):
+        return [json.loads(body) for body in self.connection.get_requests("/_search")]
+
+    def test_facets_come_with_the_page(self):
+        data = self.list()
+
+        self.assertEqual(
+            data["facets"],
+            {"tag": [{"key": "tag", "doc_count": 25}], "n": [{"key": "n", "doc_count": 25}]},
+        )
+        self.assertEqual(len(data["results"]), 10)
+        (body,) = self.get_search_bodies()
+        self.assertEqual(body["aggs"], FacetViewSet.facets)
+
+    def test_cached_facets_are_not_aggregated_again(self):
+        first = self.list()
+        second = self.list({"page": 2})
+
+        self.assertEqual(second["facets"], first["facets"])
+        self.assertEqual(["aggs" in body for body in self.get_search_bodies()], [True, False])
+
+    def test_facets_param_selects_facets(self):
+        data = self.list({"facets": "tag"})
+
+        self.assertEqual(list(data["facets"]), ["tag"])
+        (body,) = self.get_search_bodies()
+        self.assertEqual(list(body["aggs"]), ["tag"])
@@ -0,0 +1,96 @@
+import json
+
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.tests.base import INDEX, ESTestCase, RecordingConnection, TestDocument
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+
+class ParamsConnection(RecordingConnection):
+    """另外记录各请求的 (url, 参数)"""
+
+    def __init__(self, **kwargs):
+        super(ParamsConnection, self).__init__(**kwargs)
+        self.params = []
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        self.params.append((url, dict(params or {})))
+        return super(ParamsConnection, self).perform_request(method, url, params, body, timeout, ignore, headers)
+
+
+class FilterViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+
+
+class LookupViewSet(FilterViewSet):
+    filter_fields = {"name": ["exact", "in", "prefix"], "tag": ["exact", "exists"], "n": ["gte", "lt"]}
+
+
+class FilterTestCase(ESTestCase):
+    viewset = FilterViewSet
+
+    def setUp(self):
+        super(FilterTestCase, self).setUp()
+        self.factory = APIRequestFactory()
+
+    def search(self, params):
+        """以params请求列表, 返回发给ES的查询"""
+        response = self.viewset.as_view({"get": "list"})(self.factory.get("/", params))
+        self.assertEqual(response.status_code, 200)
+        (body,) = [json.loads(body) for body in self.connection.get_requests("/_search")]
+        return body
+
+
+class FilterTests(FilterTestCase):
+    viewset = LookupViewSet
+
+    def test_filters_are_not_scored(self):
+        body = self.search({"name": "a", "n__gte": "1", "n__lt": "5"})
+        self.assertEqual(list(body["query"]["bool"]), ["filter"])
+        self.assertEqual(
+            body["query"]["bool"]["filter"],
+            [{"term": {"name": "a"}}, {"range": {"n": {"gte": "1"}}}, {"range": {"n": {"lt": "5"}}}],
+        )
+
+    def test_in_exists_and_prefix(self):
+        body = self.search({"name__in": "a, b", "tag__exists": "false", "name__prefix": "ab"})
+        self.assertEqual(
+            body["query"]["bool"]["filter"],
+            [
+                {"terms": {"name": ["a", "b"]}},
+                {"bool": {"must_not": [{"exists": {"field": "tag"}}]}},
+                {"prefix": {"name": "ab"}},
+            ],
+        )
+
+    def test_undeclared_lookups_are_ignored(self):
+        body = self.search({"n": "1", "tag__in": "a,b", "n__gt": "1"})
+        self.assertNotIn("query", body)
+
+
+class SourceFilterTests(FilterTestCase):
+    def test_fields_and_exclude(self):
+        body = self.search({"fields": "name, n", "exclude": "tag"})
+        self.assertEqual(body["_source"], {"includes": ["name", "n"], "excludes": ["tag"]})
+
+    def test_wildcards_and_unknown_fields(self):
+        body = self.search({"fields": "na*,unknown"})
+        self.assertEqual(body["_source"], {"includes": ["na*"]})
+
+    def test_only_unknown_fields_keep_the_full_source(self):
+        body = self.search({"fields": "unknown"})
+        self.assertNotIn("_source", body)
+
+
+class RetrieveSourceFilterTests(FilterTestCase):
+    connection_class = ParamsConnection
+
+    def test_retrieve_passes_the_fields_to_get(self):
+        view = self.viewset.as_view({"get": "retrieve"})
+        response = view(self.factory.get("/", {"fields": "name,n", "exclude": "tag"}), _id="1")
+
+        self.assertEqual(response.status_code, 200)
+        (params,) = [params for url, params in self.connection.params if url == "/%s/_doc/1" % INDEX]
+        self.assertEqual((params["_source_includes"], params["_source_excludes"]), (b"name,n", b"tag"))
@@ -0,0 +1,148 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from elasticsearch.exceptions import NotFoundError
+
+from elasticsearch_drf.asgi import AsyncStreamingHttpResponse
+from elasticsearch_drf.benchmarks.fake import BaseFakeConnection, FakeConnection
+from elasticsearch_drf.instrumentation import (
+    AsyncInstrumentationMixin,
+    InstrumentationMixin,
+    RequestStats,
+    start_request_stats,
+    stop_request_stats,
+    wrap_streaming_response,
+)
+
+CONTENT_LENGTH = 12345
+
+
+class BaseContentLengthConnection(BaseFakeConnection):
+    """响应头带Content-Length(取固定值, 与响应的实际长度不同)"""
+
+    def perform_request(self, *args, **kwargs):
+        status, headers, data = super(BaseContentLengthConnection, self).perform_request(*args, **kwargs)
+        return status, {**headers, "content-length": str(CONTENT_LENGTH)}, data
+
+
+class ContentLengthConnection(InstrumentationMixin, BaseContentLengthConnection):
+    pass
+
+
+class AsyncBaseFakeConnection(BaseFakeConnection):
+    async def perform_request(self, *args, **kwargs):
+        await asyncio.sleep(0)
+        return super(AsyncBaseFakeConnection, self).perform_request(*args, **kwargs)
+
+    async def close(self):
+        pass
+
+
+class AsyncFakeConnection(AsyncInstrumentationMixin, AsyncBaseFakeConnection):
+    pass
+
+
+class InstrumentationTests(SimpleTestCase):
+    def setUp(self):
+        self.stats, token = start_request_stats()
+        self.addCleanup(stop_request_stats, token)
+
+    def search(self, connection_class=FakeConnection):
+        es = Elasticsearch(connection_class=connection_class, total=3)
+        es.info()
+        self.stats.__init__()
+        return es.transport.perform_request("POST", "/test-docs/_search", body={"size": 3})
+
+    def test_size_falls_back_to_the_decoded_length(self):
+        response = self.search()
+
+        self.assertEqual(self.stats.calls, 1)
+        self.assertEqual(self.stats.took, 1)
+        self.assertEqual(self.stats.size, len(json.dumps(response)))
+
+    def test_size_from_content_length(self):
+        self.search(ContentLengthConnection)
+        self.assertEqual(self.stats.size, CONTENT_LENGTH)
+
+    def test_failed_requests_are_counted(self):
+        es = Elasticsearch(connection_class=FakeConnection)
+        es.info()
+        self.stats.__init__()
+        with self.assertRaises(NotFoundError):
+            es.transport.perform_request("GET", "/missing/_unknown")
+        self.assertEqual((self.stats.calls, self.stats.size), (1, 0))
+
+    def test_async_requests_are_counted(self):
+        async def search():
+            es = AsyncElasticsearch(connection_class=AsyncFakeConnection, total=3)
+            await es.info()
+            self.stats.__init__()
+            await asyncio.gather(*[es.search(index="test-docs", body={"size": 3}) for _ in range(3)])
+
+        asyncio.run(search())
+        self.assertEqual((self.stats.calls, self.stats.took), (3, 3))
+
+    def test_record_is_thread_safe(self):
+        stats = RequestStats()
+        with ThreadPoolExecutor(8) as pool:
+            for _ in range(8):
+                pool.submit(lambda: [stats.record(1, 0.5, 10) for _ in range(1000)])
+        self.assertEqual(stats.to_dict(), {"calls": 8000, "took": 8000, "duration": 4000.0, "size": 80000})
+
+
+class StreamingStatsTests(SimpleTestCase):
+    """流式内容在统计上下文之外生成, 包装后其中的ES请求仍计入请求的统计"""
+
+    def setUp(self):
+        self.es = Elasticsearch(connection_class=FakeConnection, total=3)
+        self.es.info()
+
+    def content(self, n):
+        for i in range(n):
+            self.es.search(index="test-docs", body={"size": 3})
+            yield b"x"
+
+    def test_stream_requests_are_counted_and_closed(self):
+        stats, closed = RequestStats(), []
+        response = StreamingHttpResponse(self.content(3))
+        wrap_streaming_response(response, stats, lambda: closed.append(stats.calls))
+
+        self.assertEqual(b"".join(response), b"xxx")
+        self.assertEqual(closed, [3])
+
+    def test_early_close(self):
+        stats, closed = RequestStats(), []
+        response = StreamingHttpResponse(self.content(3))
+        wrap_streaming_response(response, stats, lambda: closed.append(stats.calls))
+
+        next(iter(response))
+        response.close()
+        self.assertEqual(closed, [1])
+
+    def test_async_stream(self):
+        stats, closed, finished = RequestStats(), [], []
+
+        async def content():
+            try:
+                for part in self.content(3):
+                    yield part
+            finally:
+                finished.append(True)
+
+        async def consume(response, n):
+            parts = []
+            async for part in response.async_streaming_content:
+                parts.append(part)
+                if len(parts) == n:
+                    break
+            await response.aclose()
+            return parts
+
+        response = AsyncStreamingHttpResponse(content())
+        wrap_streaming_response(response, stats, lambda: closed.append(stats.calls))
+        self.assertEqual(asyncio.run(consume(response, 2)), [b"x", b"x"])
+        self.assertEqual((closed, finished), ([2], [True]))
@@ -0,0 +1,78 @@
+import json
+
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.mappings import mapping_cache
+from elasticsearch_drf.tests.base import INDEX, ESTestCase, RecordingConnection, TestDocument
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+NESTED_MAPPING = {
+    "properties": {
+        "title": {"type": "text", "fields": {"raw": {"type": "keyword"}}},
+        "author": {"properties": {"name": {"type": "keyword"}, "tags": {"type": "nested", "properties": {}}}},
+    }
+}
+
+
+class NestedMappingConnection(RecordingConnection):
+    def route(self, method, url, params, body):
+        if url.endswith("/_mapping"):
+            return 200, {INDEX: {"mappings": NESTED_MAPPING}}
+        return super(NestedMappingConnection, self).route(method, url, params, body)
+
+
+class OrderingViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+    ordering_fields = "__all__"
+
+
+class MappingCacheTests(ESTestCase):
+    def get_mapping_requests(self):
+        return self.connection.get_requests("/_mapping")
+
+    def test_mapping_is_fetched_once(self):
+        for _ in range(2):
+            field_types = mapping_cache.get_field_types(TestDocument)
+
+        self.assertEqual(field_types, {"name": "keyword", "tag": "keyword", "n": "long"})
+        self.assertEqual(len(self.get_mapping_requests()), 1)
+
+    @override_settings(ES_REST_FRAMEWORK={"MAPPING_CACHE_TIMEOUT": 0})
+    def test_expired_mapping_is_fetched_again(self):
+        mapping_cache.get_field_types(TestDocument)
+        mapping_cache.get_field_types(TestDocument)
+        self.assertEqual(len(self.get_mapping_requests()), 2)
+
+    def test_invalidate(self):
+        mapping_cache.get_properties(TestDocument)
+        mapping_cache.invalidate(TestDocument)
+        mapping_cache.get_properties(TestDocument)
+        self.assertEqual(len(self.get_mapping_requests()), 2)
+
+    def test_ordering_filter_reads_the_cached_mapping(self):
+        factory = APIRequestFactory()
+        for _ in range(2):
+            OrderingViewSet.as_view({"get": "list"})(factory.get("/", {"ordering": "-n,unknown"}))
+
+        self.assertEqual(len(self.get_mapping_requests()), 1)
+        bodies = [json.loads(body) for body in self.connection.get_requests("/_search")]
+        self.assertEqual([body["sort"] for body in bodies], [[{"n": {"order": "desc"}}]] * 2)
+
+
+class FieldTypesTests(ESTestCase):
+    connection_class = NestedMappingConnection
+
+    def test_sub_fields_are_flattened(self):
+        self.assertEqual(
+            mapping_cache.get_field_types(TestDocument),
+            {
+                "title": "text",
+                "title.raw": "keyword",
+                "author": "object",
+                "author.name": "keyword",
+                "author.tags": "nested",
+            },
+        )
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.filters import ESBaseFilterBackend
+from elasticsearch_drf.tests.base import ESTestCase, TestDocument
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+
+class HeaderAuthentication(BaseAuthentication):
+    """X-User 请求头中的用户名即为当前用户"""
+
+    def authenticate(self, request):
+        username = request.META.get("HTTP_X_USER")
+        if username is None:
+            return None
+        return SimpleNamespace(username=username, is_authenticated=True), None
+
+
+class OwnerFilter(ESBaseFilterBackend):
+    """只查询当前用户的文档, 未认证时不返回任何文档"""
+
+    def filter_search(self, request, search, view):
+        username = getattr(request.user, "username", None)
+        if username is None:
+            return search.filter("match_none")
+        return search.filter("term", name=username)
+
+
+class OwnerViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = [HeaderAuthentication]
+    permission_classes = []
+    filter_backends = [OwnerFilter]
+
+
+class MSearchTests(ESTestCase):
+    def setUp(self):
+        super(MSearchTests, self).setUp()
+        self.factory = APIRequestFactory()
+
+    def test_subrequests_are_scoped_to_the_user(self):
+        view = OwnerViewSet.as_view({"post": "msearch"})
+        response = view(self.factory.post("/", {"a": {}, "b": {"size": 5}}, format="json", HTTP_X_USER="alice"))
+
+        self.assertEqual(set(response.data), {"a", "b"})
+        bodies = self.connection.get_requests("/_msearch")
+        self.assertEqual(len(bodies), 1)
+        queries = bodies[0].decode("utf-8").splitlines()[1::2]
+        self.assertEqual(len(queries), 2)
+        for query in queries:
+            self.assertIn('{"term":{"name":"alice"}}', query)
+            self.assertNotIn("match_none", query)
@@ -0,0 +1,166 @@
+import json
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import caches
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.benchmarks.fake import PIT_ID
+from elasticsearch_drf.pagination import ESCursorPagination, ESPagination
+from elasticsearch_drf.tests.base import ESTestCase, TestDocument
+from elasticsearch_drf.utils import get_search_data
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+TOTAL = 25
+
+
+class PageViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+    pagination_class = ESPagination
+
+
+class CursorPagination(ESCursorPagination):
+    page_size = 10
+
+
+class CursorViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+    pagination_class = CursorPagination
+
+
+class FilteredCursorViewSet(CursorViewSet):
+    def get_search(self):
+        return super(FilteredCursorViewSet, self).get_search().filter("term", tag="a")
+
+
+class PagePaginationTests(ESTestCase):
+    connection_kwargs = {"documents": [{"n": i} for i in range(TOTAL)], "total": TOTAL}
+
+    def setUp(self):
+        super(PagePaginationTests, self).setUp()
+        self.factory = APIRequestFactory()
+
+    def test_page_is_a_single_search(self):
+        response = PageViewSet.as_view({"get": "list"})(self.factory.get("/", {"page": 2}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["count"], response.data["count_relation"]), (TOTAL, "eq"))
+        self.assertEqual([item["n"] for item in response.data["results"]], list(range(10, 20)))
+        (body,) = [json.loads(body) for body in self.connection.get_requests("/_search")]
+        self.assertEqual((body["from"], body["size"], body["track_total_hits"]), (10, 10, True))
+        self.assertEqual(self.connection.get_requests("/_count"), [])
+
+
+@override_settings(ES_REST_FRAMEWORK={"ES_MAX_OFFSET": 10})
+class DeepPagingTests(ESTestCase):
+    """from + size 超过 ES_MAX_OFFSET 的页以 search_after + PIT 获取"""
+
+    connection_kwargs = {"documents": [{"n": i} for i in range(100)], "total": 100}
+
+    def setUp(self):
+        super(DeepPagingTests, self).setUp()
+        caches["default"].clear()
+
+    def get_searches(self):
+        return [json.loads(body) for body in self.connection.get_requests("/_search")]
+
+    def test_deep_page_seeks_with_search_after(self):
+        data = get_search_data(TestDocument.search()[25:30])
+
+        self.assertEqual([item["n"] for item in data], list(range(25, 30)))
+        self.assertEqual(len(self.connection.get_requests("/_pit")), 1)
+        self.assertEqual(self.connection.get_requests("/scroll"), [])
+        # 只取排序值跳到25, 再取该页的_source
+        searches = self.get_searches()
+        self.assertEqual([body["size"] for body in searches], [10, 10, 5, 5])
+        self.assertEqual([body.get("_source", True) for body in searches], [False, False, False, True])
+        self.assertTrue(all(body["from"] == 0 and body["sort"] == ["_score", "_shard_doc"] for body in searches))
+
+    def test_next_page_starts_from_the_cached_checkpoint(self):
+        get_search_data(TestDocument.search()[25:30])
+        self.connection.requests.clear()
+
+        data = get_search_data(TestDocument.search()[30:35])
+
+        self.assertEqual([item["n"] for item in data], list(range(30, 35)))
+        (body,) = self.get_searches()
+        self.assertEqual(body["search_after"], [29, 29])
+        self.assertEqual(self.connection.get_requests("/_pit"), [])
+
+
+class CursorPaginationTests(ESTestCase):
+    connection_kwargs = {"documents": [{"n": i} for i in range(TOTAL)], "total": TOTAL}
+
+    def setUp(self):
+        super(CursorPaginationTests, self).setUp()
+        self.factory = APIRequestFactory()
+
+    def get_page(self, link=None, viewset=CursorViewSet):
+        params = {} if link is None else {k: v[0] for k, v in parse_qs(urlparse(link).query).items()}
+        return viewset.as_view({"get": "list"})(self.factory.get("/", params))
+
+    def get_positions(self, response):
+        return [item["n"] for item in response.data["results"]]
+
+    def test_round_trip(self):
+        pages, response = [], self.get_page()
+        self.assertIsNone(response.data["previous"])
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(self.get_positions(response))
+            if response.data["next"] is None:
+                break
+            response = self.get_page(response.data["next"])
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), list(range(TOTAL)))
+        # 各页共用第一页打开的PIT
+        self.assertEqual(len(self.connection.get_requests("/_pit")), 1)
+
+        # 从最后一页逐页向前, 与向后翻页得到的各页相同
+        for page in reversed(pages[:-1]):
+            response = self.get_page(response.data["previous"])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(self.get_positions(response), page)
+            self.assertIsNotNone(response.data["next"])
+        self.assertIsNone(response.data["previous"])
+
+    def test_next_after_previous(self):
+        second = self.get_page(self.get_page().data["next"])
+        third = self.get_page(second.data["next"])
+        back = self.get_page(third.data["previous"])
+
+        self.assertEqual(self.get_positions(back), self.get_positions(second))
+        self.assertEqual(self.get_positions(self.get_page(back.data["next"])), self.get_positions(third))
+
+    def test_first_page_is_sorted_with_the_tiebreaker_in_the_pit(self):
+        first = self.get_page()
+        self.get_page(first.data["next"])
+
+        bodies = [json.loads(body) for body in self.connection.get_requests("/_search")]
+        self.assertEqual([body["sort"] for body in bodies], [["_score", "_shard_doc"]] * 2)
+        self.assertEqual([body["pit"]["id"] for body in bodies], [PIT_ID] * 2)
+        # 第二页从第一页最后一个命中的排序值之后开始, 不使用from
+        self.assertNotIn("search_after", bodies[0])
+        self.assertEqual((bodies[1]["search_after"], bodies[1].get("from", 0)), ([9, 9], 0))
+
+    def test_single_page_closes_the_pit(self):
+        response = self.get_page("/?size=%s" % TOTAL)
+
+        self.assertIsNone(response.data["next"])
+        self.assertEqual(len(response.data["results"]), TOTAL)
+        self.assertEqual([method for method, url, body in self.connection.requests if url == "/_pit"], ["DELETE"])
+
+    def test_invalid_cursor(self):
+        response = self.get_page("/?cursor=garbage")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_of_another_search(self):
+        link = self.get_page().data["next"]
+        response = self.get_page(link, viewset=FilteredCursorViewSet)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,81 @@
+import json
+
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.tests.base import ESTestCase, RecordingConnection, TestDocument
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+
+class TimedOutConnection(RecordingConnection):
+    """带ES端超时的查询都返回 timed_out"""
+
+    def get_search_response(self, index, from_, size, body):
+        response = super(TimedOutConnection, self).get_search_response(index, from_, size, body)
+        response["timed_out"] = "timeout" in body
+        return response
+
+
+class LimitedViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+    search_timeout = 0.5
+    terminate_after = 1000
+    result_cache_timeout = 60
+
+
+class UnpagedViewSet(LimitedViewSet):
+    pagination_class = None
+
+
+class StrictViewSet(LimitedViewSet):
+    allow_partial_results = False
+
+
+class ListTestCase(ESTestCase):
+    connection_kwargs = {"total": 5}
+
+    def setUp(self):
+        super(ListTestCase, self).setUp()
+        caches["default"].clear()
+        self.factory = APIRequestFactory()
+
+    def list(self, viewset):
+        response = viewset.as_view({"get": "list"})(self.factory.get("/"))
+        if hasattr(response, "render"):
+            response.render()
+        return response
+
+    def get_search_bodies(self):
+        return [json.loads(body) for body in self.connection.get_requests("/_search")]
+
+
+class LimitTests(ListTestCase):
+    def test_paged_search_is_limited(self):
+        self.list(LimitedViewSet)
+        (body,) = self.get_search_bodies()
+        self.assertEqual((body["timeout"], body["terminate_after"]), ("500ms", 1000))
+
+    def test_unpaged_search_is_not_terminated_early(self):
+        response = self.list(UnpagedViewSet)
+
+        self.assertEqual(len(json.loads(response.content)), 5)
+        (body,) = self.get_search_bodies()
+        self.assertEqual(body["timeout"], "500ms")
+        self.assertNotIn("terminate_after", body)
+
+
+class PartialResultTests(ListTestCase):
+    connection_class = TimedOutConnection
+
+    def test_timed_out_page_is_flagged_and_not_cached(self):
+        for _ in range(2):
+            data = json.loads(self.list(LimitedViewSet).content)
+            self.assertEqual(data["partial"], {"timed_out": True, "terminated_early": False, "failed_shards": 0})
+        self.assertEqual(len(self.get_search_bodies()), 2)
+
+    def test_timed_out_page_is_503_without_partial_results(self):
+        response = self.list(StrictViewSet)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
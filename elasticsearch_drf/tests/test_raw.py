@@ -0,0 +1,46 @@
+from unittest import mock
+
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.tests.base import ESTestCase, TestDocument
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+
+class WrappedViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+
+
+class RawViewSet(WrappedViewSet):
+    raw_hits = True
+    raw_meta_fields = ("_id", "_score")
+
+
+class UnpagedRawViewSet(RawViewSet):
+    pagination_class = None
+    raw_meta_fields = ()
+
+
+class RawHitsTests(ESTestCase):
+    connection_kwargs = {"documents": [{"n": i} for i in range(3)], "total": 3}
+
+    def setUp(self):
+        super(RawHitsTests, self).setUp()
+        self.factory = APIRequestFactory()
+
+    def list(self, viewset):
+        return viewset.as_view({"get": "list"})(self.factory.get("/")).data
+
+    def test_raw_results_skip_document_wrapping(self):
+        wrapped = self.list(WrappedViewSet)["results"]
+        with mock.patch.object(TestDocument, "from_es", side_effect=AssertionError("wrapped a raw hit")):
+            raw = self.list(RawViewSet)["results"]
+
+        self.assertEqual(wrapped, [{"n": 0}, {"n": 1}, {"n": 2}])
+        self.assertEqual(raw, [{"n": i, "_id": str(i), "_score": 1.0} for i in range(3)])
+
+    def test_unpaged_raw_results(self):
+        with mock.patch.object(TestDocument, "from_es", side_effect=AssertionError("wrapped a raw hit")):
+            data = self.list(UnpagedRawViewSet)
+        self.assertEqual(data, [{"n": 0}, {"n": 1}, {"n": 2}])
@@ -0,0 +1,200 @@
+import json
+from unittest import skipIf
+from urllib.parse import unquote
+
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from elasticsearch import Elasticsearch
+from elasticsearch.connection import Connection
+from elasticsearch_dsl import connections
+
+from elasticsearch_drf import reindex
+from elasticsearch_drf.benchmarks.fake import HEADERS, INFO
+from elasticsearch_drf.tests.base import INDEX, USING, ESTestCase, TestDocument
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+SOURCE = INDEX + "-v1"
+
+
+class ReindexConnection(Connection):
+    """
+    保存文档的单分片ES替身, 支持重建索引用到的接口
+    _reindex 复制当时的快照后调用 on_copy, 模拟复制期间的写入; events 按顺序记录写入阻塞、复制和别名切换
+    """
+
+    def __init__(self, on_copy=None, fail_block=False, **kwargs):
+        super(ReindexConnection, self).__init__(**kwargs)
+        self.on_copy = on_copy
+        self.fail_block = fail_block
+        self.indices = {SOURCE: {}}
+        self.seq_no = 0
+        self.blocked = set()
+        self.events = []
+
+    def write(self, _id, source=None):
+        """在源索引中写入(source为None时删除)文档, 被阻塞时返回False"""
+        if SOURCE in self.blocked:
+            return False
+        if source is None:
+            self.indices[SOURCE].pop(_id, None)
+        else:
+            self.seq_no += 1
+            self.indices[SOURCE][_id] = (self.seq_no, source)
+        return True
+
+    def get_docs(self, index):
+        return {_id: source for _id, (seq_no, source) in self.indices[index].items()}
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        parts = [unquote(part) for part in url.split("?")[0].strip("/").split("/") if part]
+        status, data = self.route(method, parts, params or {}, body)
+        raw_data = json.dumps(data)
+        if not (200 <= status < 300) and status not in ignore:
+            self._raise_error(status, raw_data)
+        return status, HEADERS, raw_data
+
+    def route(self, method, parts, params, body):
+        if not parts:
+            return 200, INFO
+        if parts == ["_alias", INDEX]:
+            return 200, {name: {"aliases": {INDEX: {}}} for name in self.indices if name == SOURCE}
+        if parts[-1] == "_settings":
+            settings = json.loads(body)
+            if "index.blocks.write" in settings:
+                if self.fail_block:
+                    return 500, {"error": "settings failed"}
+                for name in parts[0].split(","):
+                    (self.blocked.add if settings["index.blocks.write"] else self.blocked.discard)(name)
+                self.events.append(("block", bool(settings["index.blocks.write"])))
+            return 200, {"acknowledged": True}
+        if parts[-1] == "_refresh":
+            return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+        if "_stats" in parts:
+            seq_no = max((seq_no for seq_no, source in self.indices[SOURCE].values()), default=-1)
+            copy = {"routing": {"primary": True}, "seq_no": {"local_checkpoint": seq_no}}
+            return 200, {"indices": {SOURCE: {"shards": {"0": [copy]}}}}
+        if parts == ["_reindex"]:
+            dest = json.loads(body)["dest"]["index"]
+            self.indices[dest] = dict(self.indices[SOURCE])
+            self.events.append(("reindex", dest))
+            if self.on_copy is not None:
+                self.on_copy(self)
+            return 200, {"task": "node:1"}
+        if parts[0] == "_tasks":
+            status = {"total": 0, "created": 0, "updated": 0, "deleted": 0, "version_conflicts": 0, "batches": 1}
+            return 200, {"completed": True, "task": {"status": status}, "response": {"failures": []}}
+        if parts == ["_aliases"]:
+            self.events.append(("aliases", json.loads(body)["actions"]))
+            return 200, {"acknowledged": True}
+        if parts[-1] == "_bulk":
+            return self.bulk(body)
+        if parts[-1] == "_search" or parts[-2:] == ["_search", "scroll"]:
+            return self.search(parts, params, json.loads(body) if body else {})
+        if len(parts) == 1 and method == "PUT":
+            self.indices[parts[0]] = {}
+            return 200, {"acknowledged": True, "index": parts[0]}
+        if len(parts) == 1 and method == "DELETE":
+            for name in parts[0].split(","):
+                self.indices.pop(name, None)
+            self.events.append(("delete", parts[0]))
+            return 200, {"acknowledged": True}
+        return 404, {"error": {"type": "resource_not_found_exception", "reason": "/".join(parts)}, "status": 404}
+
+    def search(self, parts, params, body):
+        if parts[-1] == "scroll":
+            if "scroll_id" in body and not isinstance(body["scroll_id"], list):
+                return 200, {"_scroll_id": "done", "hits": {"hits": []}, "_shards": {"total": 1, "successful": 1}}
+            return 200, {"succeeded": True, "num_freed": 1}
+        query = body.get("query", {})
+        docs = {}
+        for name in parts[0].split(","):
+            docs.update(self.indices.get(name, {}))
+        if "ids" in query:
+            ids = set(query["ids"]["values"])
+            hits = [{"_index": SOURCE, "_id": _id} for _id in docs if _id in ids]
+        else:
+            after = query["range"]["_seq_no"]["gt"]
+            hits = [
+                {"_index": SOURCE, "_id": _id, "_source": source}
+                for _id, (seq_no, source) in sorted(docs.items())
+                if seq_no > after
+            ]
+        return 200, {"_scroll_id": "s", "hits": {"hits": hits}, "_shards": {"total": 1, "successful": 1}}
+
+    def bulk(self, body):
+        lines = iter(json.loads(line) for line in body.splitlines() if line.strip())
+        items = []
+        for action in lines:
+            ((op_type, meta),) = action.items()
+            docs = self.indices[meta["_index"]]
+            if op_type == "delete":
+                status = 200 if docs.pop(meta["_id"], None) else 404
+            else:
+                docs[meta["_id"]] = (0, next(lines))
+                status = 200
+            items.append({op_type: {"_index": meta["_index"], "_id": meta["_id"], "status": status}})
+        return 200, {"took": 1, "errors": any(i[op]["status"] >= 300 for i in items for op in i), "items": items}
+
+
+class ReindexTests(ESTestCase):
+    def setUp(self):
+        super(ReindexTests, self).setUp()
+        reindex.RECORD_GRACE_PERIOD = 0
+        self.addCleanup(setattr, reindex, "RECORD_GRACE_PERIOD", 1)
+
+    def use_connection(self, **kwargs):
+        es = Elasticsearch(connection_class=ReindexConnection, max_retries=0, **kwargs)
+        connections.add_connection(USING, es)
+        conn = es.transport.get_connection()
+        for i in range(3):
+            conn.write(str(i), {"n": i})
+        return conn
+
+    def test_set_write_block_failure_deletes_the_new_index(self):
+        conn = self.use_connection(fail_block=True)
+        with self.assertRaises(Exception):
+            reindex.reindex(TestDocument)
+        self.assertEqual(list(conn.indices), [SOURCE])
+
+    @skipIf(fakeredis is None, "fakeredis is not installed")
+    def test_source_stays_writable_during_the_copy(self):
+        server = fakeredis.FakeServer()
+        written = []
+
+        def write_during_copy(conn):
+            # 复制期间: 更新0, 新增3, 删除1(视图在删除前记录)
+            written.append(conn.write("0", {"n": 10}))
+            written.append(conn.write("3", {"n": 3}))
+            reindex.record_deletes(INDEX, ["1"])
+            written.append(conn.write("1"))
+
+        conn = self.use_connection(on_copy=write_during_copy)
+        get_client = lambda: fakeredis.FakeRedis(server=server)  # noqa: E731
+        with override_settings(ES_REST_FRAMEWORK={"REINDEX_REDIS": get_client}):
+            index, progress = reindex.reindex(TestDocument)
+
+        self.assertEqual(written, [True, True, True])
+        # 复制结束后才禁止写入
+        self.assertEqual([event[0] for event in conn.events], ["reindex", "block", "aliases", "delete"])
+        self.assertEqual(conn.get_docs(index), {"0": {"n": 10}, "2": {"n": 2}, "3": {"n": 3}})
+        self.assertEqual(progress["caught_up"], 3)
+        self.assertEqual(get_client().hgetall(reindex.COPYING_KEY), {})
+
+    def test_without_redis_the_copy_is_write_blocked(self):
+        written = []
+        conn = self.use_connection(on_copy=lambda conn: written.append(conn.write("0", {"n": 10})))
+        reindex.reindex(TestDocument)
+
+        self.assertEqual(written, [False])
+        self.assertEqual([event[0] for event in conn.events], ["block", "reindex", "aliases", "delete"])
+
+    def test_invalid_slices(self):
+        for slices in ("x", "0", "-1"):
+            with self.assertRaises(CommandError):
+                call_command("es_reindex", "elasticsearch_drf.tests.base.TestDocument", "--slices", slices)
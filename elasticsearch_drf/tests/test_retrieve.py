@@ -0,0 +1,80 @@
+import json
+
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.tests.base import INDEX, ESTestCase, RecordingConnection, TestDocument
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+
+class MgetConnection(RecordingConnection):
+    """支持 _mget, 与GET相同, 位置小于total的_id存在"""
+
+    def route(self, method, url, params, body):
+        if url.endswith("/_mget"):
+            index = url.strip("/").split("/")[0]
+            docs = [self.document("GET", [index, "_doc", doc["_id"]], {})[1] for doc in json.loads(body)["docs"]]
+            return 200, {"docs": docs}
+        return super(MgetConnection, self).route(method, url, params, body)
+
+
+class RetrieveViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+
+
+class FilteredRetrieveViewSet(RetrieveViewSet):
+    def get_search(self):
+        return super(FilteredRetrieveViewSet, self).get_search().filter("term", tag="a")
+
+
+class RetrieveTests(ESTestCase):
+    connection_class = MgetConnection
+    connection_kwargs = {"documents": [{"n": i} for i in range(5)], "total": 5}
+
+    def setUp(self):
+        super(RetrieveTests, self).setUp()
+        self.factory = APIRequestFactory()
+
+    def retrieve(self, _id, viewset=RetrieveViewSet):
+        return viewset.as_view({"get": "retrieve"})(self.factory.get("/"), _id=_id)
+
+    def batch_retrieve(self, ids, viewset=RetrieveViewSet):
+        return viewset.as_view({"get": "batch_retrieve"})(self.factory.get("/", {"ids": ids}))
+
+    def get_urls(self):
+        return [url for method, url, body in self.connection.requests if url != "/"]
+
+    def test_retrieve_is_a_realtime_get(self):
+        response = self.retrieve("2")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"n": 2})
+        self.assertEqual(self.get_urls(), ["/%s/_doc/2" % INDEX])
+        self.assertEqual(self.retrieve("9").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_filtered_retrieve_searches(self):
+        response = self.retrieve("2", viewset=FilteredRetrieveViewSet)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        (body,) = [json.loads(body) for body in self.connection.get_requests("/_search")]
+        self.assertIn({"term": {"_id": "2"}}, body["query"]["bool"]["must"])
+
+    def test_batch_retrieve_is_a_single_mget(self):
+        response = self.batch_retrieve("3,9,0")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{"n": 3}, None, {"n": 0}])
+        self.assertEqual(self.get_urls(), ["/%s/_mget" % INDEX])
+
+    def test_batch_retrieve_requires_ids(self):
+        self.assertEqual(self.batch_retrieve("").status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(ES_REST_FRAMEWORK={"ES_MAX_OFFSET": 2})
+    def test_batch_retrieve_caps_ids(self):
+        response = self.batch_retrieve("0,1,2")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get_urls(), [])
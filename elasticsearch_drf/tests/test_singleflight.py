@@ -0,0 +1,181 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipIf
+
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf import singleflight
+from elasticsearch_drf.tests.base import ESTestCase, TestDocument
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+CALLERS = 8
+
+
+class FlightViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+
+
+class RedisFlightViewSet(FlightViewSet):
+    single_flight_redis = True
+
+
+def run_together(fn, n=CALLERS) -> list:
+    """n个线程同时调用fn, 返回各自的结果"""
+    barrier = threading.Barrier(n)
+
+    def call():
+        barrier.wait()
+        return fn()
+
+    with ThreadPoolExecutor(n) as pool:
+        return [future.result() for future in [pool.submit(call) for _ in range(n)]]
+
+
+class SingleFlightTests(ESTestCase):
+    connection_kwargs = {"total": 100, "latency": 0.2}
+
+    def setUp(self):
+        super(SingleFlightTests, self).setUp()
+        self.es.info()
+
+    def search_count(self):
+        return len(self.connection.get_requests("/_search"))
+
+    def test_concurrent_identical_searches_share_one_request(self):
+        results = run_together(lambda: singleflight.execute(TestDocument.search()[:5]).to_dict())
+
+        self.assertEqual(self.search_count(), 1)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual([hit["_id"] for hit in results[0]["hits"]["hits"]], ["0", "1", "2", "3", "4"])
+
+    def test_waiters_get_their_own_copy(self):
+        results = run_together(lambda: singleflight.execute(TestDocument.search()[:2]).to_dict())
+        results[0]["hits"]["hits"].clear()
+
+        self.assertTrue(all(len(result["hits"]["hits"]) == 2 for result in results[1:]))
+
+    def test_different_searches_are_not_coalesced(self):
+        searches = iter([TestDocument.search()[:5], TestDocument.search().filter("term", tag="a")[:5]])
+        lock = threading.Lock()
+
+        def execute():
+            with lock:
+                search = next(searches)
+            return singleflight.execute(search)
+
+        run_together(execute, n=2)
+        self.assertEqual(self.search_count(), 2)
+
+    @override_settings(ES_REST_FRAMEWORK={"SINGLE_FLIGHT": False})
+    def test_disabled(self):
+        run_together(lambda: singleflight.execute(TestDocument.search()[:5]), n=3)
+        self.assertEqual(self.search_count(), 3)
+
+    def test_error_is_raised_to_every_caller(self):
+        flight = singleflight.SingleFlight()
+        joined = threading.Event()
+
+        def fail():
+            joined.wait(5)
+            raise ValueError("failed")
+
+        with ThreadPoolExecutor(2) as pool:
+            leader = pool.submit(flight.do, "key", fail)
+            while "key" not in flight._calls:
+                time.sleep(0.001)
+            waiter = pool.submit(flight.do, "key", lambda: 1)
+            while flight._calls["key"].waiters == 0:
+                time.sleep(0.001)
+            joined.set()
+            for future in (leader, waiter):
+                with self.assertRaises(ValueError):
+                    future.result()
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class RedisSingleFlightTests(ESTestCase):
+    """各线程绕过进程内合并直接通过redis锁合并, 相当于多个进程同时查询"""
+
+    connection_kwargs = {"total": 100, "latency": 0.2}
+
+    def setUp(self):
+        super(RedisSingleFlightTests, self).setUp()
+        self.es.info()
+        self.server = fakeredis.FakeServer()
+
+    def get_client(self):
+        return fakeredis.FakeRedis(server=self.server)
+
+    def test_processes_share_one_request(self):
+        key = singleflight.get_search_key(TestDocument.search()[:7])
+
+        def search():
+            return self.es.search(index=TestDocument._index._name, body={"size": 7})
+
+        results = run_together(lambda: singleflight._redis_do(self.get_client, key, search))
+
+        self.assertEqual(len(self.connection.get_requests("/_search")), 1)
+        self.assertTrue(all(result == results[0] for result in results))
+        # 锁和结果均已释放或设置了过期时间
+        self.assertFalse([k for k in self.get_client().keys("*") if self.get_client().ttl(k) == -1])
+
+    def test_waiters_run_fn_when_the_leader_fails(self):
+        key = "failing"
+        started = threading.Event()
+        calls = []
+
+        def leader():
+            started.set()
+            time.sleep(0.2)
+            raise ValueError("failed")
+
+        def waiter():
+            calls.append(1)
+            return 1
+
+        with ThreadPoolExecutor(3) as pool:
+            first = pool.submit(singleflight._redis_do, self.get_client, key, leader)
+            started.wait(5)
+            waiters = [pool.submit(singleflight._redis_do, self.get_client, key, waiter) for _ in range(2)]
+            start = time.monotonic()
+            self.assertEqual([future.result() for future in waiters], [1, 1])
+            # 由完成信号唤醒, 不等到超时
+            self.assertLess(time.monotonic() - start, 2)
+            with self.assertRaises(ValueError):
+                first.result()
+        self.assertEqual(len(calls), 2)
+
+    def test_late_waiter_does_not_block(self):
+        key = "late"
+        self.assertEqual(singleflight._redis_do(self.get_client, key, lambda: 1), 1)
+        start = time.monotonic()
+        self.assertEqual(singleflight._redis_do(self.get_client, key, lambda: 2), 2)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_redis_is_opt_in_per_view(self):
+        clients = []
+
+        def get_client():
+            clients.append(1)
+            return self.get_client()
+
+        factory = APIRequestFactory()
+        with override_settings(ES_REST_FRAMEWORK={"SINGLE_FLIGHT_REDIS": get_client}):
+            for viewset in (FlightViewSet, RedisFlightViewSet):
+                viewset.as_view({"get": "list"})(factory.get("/")).render()
+                self.assertEqual(bool(clients), viewset.single_flight_redis)
+
+    def test_redis_unavailable_executes_directly(self):
+        def get_client():
+            raise ConnectionError("redis is down")
+
+        self.assertEqual(singleflight._redis_do(get_client, "key", lambda: 42), 42)
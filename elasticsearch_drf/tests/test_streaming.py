@@ -0,0 +1,100 @@
+import asyncio
+import json
+import threading
+
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.asgi import ESASGIHandler
+from elasticsearch_drf.tests.base import ESTestCase, TestDocument
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+TOTAL = 25
+
+
+class StreamViewSet(ESModelViewSet):
+    model_class = TestDocument
+    authentication_classes = []
+    permission_classes = []
+
+
+class LimitedStreamViewSet(StreamViewSet):
+    def get_search(self):
+        return super(LimitedStreamViewSet, self).get_search()[:5]
+
+
+class StreamSizeTests(ESTestCase):
+    connection_kwargs = {"documents": [{"n": i} for i in range(TOTAL)], "total": TOTAL}
+
+    def setUp(self):
+        super(StreamSizeTests, self).setUp()
+        self.factory = APIRequestFactory()
+
+    def stream(self, params, viewset=StreamViewSet):
+        response = viewset.as_view({"get": "list"})(self.factory.get("/", {"format": "ndjson", **params}))
+        if not response.streaming:
+            return response, None
+        return response, [json.loads(line)["n"] for line in b"".join(response).splitlines()]
+
+    def test_whole_result_without_size(self):
+        response, positions = self.stream({})
+        self.assertEqual(positions, list(range(TOTAL)))
+
+    def test_size_limits_the_stream(self):
+        response, positions = self.stream({"size": 3})
+        self.assertEqual(positions, [0, 1, 2])
+
+    def test_size_does_not_extend_the_view_limit(self):
+        response, positions = self.stream({"size": 10}, LimitedStreamViewSet)
+        self.assertEqual(positions, list(range(5)))
+
+    def test_invalid_size(self):
+        response, positions = self.stream({"size": "0"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ASGIHandlerTests(SimpleTestCase):
+    def send_response(self, response, fail_after=None):
+        messages = []
+
+        async def send(message):
+            if fail_after is not None and len(messages) > fail_after:
+                raise OSError("client disconnected")
+            messages.append(message)
+
+        async def run():
+            self.loop_thread = threading.get_ident()
+            await ESASGIHandler().send_response(response, send)
+
+        asyncio.run(run())
+        return messages
+
+    def test_stream_is_generated_off_the_event_loop(self):
+        threads = []
+
+        def content():
+            for part in (b"a", b"b"):
+                threads.append(threading.get_ident())
+                yield part
+
+        messages = self.send_response(StreamingHttpResponse(content()))
+
+        self.assertEqual([m.get("body") for m in messages[1:]], [b"a", b"b", None])
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(self.loop_thread, threads)
+
+    def test_stream_is_closed_when_sending_fails(self):
+        closed = []
+
+        def content():
+            try:
+                while True:
+                    yield b"x"
+            finally:
+                closed.append(True)
+
+        with self.assertRaises(OSError):
+            self.send_response(StreamingHttpResponse(content()), fail_after=2)
+        self.assertEqual(closed, [True])
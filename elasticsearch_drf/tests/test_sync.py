@@ -0,0 +1,156 @@
+import json
+from unittest import skipIf
+from urllib.parse import unquote
+
+from django.contrib.auth.models import Group
+from django.db.models.signals import post_delete, post_save
+from django.test import TransactionTestCase, override_settings
+from elasticsearch import Elasticsearch
+from elasticsearch.connection import Connection
+from elasticsearch_dsl import Document, Keyword, connections
+
+from elasticsearch_drf import sync
+from elasticsearch_drf.benchmarks.fake import HEADERS, INFO
+from elasticsearch_drf.tests.base import USING
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+ALIAS = "test-groups"
+OLD_INDEX = ALIAS + "-v1"
+
+
+class GroupDocument(Document):
+    name = Keyword()
+
+    class Index:
+        name = ALIAS
+        using = USING
+
+
+class DocumentConnection(Connection):
+    """
+    保存文档的ES替身, 支持全量重建用到的接口, create已存在的文档时返回409
+    on_create 在首个包含create的bulk请求处理前调用一次, 模拟重建读取数据库之后、写入ES之前的变更
+    """
+
+    def __init__(self, on_create=None, **kwargs):
+        super(DocumentConnection, self).__init__(**kwargs)
+        self.on_create = on_create
+        self.indices = {}
+        self.aliases = {}
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        parts = [unquote(part) for part in url.split("?")[0].strip("/").split("/") if part]
+        status, data = self.route(method, parts, body)
+        raw_data = json.dumps(data)
+        if not (200 <= status < 300) and status not in ignore:
+            self._raise_error(status, raw_data)
+        return status, HEADERS, raw_data
+
+    def route(self, method, parts, body):
+        if not parts:
+            return 200, INFO
+        if parts[0] == "_alias":
+            alias = parts[1]
+            if alias not in self.aliases:
+                return 404, {"error": "alias [%s] missing" % alias, "status": 404}
+            return 200, {self.aliases[alias]: {"aliases": {alias: {}}}}
+        if parts == ["_aliases"]:
+            for action in json.loads(body)["actions"]:
+                if "add" in action:
+                    self.aliases[action["add"]["alias"]] = action["add"]["index"]
+            return 200, {"acknowledged": True}
+        if parts[-1] in ("_settings", "_refresh"):
+            return 200, {"acknowledged": True}
+        if parts[-1] == "_bulk":
+            return self.bulk(body)
+        if len(parts) == 1 and method == "PUT":
+            self.indices[parts[0]] = {}
+            return 200, {"acknowledged": True, "index": parts[0]}
+        if len(parts) == 1 and method == "DELETE":
+            for name in parts[0].split(","):
+                self.indices.pop(name, None)
+            return 200, {"acknowledged": True}
+        return 404, {"error": {"type": "index_not_found_exception", "reason": "/".join(parts)}, "status": 404}
+
+    def bulk(self, body):
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        if self.on_create is not None and any("create" in line for line in lines):
+            on_create, self.on_create = self.on_create, None
+            on_create()
+        lines = iter(lines)
+        items = []
+        for action in lines:
+            ((op_type, meta),) = action.items()
+            docs = self.indices[self.aliases.get(meta["_index"], meta["_index"])]
+            if op_type == "delete":
+                status = 200 if docs.pop(meta["_id"], None) else 404
+            elif op_type == "create" and meta["_id"] in docs:
+                next(lines)
+                status = 409
+            else:
+                docs[meta["_id"]] = next(lines)
+                status = 201
+            items.append({op_type: {"_index": meta["_index"], "_id": meta["_id"], "status": status}})
+        return 200, {"took": 1, "errors": any(i[op]["status"] >= 300 for i in items for op in i), "items": items}
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class RebuildTests(TransactionTestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.get_client = lambda: fakeredis.FakeRedis(server=server)
+        settings = override_settings(ES_REST_FRAMEWORK={"SYNC_REDIS": self.get_client})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        sync.register(Group)(GroupDocument)
+        label = Group._meta.label_lower
+        self.addCleanup(sync._registry.pop, label)
+        self.addCleanup(post_save.disconnect, sender=Group, dispatch_uid="es_sync_save:%s" % label)
+        self.addCleanup(post_delete.disconnect, sender=Group, dispatch_uid="es_sync_delete:%s" % label)
+
+    def use_connection(self, **kwargs):
+        es = Elasticsearch(connection_class=DocumentConnection, max_retries=0, **kwargs)
+        connections.add_connection(USING, es)
+        self.addCleanup(connections.remove_connection, USING)
+        conn = es.transport.get_connection()
+        conn.indices[OLD_INDEX] = {}
+        conn.aliases[ALIAS] = OLD_INDEX
+        return conn
+
+    def test_row_deleted_during_the_rebuild_is_not_resurrected(self):
+        def delete_during_rebuild():
+            # 重建已读取该行, 删除先同步到新索引(此时文档尚不存在), 随后重建的create写入旧数据
+            groups[1].delete()
+            self.assertEqual(sync.sync_changes()["synced"], 2)
+
+        conn = self.use_connection(on_create=delete_during_rebuild)
+        groups = [Group.objects.create(name="g%s" % i) for i in range(3)]
+        sync.sync_changes()
+        index, count = sync.rebuild("auth.group", parallel=1)
+
+        self.assertEqual(count, 2)
+        self.assertEqual((conn.aliases[ALIAS], list(conn.indices)), (index, [index]))
+        self.assertEqual(sorted(conn.indices[index]), sorted(str(group.pk) for group in (groups[0], groups[2])))
+        self.assertEqual(self.get_client().keys("{es_sync}:tombstones:*"), [])
+
+    def test_row_recreated_after_its_delete_is_kept(self):
+        def recreate_during_rebuild():
+            Group.objects.filter(pk=group.pk).delete()
+            sync.sync_changes()
+            Group.objects.create(pk=group.pk, name="g2")
+            sync.sync_changes()
+
+        conn = self.use_connection(on_create=recreate_during_rebuild)
+        group = Group.objects.create(name="g")
+        sync.sync_changes()
+        index, count = sync.rebuild("auth.group", parallel=1)
+
+        self.assertEqual(count, 1)
+        self.assertEqual(conn.indices[index], {str(group.pk): {"name": "g2"}})
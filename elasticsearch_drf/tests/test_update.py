@@ -0,0 +1,138 @@
+import json
+
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf.tests.base import INDEX, ESTestCase, RecordingConnection, TestDocument, TestForm
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+
+class VersionedConnection(RecordingConnection):
+    """RecordingConnection 中各文档的版本均为 _seq_no 0、_primary_term 1, if_seq_no/if_primary_term 不一致时返回409"""
+
+    def __init__(self, **kwargs):
+        super(VersionedConnection, self).__init__(**kwargs)
+        self.params = []
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        self.params.append((url, dict(params or {})))
+        return super(VersionedConnection, self).perform_request(method, url, params, body, timeout, ignore, headers)
+
+    def route(self, method, url, params, body):
+        if "if_seq_no" in params and (int(params["if_seq_no"]), int(params["if_primary_term"])) != (0, 1):
+            reason = "version conflict, required seqNo [%s]" % params["if_seq_no"]
+            return 409, {"error": {"type": "version_conflict_engine_exception", "reason": reason}, "status": 409}
+        return super(VersionedConnection, self).route(method, url, params, body)
+
+    def get_update(self, _id):
+        """对_id的update请求的 (请求体, 参数)"""
+        endpoint = "/_update/%s" % _id
+        bodies = [json.loads(body) for body in self.get_requests(endpoint)]
+        params = [params for url, params in self.params if url.endswith(endpoint)]
+        return list(zip(bodies, params))
+
+
+class UpdateViewSet(ESModelViewSet):
+    model_class = TestDocument
+    form_class = TestForm
+    authentication_classes = []
+    permission_classes = []
+    increment_fields = ("n",)
+
+
+class HookedUpdateViewSet(UpdateViewSet):
+    updated = None
+
+    def perform_update(self, instance, data):
+        self.updated.append((instance.meta.id, instance.meta.index, data))
+        return super(HookedUpdateViewSet, self).perform_update(instance, data)
+
+
+class PartialHookedUpdateViewSet(UpdateViewSet):
+    updated = None
+
+    def perform_partial_update(self, _id, index, body):
+        self.updated.append((_id, index, body))
+        return super(PartialHookedUpdateViewSet, self).perform_partial_update(_id, index, body)
+
+
+class UpdateTests(ESTestCase):
+    connection_class = VersionedConnection
+
+    def setUp(self):
+        super(UpdateTests, self).setUp()
+        self.factory = APIRequestFactory()
+
+    def patch(self, data, viewset=UpdateViewSet, headers=None, **initkwargs):
+        view = viewset.as_view({"patch": "partial_update"}, **initkwargs)
+        return view(self.factory.patch("/", data, format="json", **(headers or {})), _id="2")
+
+    def test_partial_update_is_a_single_update_request(self):
+        response = self.patch({"n": 3})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"n": 3})
+        self.assertEqual(response["ETag"], '"0:1"')
+        ((body, params),) = self.connection.get_update("2")
+        self.assertEqual(body, {"doc": {"n": 3}})
+        self.assertEqual(params["retry_on_conflict"], "3")
+        self.assertEqual([method for method, url, body in self.connection.requests if url != "/"], ["POST"])
+
+    def test_etag_round_trip(self):
+        retrieve = UpdateViewSet.as_view({"get": "retrieve"})(self.factory.get("/"), _id="2")
+        response = self.patch({"n": 3}, headers={"HTTP_IF_MATCH": retrieve["ETag"]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["ETag"], retrieve["ETag"])
+        ((body, params),) = self.connection.get_update("2")
+        self.assertEqual((params["if_seq_no"], params["if_primary_term"]), ("0", "1"))
+        self.assertNotIn("retry_on_conflict", params)
+
+    def test_stale_if_match_is_precondition_failed(self):
+        response = self.patch({"n": 3}, headers={"HTTP_IF_MATCH": '"5:1"'})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+    def test_invalid_if_match(self):
+        response = self.patch({"n": 3}, headers={"HTTP_IF_MATCH": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.connection.get_update("2"), [])
+
+    def test_increment_script(self):
+        view = UpdateViewSet.as_view({"post": "increment"})
+        response = view(self.factory.post("/", {"n": 2}, format="json"), _id="2")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ((body, params),) = self.connection.get_update("2")
+        self.assertEqual(
+            body["script"],
+            {"source": UpdateViewSet.increment_script, "lang": "painless", "params": {"increments": {"n": 2}}},
+        )
+
+    def test_increment_rejects_other_fields(self):
+        view = UpdateViewSet.as_view({"post": "increment"})
+        response = view(self.factory.post("/", {"name": 1, "n": "x"}, format="json"), _id="2")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {"name", "n"})
+        self.assertEqual(self.connection.get_update("2"), [])
+
+    def test_perform_update_hook(self):
+        updated = []
+        response = self.patch({"n": 3}, viewset=HookedUpdateViewSet, updated=updated)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(updated, [("2", INDEX, {"n": 3})])
+        self.assertEqual(self.connection.get_update("2")[0][0], {"doc": {"n": 3}})
+
+    def test_update_hooks_in_bulk_update(self):
+        for viewset, expected in (
+            (HookedUpdateViewSet, [("1", INDEX, {"n": 1})]),
+            (PartialHookedUpdateViewSet, [("1", INDEX, {"doc": {"n": 1}})]),
+        ):
+            updated = []
+            view = viewset.as_view({"post": "bulk_update"}, updated=updated)
+            response = view(self.factory.post("/", [{"_id": "1", "n": 1}], format="json"))
+
+            self.assertEqual([(i["_id"], i["status"]) for i in response.data["items"]], [("1", 200)])
+            self.assertEqual(updated, expected)
+        self.assertEqual(self.connection.get_bulk_actions(), [])
@@ -0,0 +1,75 @@
+from unittest import skipIf
+
+from django.test import override_settings
+from elasticsearch.exceptions import ConnectionError as ESConnectionError
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from elasticsearch_drf import writebehind
+from elasticsearch_drf.tests.base import USING, ESTestCase, TestDocument, TestForm
+from elasticsearch_drf.viewsets import ESModelViewSet
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class WriteBehindViewSet(ESModelViewSet):
+    model_class = TestDocument
+    form_class = TestForm
+    authentication_classes = []
+    permission_classes = []
+    write_behind = True
+    increment_fields = ("n",)
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class WriteBehindTests(ESTestCase):
+    def setUp(self):
+        super(WriteBehindTests, self).setUp()
+        self.server = fakeredis.FakeServer()
+        self.keys = writebehind.get_keys(USING)
+        settings = override_settings(ES_REST_FRAMEWORK={"WRITE_BEHIND_REDIS": self.get_client})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.factory = APIRequestFactory()
+
+    def get_client(self):
+        return fakeredis.FakeRedis(server=self.server)
+
+    def create(self, data):
+        view = WriteBehindViewSet.as_view({"post": "create"})
+        return view(self.factory.post("/", data, format="json"))
+
+    def test_create_is_queued_with_id(self):
+        response = self.create({"name": "a"})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(response.data["_id"])
+        self.assertEqual(self.get_client().llen(self.keys["queue"]), 1)
+        self.assertEqual(self.connection.get_requests("/_bulk"), [])
+
+    def test_increment_is_written_synchronously(self):
+        view = WriteBehindViewSet.as_view({"post": "increment"})
+        response = view(self.factory.post("/", {"n": 2}, format="json"), _id="1")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_client().llen(self.keys["queue"]), 0)
+
+    def test_replayed_batch_overwrites_the_same_documents(self):
+        ids = [self.create({"name": name}).data["_id"] for name in ("a", "b")]
+
+        # ES写入了该批次但响应丢失, 批次留在处理中列表
+        self.connection.fail_bulk = True
+        with self.assertRaises(ESConnectionError):
+            writebehind.flush(USING)
+        self.assertEqual(self.get_client().llen(self.keys["processing"]), 2)
+
+        self.connection.fail_bulk = False
+        self.assertEqual(writebehind.flush(USING), {"written": 2, "retried": 0, "dead": 0})
+
+        actions = self.connection.get_bulk_actions()
+        self.assertEqual([(op_type, meta["_id"]) for op_type, meta in actions], [("index", _id) for _id in ids * 2])
+        self.assertEqual(self.get_client().llen(self.keys["queue"]), 0)
+        self.assertEqual(self.get_client().llen(self.keys["processing"]), 0)
@@ -1,46 +1,493 @@
+import contextvars
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from itertools import islice
-from typing import List
+from typing import Callable, Iterator, List, Optional, Tuple
 
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from elasticsearch import helpers
+from elasticsearch.exceptions import NotFoundError
 from elasticsearch_dsl import Search
+from elasticsearch_dsl.connections import get_connection
 
 from elasticsearch_drf.settings import api_settings
 
+logger = logging.getLogger(__name__)
 
-def get_search_data(search: Search) -> List[dict]:
+# 不对应文档字段的排序键
+SPECIAL_SORT_FIELDS = ("_score", "_doc", "_shard_doc")
+
+
+def get_search_hash(search: Search, exclude=()) -> str:
     """
-    执行ES search，返回查询结果
+    计算ES search的归一化哈希, 索引和查询体(忽略exclude中的键)相同则哈希相同
     :param search:
+    :param exclude: 不参与哈希计算的查询体顶层键, 如 ("from", "size")
+    :return:
+    """
+    body = {k: v for k, v in search.to_dict().items() if k not in exclude}
+    raw = json.dumps([search._index, body], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def with_tiebreaker(sort: Optional[list]) -> list:
+    """
+    为排序追加唯一的tiebreaker字段, 保证search_after翻页时排序稳定
+    未指定排序时按相关度排序, 与from/size分页的默认排序一致
+    :param sort: search.to_dict()中的sort
+    :return:
+    """
+    tiebreaker = api_settings.SEARCH_AFTER_TIEBREAKER
+    sort = list(sort or ["_score"])
+    fields = [item if isinstance(item, str) else next(iter(item)) for item in sort]
+    if tiebreaker not in fields:
+        sort.append(tiebreaker)
+    return sort
+
+
+def reverse_sort(sort: list) -> list:
+    """
+    反转排序方向, 用于search_after向前翻页
+    :param sort: search.to_dict()中的sort
+    :return:
+    """
+    reverse = {"asc": "desc", "desc": "asc"}
+    reversed_sort = []
+    for item in sort:
+        if isinstance(item, str):
+            field, options = item, {}
+        else:
+            field, options = next(iter(item.items()))
+            options = {"order": options} if isinstance(options, str) else dict(options)
+        # _score默认降序, 其他字段默认升序
+        options["order"] = reverse[options.get("order", "desc" if field == "_score" else "asc")]
+        # _score、_shard_doc等特殊排序键没有缺失值, 只反转方向
+        if field not in SPECIAL_SORT_FIELDS:
+            options["missing"] = "_first" if options.get("missing", "_last") == "_last" else "_last"
+        reversed_sort.append({field: options})
+    return reversed_sort
+
+
+def open_point_in_time(search: Search, keep_alive: int) -> str:
+    """
+    为search所查询的索引打开PIT(point in time), 返回PIT id
+    :param search:
+    :param keep_alive: PIT存活时间, 单位秒
+    :return:
+    """
+    es = get_connection(search._using)
+    return es.open_point_in_time(index=search._index, keep_alive="%ds" % keep_alive)["id"]
+
+
+def close_point_in_time(search: Search, pit_id: str):
+    """关闭PIT, 已过期的PIT忽略"""
+    try:
+        get_connection(search._using).close_point_in_time(body={"id": pit_id})
+    except NotFoundError:
+        pass
+
+
+def without_aggs(search: Search) -> Search:
+    """返回去掉聚合的search副本, 分批拉取命中结果时避免每批都重复计算聚合"""
+    s = search._clone()
+    s.aggs._params = {"aggs": {}}
+    return s
+
+
+def get_partial_status(*searches: Search) -> Optional[dict]:
+    """
+    已执行的searches中有不完整的结果(ES端超时、达到terminate_after提前结束、部分分片失败)时返回
+    {"timed_out": bool, "terminated_early": bool, "failed_shards": int}, 否则返回None
+    """
+    status = {"timed_out": False, "terminated_early": False, "failed_shards": 0}
+    for search in searches:
+        response = getattr(search, "_response", None)
+        if response is None:
+            continue
+        d = response.to_dict()
+        status["timed_out"] = status["timed_out"] or bool(d.get("timed_out"))
+        status["terminated_early"] = status["terminated_early"] or bool(d.get("terminated_early"))
+        status["failed_shards"] = max(status["failed_shards"], d.get("_shards", {}).get("failed", 0))
+    return status if any(status.values()) else None
+
+
+def get_search_count(search: Search) -> Tuple[int, str]:
+    """
+    获取ES search命中总数及其关系("eq"为精确值, "gte"为track_total_hits上限时的下界)
+    search已执行过时直接读取响应中的hits.total, 不再额外发起count请求
+    :param search:
+    :return:
+    """
+    response = getattr(search, "_response", None)
+    if response is not None:
+        total = response.to_dict()["hits"].get("total")
+        if isinstance(total, dict):
+            return total["value"], total["relation"]
+        if isinstance(total, int):
+            return total, "eq"
+    return search.count(), "eq"
+
+
+def get_search_total(search: Search) -> int:
+    """
+    获取ES search命中总数
+    :param search:
+    :return:
+    """
+    return get_search_count(search)[0]
+
+
+def _get_checkpoint_cache():
+    return caches[api_settings.SEARCH_AFTER_CACHE]
+
+
+def _new_checkpoints(pit_id: str) -> dict:
+    return {"pit_id": pit_id, "checkpoints": {}, "expires": time.time() + api_settings.SEARCH_AFTER_KEEP_ALIVE}
+
+
+def _open_checkpoints(search: Search) -> dict:
+    """为search打开一个PIT, 返回空的翻页检查点"""
+    return _new_checkpoints(open_point_in_time(search, api_settings.SEARCH_AFTER_KEEP_ALIVE))
+
+
+def _save_checkpoints(key: str, state: dict):
+    checkpoints = state["checkpoints"]
+    while len(checkpoints) > api_settings.SEARCH_AFTER_MAX_CHECKPOINTS:
+        checkpoints.pop(next(iter(checkpoints)))
+    # 检查点只在PIT存活期间有效, 缓存过期时间不随使用延长, 避免长期读取旧快照
+    timeout = state["expires"] - time.time()
+    if timeout > 0:
+        _get_checkpoint_cache().set(key, state, timeout)
+
+
+def _get_search_after_search(
+    search: Search, state: dict, search_after, size: int, source=True, keep_alive: int = None
+) -> Search:
+    keep_alive = api_settings.SEARCH_AFTER_KEEP_ALIVE if keep_alive is None else keep_alive
+    s = without_aggs(search).index().sort(*with_tiebreaker(search.to_dict().get("sort")))[:size]
+    s = s.extra(
+        pit={"id": state["pit_id"], "keep_alive": "%ds" % keep_alive},
+        track_total_hits=False,
+    )
+    if search_after is not None:
+        s = s.extra(search_after=search_after)
+    if not source:
+        s = s.source(False)
+    return s
+
+
+def _get_search_after_key(search: Search) -> str:
+    return "es_search_after:%s" % get_search_hash(search, exclude=("from", "size", "track_total_hits", "_source"))
+
+
+def _execute_search_after(search: Search, state: dict, search_after, size: int, source=True):
+    response = _get_search_after_search(search, state, search_after, size, source).execute()
+    state["pit_id"] = response.to_dict().get("pit_id", state["pit_id"])
+    return response
+
+
+def _seek(search: Search, key: str, from_: int):
+    """
+    定位到from_位置: 从不超过from_的最近检查点出发, 只取排序值不取_source, 逐批跳到from_
+    :return: (检查点状态, 实际到达的位置, 该位置的search_after)
+    """
+    state = _get_checkpoint_cache().get(key) or _open_checkpoints(search)
+    checkpoints = state["checkpoints"]
+    offset = max((o for o in checkpoints if o <= from_), default=0)
+    search_after = checkpoints.get(offset)
+    while offset < from_:
+        size = min(from_ - offset, api_settings.ES_MAX_OFFSET)
+        hits = _execute_search_after(search, state, search_after, size, source=False).to_dict()["hits"]["hits"]
+        if not hits:
+            break
+        offset += len(hits)
+        search_after = checkpoints[offset] = hits[-1]["sort"]
+    return state, offset, search_after
+
+
+def iter_search_after(search: Search, from_: int = 0, size: int = None, raw: bool = False) -> Iterator:
+    """
+    基于search_after + PIT(point in time)的深分页, 从from_位置开始逐批返回search命中结果
+
+    每批结果末尾的排序值作为检查点, 按查询缓存在Django cache中, 与PIT同生命周期;
+    后续相同查询的翻页从最近的检查点出发, 深分页的代价与浅分页接近, 不再随offset线性增长
+    参考：https://www.elastic.co/guide/en/elasticsearch/reference/current/paginate-search-results.html
+    :param search:
+    :param from_: 起始位置
+    :param size: 返回条数, None表示返回from_之后的全部结果
+    :param raw: 为True时返回ES原始hit字典, 不包装为文档对象
+    :return:
+    """
+    key = _get_search_after_key(search)
+    try:
+        state, offset, search_after = _seek(search, key, from_)
+    except NotFoundError:
+        # PIT已过期, 丢弃检查点后重新打开
+        _get_checkpoint_cache().delete(key)
+        state, offset, search_after = _seek(search, key, from_)
+
+    if offset < from_:
+        # from_已超出命中总数
+        _save_checkpoints(key, state)
+        return
+
+    try:
+        remaining = size
+        while remaining != 0:
+            batch = api_settings.ES_MAX_OFFSET if remaining is None else min(remaining, api_settings.ES_MAX_OFFSET)
+            response = _execute_search_after(search, state, search_after, batch)
+            hits = response.to_dict()["hits"]["hits"]
+            if not hits:
+                break
+            offset += len(hits)
+            search_after = state["checkpoints"][offset] = hits[-1]["sort"]
+            yield from hits if raw else response
+            if remaining is not None:
+                remaining -= len(hits)
+            if len(hits) < batch:
+                break
+    finally:
+        _save_checkpoints(key, state)
+
+
+def _put(buffer: queue.Queue, stopped: threading.Event, item):
+    # 缓冲区满时阻塞, 消费方提前结束后放弃写入
+    while not stopped.is_set():
+        try:
+            buffer.put(item, timeout=1)
+            return
+        except queue.Full:
+            continue
+
+
+def _export_slice(search: Search, state: dict, slice_id: int, buffer: queue.Queue, stopped: threading.Event):
+    """逐批拉取一个切片的命中结果放入缓冲区, 每项为 (切片id, hits或异常, 末条排序值, pit_id, 是否结束)"""
+    slices = len(state["slices"])
+    size = api_settings.EXPORT_BATCH_SIZE
+    search_after = state["slices"][slice_id]
+    try:
+        while not stopped.is_set():
+            s = _get_search_after_search(search, state, search_after, size, keep_alive=api_settings.EXPORT_KEEP_ALIVE)
+            if slices > 1:
+                s = s.extra(slice={"id": slice_id, "max": slices})
+            response = s.execute().to_dict()
+            hits = response["hits"]["hits"]
+            search_after = hits[-1]["sort"] if hits else search_after
+            done = len(hits) < size
+            _put(buffer, stopped, (slice_id, hits, search_after, response.get("pit_id", state["pit_id"]), done))
+            if done:
+                return
+    except Exception as e:
+        _put(buffer, stopped, (slice_id, e, search_after, state["pit_id"], True))
+
+
+def _release_point_in_time(search: Search, pit_id: str, completed: bool):
+    """导出结束后关闭PIT; 中途结束时关闭失败只记录日志, 不掩盖原来的异常"""
+    if completed:
+        return close_point_in_time(search, pit_id)
+    try:
+        close_point_in_time(search, pit_id)
+    except Exception:
+        logger.warning("Failed to close the point in time of an interrupted export", exc_info=True)
+
+
+def iter_sliced_hits(
+    search: Search,
+    slices: int = None,
+    raw: bool = False,
+    checkpoint_key: str = None,
+    on_checkpoint: Callable = None,
+) -> Iterator:
+    """
+    基于PIT切片的并行导出, 逐条返回search的全部命中结果, 不保证顺序
+
+    查询按 _shard_doc 切分为slices个切片, 各切片在线程池中以search_after逐批拉取,
+    合并到最多 EXPORT_BUFFER_SIZE 批的有界缓冲区中, 消费慢时拉取线程阻塞等待, 内存占用与结果总数无关;
+    指定checkpoint_key时每批结果被消费后记录各切片的排序值, 中断后在PIT存活期间
+    (EXPORT_KEEP_ALIVE秒内)以相同的查询和checkpoint_key重新调用, 从各切片的检查点继续导出,
+    中断时未消费完的那一批会重新返回
+    迭代中途结束(客户端断开、提前关闭、拉取出错)时通知拉取线程停止并等待其退出; 没有checkpoint_key时
+    无法续传, PIT随之关闭, 否则保留到续传完成或过期
+    :param search:
+    :param slices: 切片数, 默认 EXPORT_SLICES
+    :param raw: 为True时返回ES原始hit字典, 不包装为文档对象
+    :param checkpoint_key: 续传检查点的缓存键, 如导出任务id
+    :param on_checkpoint: 每次记录检查点前调用, 如写文件时用于flush, 保证检查点之前的结果已落盘
+    :return:
+    """
+    search = without_aggs(search)
+    # 未指定排序时只按 _shard_doc 排序, 不计算相关度
+    if not search.to_dict().get("sort"):
+        search = search.sort(api_settings.SEARCH_AFTER_TIEBREAKER)
+    key = None if checkpoint_key is None else "es_export:%s" % checkpoint_key
+    state = None if key is None else _get_checkpoint_cache().get(key)
+    if state is None:
+        slices = slices or api_settings.EXPORT_SLICES
+        pit_id = open_point_in_time(search, api_settings.EXPORT_KEEP_ALIVE)
+        state = {"pit_id": pit_id, "slices": {i: None for i in range(slices)}, "done": []}
+
+    pending = [i for i in state["slices"] if i not in state["done"]]
+    buffer = queue.Queue(maxsize=api_settings.EXPORT_BUFFER_SIZE)
+    stopped = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max(len(pending), 1), thread_name_prefix="es-export")
+    for slice_id in pending:
+        # 拉取线程继承当前上下文, ES请求统计等上下文变量同样生效
+        executor.submit(contextvars.copy_context().run, _export_slice, search, state, slice_id, buffer, stopped)
+
+    completed = False
+    try:
+        running = len(pending)
+        while running:
+            slice_id, hits, search_after, pit_id, done = buffer.get()
+            if isinstance(hits, Exception):
+                raise hits
+            for hit in hits:
+                yield hit if raw else search._get_result(hit)
+            state["pit_id"] = pit_id
+            state["slices"][slice_id] = search_after
+            if done:
+                state["done"].append(slice_id)
+                running -= 1
+            if key is not None:
+                if on_checkpoint is not None:
+                    on_checkpoint()
+                _get_checkpoint_cache().set(key, state, api_settings.EXPORT_KEEP_ALIVE)
+        completed = True
+    finally:
+        stopped.set()
+        executor.shutdown(wait=True)
+        if completed or key is None:
+            _release_point_in_time(search, state["pit_id"], completed)
+    if completed and key is not None:
+        _get_checkpoint_cache().delete(key)
+
+
+def export_search_data(
+    search: Search, fp, slices: int = None, raw: bool = True, meta_fields=(), checkpoint_key: str = None
+) -> int:
+    """
+    以NDJSON格式将search的全部命中结果并行导出到文件对象fp, 返回本次写入条数
+    中断后以追加模式重新打开文件, 使用相同的checkpoint_key调用即可从检查点续传, 每个切片最多重复写入一批
+    :param search:
+    :param fp: 文本模式打开的文件对象
+    :param slices: 切片数, 默认 EXPORT_SLICES
+    :param raw: 为True时直接导出hit的_source字典, 跳过文档对象的包装和to_dict()
+    :param meta_fields: raw模式下合并到结果中的hit元数据字段, 如 ("_id",)
+    :param checkpoint_key: 续传检查点的缓存键
+    :return:
+    """
+    n = 0
+    for hit in iter_sliced_hits(search, slices, raw, checkpoint_key, on_checkpoint=fp.flush):
+        data = _get_hit_data(hit, meta_fields) if raw else hit.to_dict()
+        fp.write(json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False))
+        fp.write("\n")
+        n += 1
+    fp.flush()
+    return n
+
+
+def _scan(search: Search, raw: bool, **scan_params) -> Iterator:
+    # 不要求顺序的全量导出可切片并行拉取
+    if api_settings.EXPORT_SLICES > 1 and not scan_params.get("preserve_order"):
+        return iter_sliced_hits(search, raw=raw)
+    # scan用法参考：https://elasticsearch-py.readthedocs.io/en/master/helpers.html#scan
+    search = without_aggs(search)
+    if not raw:
+        return search.params(**scan_params).scan()
+    es = get_connection(search._using)
+    return helpers.scan(es, query=search.to_dict(), index=search._index, **{**search._params, **scan_params})
+
+
+def _get_scan_params(d: dict) -> dict:
+    return {"preserve_order": bool(d.get("sort")), "scroll": "1m", "size": 500}
+
+
+def _get_hit_data(hit: dict, meta_fields=()) -> dict:
+    data = hit.get("_source", {})
+    for field in meta_fields:
+        data[field] = hit.get(field)
+    return data
+
+
+def _execute(search: Search, raw: bool):
+    # Response对命中结果的包装是惰性的, 只读取原始字典时不会创建文档对象
+    response = search.execute()
+    return response.to_dict()["hits"]["hits"] if raw else response
+
+
+def iter_hits(search: Search, raw: bool = False) -> Iterator:
+    """
+    执行ES search，逐条返回命中结果
+    未分页的大结果集基于scan/search_after分批拉取, 内存占用与结果总数无关
+    :param search:
+    :param raw: 为True时返回ES原始hit字典, 不包装为文档对象
     :return:
     """
     d = search.to_dict()
     from_, size = d.get("from"), d.get("size")
-    # scan用法参考：https://elasticsearch-py.readthedocs.io/en/master/helpers.html#scan
-    scan_params = {"preserve_order": bool(d.get("sort")), "scroll": "1m", "size": 500}
-    total = search.count()
+    scan_params = _get_scan_params(d)
     # 未指定任何分页参数
     if from_ is None and size is None:
-        if total > api_settings.ES_MAX_OFFSET:
-            resp = search.params(**scan_params).scan()
+        total = search.count()
+        if total <= api_settings.ES_MAX_OFFSET:
+            resp = _execute(search[:total], raw)
+        # 有排序时scan需preserve_order, 代价很高, 改用search_after
+        elif d.get("sort"):
+            resp = iter_search_after(search, raw=raw)
         else:
-            resp = search[:total].execute()
+            resp = _scan(search, raw, **scan_params)
     # 只指定分页size
     elif from_ is None:
         if size > api_settings.ES_MAX_OFFSET:
-            resp = islice(search.params(**scan_params).scan(), size)
+            resp = islice(_scan(search, raw, **scan_params), size)
         else:
-            resp = search.execute()
+            resp = _execute(search, raw)
     # 只指定分页from
     elif size is None:
+        total = search.count()
         if total > api_settings.ES_MAX_OFFSET:
-            resp = islice(search.extra(from_=None).params(**scan_params).scan(), from_, total)
+            resp = iter_search_after(search, from_, raw=raw)
         else:
-            resp = search[from_:total].execute()
-    # 指定分页from和size
+            resp = _execute(search[from_:total], raw)
+    # 指定分页from和size, 分页在max_result_window以内时只需一次search请求
     else:
         if from_ + size > api_settings.ES_MAX_OFFSET:
-            resp = islice(search.extra(from_=None).params(**scan_params).scan(), from_, from_ + size)
+            resp = iter_search_after(search, from_, size, raw=raw)
         else:
-            resp = search.execute()
+            resp = _execute(search, raw)
 
-    data = [i.to_dict() for i in resp]
-    return data
+    return iter(resp)
+
+
+def iter_search_data(search: Search, raw: bool = False, meta_fields=()) -> Iterator[dict]:
+    """
+    执行ES search，逐条返回查询结果
+    :param search:
+    :param raw: 为True时直接返回hit的_source字典, 跳过文档对象的包装和to_dict()
+    :param meta_fields: raw模式下合并到结果中的hit元数据字段, 如 ("_id", "_score")
+    :return:
+    """
+    if not raw:
+        for hit in iter_hits(search):
+            yield hit.to_dict()
+        return
+
+    for hit in iter_hits(search, raw=True):
+        yield _get_hit_data(hit, meta_fields)
+
+
+def get_search_data(search: Search, raw: bool = False, meta_fields=()) -> List[dict]:
+    """
+    执行ES search，返回查询结果
+    :param search:
+    :param raw: 为True时直接返回hit的_source字典, 跳过文档对象的包装和to_dict()
+    :param meta_fields: raw模式下合并到结果中的hit元数据字段, 如 ("_id", "_score")
+    :return:
+    """
+    return list(iter_search_data(search, raw, meta_fields))
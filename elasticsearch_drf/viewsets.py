@@ -7,7 +7,7 @@ from elasticsearch_drf.generics import ESGenericAPIView
 class ESGenericViewSet(ViewSetMixin, ESGenericAPIView):
     """
     自定义基于ES模型的通用API视图, 不实现任何请求处理视图函数,
-    但提供 get_object、get_search、filter_search、paginate_search 等方法
+    但提供 get_object、get_objects、get_search、filter_search、paginate_search 等方法
     """
 
     pass
@@ -19,11 +19,15 @@ class ESModelViewSet(
     mixins.ESUpdateModelMixin,
     mixins.ESDestroyModelMixin,
     mixins.ESListModelMixin,
+    mixins.ESAutocompleteModelMixin,
+    mixins.ESBulkModelMixin,
     ESGenericViewSet,
 ):
     """
     自定义ES模型视图集,
-    默认实现 create、retrieve、update、partial_update、destroy、list 请求处理视图函数
+    默认实现 create、retrieve、update、partial_update、destroy、list 请求处理视图函数,
+    以及 batch_retrieve 批量查询、msearch 多查询、autocomplete 自动补全、increment 原子增减
+    和 bulk_create、bulk_update、bulk_destroy 批量写入视图函数
     """
 
     pass
@@ -0,0 +1,166 @@
+"""
+写后(write-behind)索引队列
+
+视图设置 write_behind = True 后, 新增和更新不再各自请求ES, 而是写入redis缓冲队列并返回202,
+由Celery任务按批次通过bulk写入ES, 写入吞吐随批次大小而不是请求数增长, 例如：
+
+ES_REST_FRAMEWORK = {
+    "WRITE_BEHIND_REDIS": "common.utils.redis.get_redis_client",
+    "WRITE_BEHIND_FLUSH_TASK": "heartgo.celery.flush_es_write_behind",
+}
+
+队列长度达到 WRITE_BEHIND_BATCH_SIZE 时立即触发刷写任务, 另由celery beat定时刷写, 保证写入延迟有上限。
+每批先原子地移入处理中列表, 写入完成后才删除, 刷写中断时下次刷写重新写入该批, 即至少写入一次(at-least-once);
+因此只有幂等的写入可以入队: 新增在入队时生成_id, 重放只会覆盖同一文档; 脚本更新(如increment)总是同步写入。
+429和5xx的失败项重新入队并结束本次刷写, 由下次刷写重试; 索引重建期间禁止写入的失败项同样重新入队, 不计入重试次数; 超过 WRITE_BEHIND_MAX_ATTEMPTS 次或其他错误(如更新的文档不存在)移入死信列表。
+重新入队的写入排在队尾, 同一文档的多次写入不保证顺序
+"""
+import json
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from elasticsearch import helpers
+from elasticsearch_dsl.connections import get_connection
+
+from elasticsearch_drf.cache import bump_index_generation
+from elasticsearch_drf.indices import is_write_blocked
+from elasticsearch_drf.settings import api_settings
+
+# 从队列头部取出至多ARGV[1]项移入处理中列表, 两个键使用相同的hash tag, redis集群下位于同一slot
+MOVE_BATCH_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+
+def get_keys(using: str) -> dict:
+    """using连接的 缓冲队列、处理中列表、死信列表、刷写锁、刷写已触发标记 的键"""
+    prefix = "{es_write_behind:%s}" % using
+    return {
+        "queue": prefix,
+        "processing": "%s:processing" % prefix,
+        "dead": "%s:dead" % prefix,
+        "lock": "%s:lock" % prefix,
+        "scheduled": "%s:scheduled" % prefix,
+    }
+
+
+def _get_client():
+    get_client = api_settings.WRITE_BEHIND_REDIS
+    assert get_client is not None, "Set the `WRITE_BEHIND_REDIS` setting to use write-behind indexing."
+    return get_client()
+
+
+def enqueue(using: str, action: dict):
+    """
+    将一个bulk action写入using连接的缓冲队列
+    :param using: ES连接别名
+    :param action: bulk action, 如 {"_op_type": "index", "_index": ..., "_source": {...}}
+    """
+    client = _get_client()
+    keys = get_keys(using)
+    length = client.rpush(keys["queue"], json.dumps({"action": action, "attempts": 0}, cls=DjangoJSONEncoder))
+    flush_task = api_settings.WRITE_BEHIND_FLUSH_TASK
+    if flush_task is None or length < api_settings.WRITE_BEHIND_BATCH_SIZE:
+        return
+    # 触发标记在刷写间隔内有效, 避免高并发写入时重复触发
+    if client.set(keys["scheduled"], 1, nx=True, ex=api_settings.WRITE_BEHIND_FLUSH_INTERVAL):
+        flush_task.delay(using)
+
+
+def _write_batch(client, using: str, keys: dict, batch: list) -> dict:
+    entries = [json.loads(item) for item in batch]
+    actions = [entry["action"] for entry in entries]
+    results = helpers.streaming_bulk(
+        get_connection(using), actions, chunk_size=api_settings.BULK_CHUNK_SIZE, raise_on_error=False
+    )
+
+    stats = {"written": 0, "retried": 0, "dead": 0}
+    indices = set()
+    retries, dead = [], []
+    for entry, (ok, item) in zip(entries, results):
+        op_type, result = item.popitem()
+        if ok:
+            stats["written"] += 1
+            indices.add(entry["action"]["_index"])
+            continue
+        if is_write_blocked(result.get("error")):
+            retries.append(json.dumps(entry))
+            continue
+        entry["attempts"] += 1
+        status = result.get("status", 500)
+        if (status == 429 or status >= 500) and entry["attempts"] < api_settings.WRITE_BEHIND_MAX_ATTEMPTS:
+            retries.append(json.dumps(entry))
+        else:
+            dead.append(json.dumps({**entry, "error": result.get("error"), "failed_at": time.time()}))
+
+    if retries:
+        client.rpush(keys["queue"], *retries)
+    if dead:
+        client.rpush(keys["dead"], *dead)
+    stats["retried"], stats["dead"] = len(retries), len(dead)
+    for index in indices:
+        bump_index_generation(index)
+    return stats
+
+
+def flush(using: str = "default") -> dict:
+    """
+    将using连接的缓冲队列按批写入ES直到队列为空, 同一连接同时只有一个刷写者
+    :return: {"written": 写入数, "retried": 重新入队数, "dead": 移入死信数}, 其他刷写者正在执行时返回None
+    """
+    client = _get_client()
+    keys = get_keys(using)
+    lock = client.lock(keys["lock"], timeout=api_settings.WRITE_BEHIND_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        return None
+
+    stats = {"written": 0, "retried": 0, "dead": 0}
+    move_batch = client.register_script(MOVE_BATCH_SCRIPT)
+    try:
+        # 上次刷写中断时遗留的批次先重新写入
+        batch = client.lrange(keys["processing"], 0, -1)
+        while True:
+            if not batch:
+                batch = move_batch(
+                    keys=[keys["queue"], keys["processing"]], args=[api_settings.WRITE_BEHIND_BATCH_SIZE]
+                )
+            if not batch:
+                break
+            batch_stats = _write_batch(client, using, keys, batch)
+            for name, n in batch_stats.items():
+                stats[name] += n
+            client.delete(keys["processing"])
+            if batch_stats["retried"]:
+                # ES拒绝了部分写入, 重新入队的写入留给下次刷写, 不在本次立即重试
+                break
+            lock.reacquire()
+            batch = None
+    finally:
+        client.delete(keys["scheduled"])
+        if lock.owned():
+            lock.release()
+    return stats
+
+
+def get_dead_letters(using: str = "default", start: int = 0, end: int = -1) -> list:
+    """死信列表中的条目: {"action": bulk action, "attempts": 尝试次数, "error": ES错误, "failed_at": 时间戳}"""
+    return [json.loads(item) for item in _get_client().lrange(get_keys(using)["dead"], start, end)]
+
+
+def requeue_dead_letters(using: str = "default") -> int:
+    """问题修复后将死信重新放回缓冲队列, 返回条数"""
+    client = _get_client()
+    keys = get_keys(using)
+    n = 0
+    while True:
+        item = client.lpop(keys["dead"])
+        if item is None:
+            return n
+        entry = json.loads(item)
+        client.rpush(keys["queue"], json.dumps({"action": entry["action"], "attempts": 0}))
+        n += 1
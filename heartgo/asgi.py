@@ -12,14 +12,15 @@ import os
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
-from django.core.asgi import get_asgi_application
 
+from elasticsearch_drf.asgi import get_asgi_application
 from heartgo import routing
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "heartgo.settings")
 
 # Initialize Django ASGI application early to ensure the AppRegistry
 # is populated before importing code that may import ORM models.
+# The elasticsearch_drf handler streams responses without blocking the event loop.
 django_asgi_app = get_asgi_application()
 
 application = ProtocolTypeRouter(
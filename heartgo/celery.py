@@ -20,3 +20,19 @@ app.autodiscover_tasks()
 @app.task(bind=True)
 def debug_task(self):
     print(f"Request: {self.request!r}")
+
+
+@app.task(ignore_result=True)
+def flush_es_write_behind(using="default"):
+    """将ES写后索引队列批量写入ES, 由队列写满时触发, 并由beat定时执行"""
+    from elasticsearch_drf import writebehind
+
+    return writebehind.flush(using)
+
+
+@app.task(ignore_result=True)
+def sync_es_changes():
+    """将已注册模型的变更同步到ES, 由变更积累到一批时触发, 并由beat定时执行"""
+    from elasticsearch_drf import sync
+
+    return sync.sync_changes()
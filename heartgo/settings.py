@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     "rest_framework",
     "django_celery_results",
     "django_celery_beat",
+    "elasticsearch_drf",
     "usermanage",
     # "channels",  # add if you want to use the channels worker
     "chat",
@@ -53,6 +55,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "common.middleware.common.CommonMiddleware",  # 中间件置前保证request相关变量第一时间写入线程
+    "common.middleware.es_instrumentation.ESInstrumentationMiddleware",
     "common.middleware.unified_exception_handle.ExceptionHandleMiddleware",
     "common.middleware.unified_response.UnifiedResponseMiddleware",
 ]
@@ -167,6 +170,21 @@ REST_FRAMEWORK = {
     "EXCEPTION_HANDLER": "common.handlers.exception.exception_handler",
 }
 
+ES_REST_FRAMEWORK = {
+    # ES连接, 多个节点以逗号分隔
+    "ES_CONNECTIONS": {"default": {"hosts": os.getenv("ES_HOSTS", "localhost:9200").split(",")}},
+    # 开启了 single_flight_redis 的视图, 相同查询跨进程合并执行
+    "SINGLE_FLIGHT_REDIS": "common.utils.redis.get_redis_client",
+    # 写后索引队列
+    "WRITE_BEHIND_REDIS": "common.utils.redis.get_redis_client",
+    "WRITE_BEHIND_FLUSH_TASK": "heartgo.celery.flush_es_write_behind",
+    # 模型变更同步
+    "SYNC_REDIS": "common.utils.redis.get_redis_client",
+    "SYNC_TASK": "heartgo.celery.sync_es_changes",
+    # 重建索引期间记录删除, 复制期间源索引照常写入
+    "REINDEX_REDIS": "common.utils.redis.get_redis_client",
+}
+
 # Celery Configuration Options
 CELERY_TIMEZONE = "Asia/Shanghai"
 CELERY_TASK_TRACK_STARTED = True
@@ -176,6 +194,12 @@ CELERY_RESULT_BACKEND = "django-db"
 CELERY_CACHE_BACKEND = "django-cache"
 CELERY_RESULT_EXTENDED = True
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+CELERY_BEAT_SCHEDULE = {
+    # 写后索引队列的写入延迟上限
+    "flush-es-write-behind": {"task": "heartgo.celery.flush_es_write_behind", "schedule": 1.0},
+    # 模型变更同步到ES的延迟上限
+    "sync-es-changes": {"task": "heartgo.celery.sync_es_changes", "schedule": 1.0},
+}
 # CELERY_BROKER_CONNECTION_MAX_RETRIES = None
 
 try:
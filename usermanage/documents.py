@@ -0,0 +1,17 @@
+from elasticsearch_dsl import Boolean, Date, Document, Keyword, Text
+
+from elasticsearch_drf import sync
+from usermanage.models import User
+
+
+@sync.register(User)
+class UserDocument(Document):
+    username = Keyword()
+    nickname = Text(fields={"raw": Keyword()})
+    email = Keyword()
+    phone = Keyword()
+    is_active = Boolean()
+    date_joined = Date()
+
+    class Index:
+        name = "usermanage-user"